@@ -0,0 +1,371 @@
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from scripts.build_state import chunked, combine_hashes, get_file_hash, is_fresh, run_chunks
+from scripts.json_player_data import (
+    get_data_at_date,
+    get_data_file_path,
+    get_file_stem,
+    get_json,
+    get_project_path,
+    refresh_manifest,
+    write_json,
+)
+from scripts.logging_config import setup_logging, logger
+from scripts.player_history import get_player_history_path, get_players_dir
+from scripts.static_pages import (
+    ACTIVITY_TEMPLATE,
+    PLAYER_TEMPLATE,
+    PAGES_DIR,
+    PP_RECORDS_TEMPLATE,
+    RANKING_TEMPLATE,
+    PageLinks,
+    get_page_path,
+    get_player_page_path,
+    write_activity_page,
+    write_player_page,
+    write_pp_records_page,
+    write_ranking_page,
+)
+
+STATE_FILE = '.cache/site-state.json'
+
+# INFO: bump when the rendering changes, so every page gets rendered again
+SITE_VERSION = 2
+
+PAGE_TYPES = ['rankings', 'activity', 'pp-records', 'players']
+
+# page type -> the data file type it shows
+DATED_PAGE_TYPES = {'rankings': None, 'activity': 'diff', 'pp-records': 'pp-records'}
+
+# the dated pages of every day are ~280MB, only the latest ones are kept
+SITE_DAYS = 30
+
+
+def load_state(test: bool) -> dict:
+    try:
+        with open(get_project_path(STATE_FILE, test)) as file:
+            return json.load(file)
+    except OSError:
+        return {'files': {}, 'outputs': {}}
+
+
+def save_state(state: dict, test: bool) -> None:
+    write_json(file_path=STATE_FILE, data=state, test=test)
+
+
+# -- workers, these run on the pool so they only take picklable arguments
+
+
+def _render_chunk(
+        country: str,
+        mode: str,
+        pages: list[tuple[str, str, list[str], PageLinks]],
+        test: bool,
+) -> list[str]:
+    """Renders `(page type, date or uid, page paths, links)` pages, the same
+    page is written to every one of its paths.
+    """
+    written = []
+
+    for page_type, key, page_paths, links in pages:
+        for page_path in page_paths:
+            if page_type == 'rankings':
+                rankings = get_data_at_date(date=key, country=country, mode=mode, test=test)
+                diff = get_data_at_date(date=key, country=country, mode=mode, file_type='diff', test=test)
+                write_ranking_page(page_path, key, rankings, diff, links, test)
+            elif page_type == 'activity':
+                diff = get_data_at_date(date=key, country=country, mode=mode, file_type='diff', test=test)
+                write_activity_page(page_path, key, diff, links, test)
+            elif page_type == 'pp-records':
+                records = get_data_at_date(date=key, country=country, mode=mode, file_type='pp-records', test=test)
+                write_pp_records_page(page_path, key, records, links, test)
+            elif page_type == 'players':
+                history = get_json(file_path=get_player_history_path(key, country, mode), test=test)
+                write_player_page(page_path, history, links, test)
+
+        written.extend(page_paths)
+
+    return written
+
+
+# -- pages
+
+
+def _page_file_type(page_type: str) -> str | None:
+    return None if page_type == 'rankings' else page_type
+
+
+def get_kept_dates(manifest: dict, country: str, mode: str, days: int) -> dict[str, list[str]]:
+    """The dates that get a page, the last `days` of every dated page type
+    (all of them if it is 0).
+    """
+    kept = {}
+
+    for page_type, file_type in DATED_PAGE_TYPES.items():
+        dates = manifest.get(get_file_stem(country, mode, file_type), [])
+        kept[page_type] = dates[-days:] if days else dates
+
+    return kept
+
+
+def _latest_links(country: str, mode: str) -> PageLinks:
+    return PageLinks(*(
+        get_page_path(None, country, mode, _page_file_type(page_type)) for page_type in DATED_PAGE_TYPES
+    ))
+
+
+def _page_links(page_type: str, index: int, kept: dict[str, list[str]], kept_sets: dict[str, set[str]],
+                country: str, mode: str) -> PageLinks:
+    # the pages of the same day, the days around it and the latest day
+    dates = kept[page_type]
+    date = dates[index]
+    page_file_type = _page_file_type(page_type)
+
+    siblings = [
+        get_page_path(date if date in kept_sets[other_type] else None, country, mode, _page_file_type(other_type))
+        for other_type in DATED_PAGE_TYPES
+    ]
+
+    previous = None
+    if index > 0:
+        previous = (dates[index - 1], get_page_path(dates[index - 1], country, mode, page_file_type))
+
+    next_day = None
+    latest = None
+    if index < len(dates) - 1:
+        next_day = (dates[index + 1], get_page_path(dates[index + 1], country, mode, page_file_type))
+        latest = get_page_path(None, country, mode, page_file_type)
+
+    return PageLinks(*siblings, previous=previous, next=next_day, latest=latest)
+
+
+def _dated_pages(
+        page_type: str,
+        template_path: str,
+        kept: dict[str, list[str]],
+        country: str,
+        mode: str,
+        state: dict,
+        test: bool,
+        extra_file_type: str = None,
+) -> list[tuple[str, str, list[str], str, PageLinks]]:
+    """Lists the page of every kept date, with the page of the latest date also
+    written as the latest page.
+
+    Returns:
+        list[tuple]: `(page type, date, page paths, source hash, links)`
+    """
+    template_hash = get_file_hash(template_path, state, test)
+    file_type = DATED_PAGE_TYPES[page_type]
+    page_file_type = _page_file_type(page_type)
+    kept_sets = {other_type: set(dates) for other_type, dates in kept.items()}
+    dates = kept[page_type]
+    pages = []
+
+    for index, date in enumerate(dates):
+        input_hashes = [get_file_hash(get_data_file_path(date=date, country=country, mode=mode, file_type=file_type), state, test)]
+
+        # the rankings page shows the changes from the diff too, if there is one
+        if extra_file_type is not None:
+            extra_path = get_data_file_path(date=date, country=country, mode=mode, file_type=extra_file_type)
+            input_hashes.append(
+                get_file_hash(extra_path, state, test) if os.path.exists(get_project_path(extra_path, test)) else ''
+            )
+
+        links = _page_links(page_type, index, kept, kept_sets, country, mode)
+        source_hash = combine_hashes(page_type, SITE_VERSION, template_hash, *input_hashes, *links)
+        page_paths = [get_page_path(date, country, mode, page_file_type)]
+
+        if date == dates[-1]:
+            page_paths.append(get_page_path(None, country, mode, page_file_type))
+
+        pages.append((page_type, date, page_paths, source_hash, links))
+
+    return pages
+
+
+def _player_pages(country: str, mode: str, state: dict, test: bool) -> list[tuple[str, str, list[str], str, PageLinks]]:
+    template_hash = get_file_hash(PLAYER_TEMPLATE, state, test)
+    links = _latest_links(country, mode)
+    players_dir = get_project_path(get_players_dir(country, mode), test)
+
+    # the scraper makes them on its first run
+    if not os.path.isdir(players_dir):
+        logger.warning('No player histories for %s-%s, run the scraper or rebuild.py first', country, mode)
+        return []
+
+    pages = []
+
+    for file_name in sorted(os.listdir(players_dir)):
+        uid = file_name.removesuffix('.json')
+        history_hash = get_file_hash(get_player_history_path(uid, country, mode), state, test)
+        source_hash = combine_hashes('players', SITE_VERSION, template_hash, history_hash)
+        pages.append(('players', uid, [get_player_page_path(uid, country, mode)], source_hash, links))
+
+    return pages
+
+
+def prune_dated_pages(
+        page_types: list[str],
+        kept: dict[str, list[str]],
+        country: str,
+        mode: str,
+        state: dict,
+        test: bool,
+) -> int:
+    """Deletes the dated pages of the country and mode that are not kept
+    anymore, and the folders left empty.
+
+    Returns:
+        int: how many pages were deleted
+    """
+    pages_dir = get_project_path(PAGES_DIR, test)
+    file_names = {
+        os.path.basename(get_page_path(None, country, mode, _page_file_type(page_type))): page_type
+        for page_type in page_types if page_type in DATED_PAGE_TYPES
+    }
+    kept_paths = {
+        get_page_path(date, country, mode, _page_file_type(page_type))
+        for page_type, dates in kept.items() for date in dates
+    }
+    removed = 0
+
+    for dir_path, dir_names, names in os.walk(pages_dir, topdown=False):
+        relative_dir = os.path.relpath(dir_path, pages_dir).replace(os.sep, '/')
+
+        # the player pages and the latest pages are not dated
+        if relative_dir == '.' or relative_dir.startswith('players'):
+            continue
+
+        for name in names:
+            page_path = f'{PAGES_DIR}/{relative_dir}/{name}'
+
+            if name in file_names and page_path not in kept_paths:
+                os.remove(os.path.join(dir_path, name))
+                state['outputs'].pop(page_path, None)
+                removed += 1
+
+        if not os.listdir(dir_path):
+            os.rmdir(dir_path)
+
+    if removed:
+        logger.info('Deleted %s old pages', removed)
+
+    return removed
+
+
+def build_site(
+        country: str = 'PH',
+        mode: str = 'fruits',
+        page_types: list[str] = None,
+        workers: int = None,
+        chunk_size: int = 32,
+        days: int = SITE_DAYS,
+        force: bool = False,
+        test: bool = False,
+) -> int:
+    """Pre-renders the pages of the last days and of every player into
+    docs/pages. Only pages whose data, template or links changed since the
+    last build are rendered, and the dated pages older than that are deleted.
+
+    Args:
+        country (str, optional): 2 Letter country code. Defaults to 'PH'.
+        mode (str, optional): osu/taiko/fruits/mania. Defaults to 'fruits'.
+        page_types (list[str], optional): Which of `PAGE_TYPES` to build. Defaults to all.
+        workers (int, optional): Number of processes. Defaults to the cpu count.
+        chunk_size (int, optional): Pages per work unit. Defaults to 32.
+        days (int, optional): Dates to keep pages of, 0 for every date. Defaults to `SITE_DAYS`.
+        force (bool, optional): Render even the up to date pages. Defaults to False.
+        test (bool, optional): Use data from tests/. Defaults to False.
+
+    Returns:
+        int: how many pages were rendered
+    """
+    start_time = time.time()
+    page_types = page_types or PAGE_TYPES
+
+    state = {'files': {}, 'outputs': {}} if force else load_state(test)
+    kept = get_kept_dates(refresh_manifest(test), country, mode, days)
+
+    prune_dated_pages(page_types, kept, country, mode, state, test)
+
+    pages = []
+
+    if 'rankings' in page_types:
+        pages.extend(_dated_pages('rankings', RANKING_TEMPLATE, kept, country, mode, state, test, extra_file_type='diff'))
+
+    if 'activity' in page_types:
+        pages.extend(_dated_pages('activity', ACTIVITY_TEMPLATE, kept, country, mode, state, test))
+
+    if 'pp-records' in page_types:
+        pages.extend(_dated_pages('pp-records', PP_RECORDS_TEMPLATE, kept, country, mode, state, test))
+
+    if 'players' in page_types:
+        pages.extend(_player_pages(country, mode, state, test))
+
+    source_hashes = {}
+    stale = []
+
+    for page_type, key, page_paths, source_hash, links in pages:
+        stale_paths = [page_path for page_path in page_paths if not is_fresh(page_path, source_hash, state, test)]
+
+        for page_path in page_paths:
+            source_hashes[page_path] = source_hash
+
+        if stale_paths:
+            stale.append((page_type, key, stale_paths, links))
+
+    total = sum(len(page_paths) for _, _, page_paths, _ in stale)
+    logger.info('%s of %s pages need rendering (%.2fs)', total, len(source_hashes), time.time() - start_time)
+
+    if stale:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            jobs = [(country, mode, chunk, test) for chunk in chunked(stale, chunk_size)]
+
+            for written in run_chunks(pool, 'pages', _render_chunk, jobs, total):
+                for page_path in written:
+                    state['outputs'][page_path] = source_hashes[page_path]
+
+    save_state(state, test)
+
+    logger.info('Site built in %.2fs', time.time() - start_time)
+    return total
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Pre-renders the pages of the last days and of every player.')
+
+    parser.add_argument('--mode', type=str, default='fruits',
+                        help='Define what mode, uses the parameters used on osu site.')
+    parser.add_argument('--country', type=str, default='PH',
+                        help='What country to build. Uses 2 letter country codes.')
+    parser.add_argument('--only', type=str, nargs='+', choices=PAGE_TYPES,
+                        help='Only build these pages. Defaults to everything.')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='Number of processes to use. Defaults to the cpu count.')
+    parser.add_argument('--chunk-size', type=int, default=32, help='Pages per work unit. Defaults to 32.')
+    parser.add_argument('--days', type=int, default=SITE_DAYS,
+                        help=f'Dates to keep pages of, 0 for every date. Defaults to {SITE_DAYS}.')
+    parser.add_argument('--force', action='store_true', help='Render even the pages that are up to date.')
+    parser.add_argument('--test', action='store_true', help='Just do tests')
+
+    args = parser.parse_args()
+
+    if args.test:
+        setup_logging(level=logging.DEBUG)
+
+    build_site(
+        country=args.country,
+        mode=args.mode,
+        page_types=args.only,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        days=args.days,
+        force=args.force,
+        test=args.test,
+    )
@@ -0,0 +1,105 @@
+"""One entry point for every script, `python ctbph.py <command> [args]`.
+
+Only the module of the command is imported, so the offline commands do not
+pay for ossapi, requests or the discord embeds. Everything after the command
+goes to the script itself, `python ctbph.py scrape --help` shows its options.
+"""
+import argparse
+import runpy
+import subprocess
+import sys
+import time
+
+# command -> (module it runs, extra arguments, description)
+COMMANDS: dict[str, tuple[str, list[str], str]] = {
+    'scrape': ('leaderboard_scrape', [], 'Scrape the rankings and the pp plays of the day'),
+    'pp': ('leaderboard_scrape', ['--skip-rankings'], 'Only gather the pp plays of the day'),
+    'scrape-all': ('scrape_all', [], 'Scrape several countries and modes at once'),
+    'webhook': ('send_discord_webhook', [], 'Send the discord webhook messages'),
+    'daemon': ('daemon', [], 'Scrape and send the webhooks every day in one process'),
+    'rebuild': ('rebuild', [], 'Regenerate the files derived from the rankings'),
+    'site': ('build_site', [], 'Pre-render the static pages'),
+    'check': ('integrity_check', [], 'Check every data file for corrupted or missing data'),
+    'migrate': ('migrate', [], 'Upgrade every data file to the current file version'),
+    'histories': ('scripts.player_history', [], 'Generate the per player history files'),
+    'records': ('scripts.pp_records_index', [], 'Build the all-time pp records index'),
+    'seen': ('scripts.seen_players', [], 'Build the index of every player ever seen'),
+    'search': ('scripts.search_index', [], 'Build the player search index'),
+    'bench-json': ('json_benchmark', [], 'Compare the json codecs on the data files'),
+}
+
+
+def run_command(command: str, args: list[str]) -> None:
+    """Runs the module of the command as if it was started on its own."""
+    module, extra_args, _ = COMMANDS[command]
+
+    sys.argv = [f'{sys.argv[0]} {command}', *extra_args, *args]
+    runpy.run_module(module, run_name='__main__', alter_sys=True)
+
+
+def _time_process(args: list[str], repeat: int) -> float:
+    # best of a few runs, the first one also pays for reading the files from disk
+    best = float('inf')
+
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        subprocess.run(args, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        best = min(best, time.perf_counter() - start_time)
+
+    return best
+
+
+def benchmark_imports(repeat: int = 5) -> dict[str, tuple[float, float]]:
+    """Measures how long each command takes to start, each in a fresh
+    interpreter so nothing is already imported.
+
+    Args:
+        repeat (int, optional): Runs per command, the best one counts. Defaults to 5.
+
+    Returns:
+        dict[str, tuple[float, float]]: command to the seconds it takes to import its
+        module on top of a bare interpreter, and to show its `--help` through this script
+    """
+    baseline = _time_process([sys.executable, '-c', 'pass'], repeat)
+    results = {}
+
+    for command, (module, _, _) in COMMANDS.items():
+        import_time = _time_process([sys.executable, '-c', f'import {module}'], repeat) - baseline
+        help_time = _time_process([sys.executable, __file__, command, '--help'], repeat)
+        results[command] = (import_time, help_time)
+
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description='Runs the ctbph scripts.',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog='commands:\n' + '\n'.join(
+            f'  {command:<12}{description}' for command, (_, _, description) in COMMANDS.items()
+        ) + f'\n  {"bench":<12}Measure how long each command takes to start',
+    )
+
+    parser.add_argument('command', choices=[*COMMANDS, 'bench'], metavar='command',
+                        help='What to run, see below.')
+    parser.add_argument('args', nargs=argparse.REMAINDER, help='Arguments for the command.')
+
+    args = parser.parse_args()
+
+    if args.command != 'bench':
+        run_command(args.command, args.args)
+        return
+
+    bench_parser = argparse.ArgumentParser(prog=f'{parser.prog} bench', description='Measures the start up time of each command.')
+    bench_parser.add_argument('-r', '--repeat', type=int, default=5, help='Runs per command, the best counts. Defaults to 5.')
+    bench_args = bench_parser.parse_args(args.args)
+
+    # the logger is not imported up here, it is not free either
+    from scripts.logging_config import logger
+
+    for command, (import_time, help_time) in benchmark_imports(bench_args.repeat).items():
+        logger.info('%-10s import: %7.1fms  --help: %7.1fms', command, import_time * 1000, help_time * 1000)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+"""Runs the daily update on a schedule inside one long running process.
+
+Every cycle scrapes the rankings and the pp plays, updates the derived files
+and sends the webhooks, the same as the workflow does with separate scripts.
+Staying up keeps the api client, the caches and the data files of the past
+days loaded between cycles, and the files a cycle writes are handed to its
+next steps from memory, so each night only pays for the new data.
+"""
+import argparse
+import logging
+import subprocess
+import time
+from datetime import datetime, timedelta, timezone
+
+from dotenv import load_dotenv
+
+from integrity_check import check_history, report
+from leaderboard_scrape import run as run_scraper
+from scripts.json_player_data import get_file_stem, get_manifest
+from scripts.logging_config import setup_logging, logger
+from send_discord_webhook import main as send_webhooks
+
+# the workflow runs at 16:00 UTC, midnight in the Philippines
+DEFAULT_RUN_TIME = '16:00'
+
+
+def get_next_run(run_time: str, now: datetime = None) -> datetime:
+    """The next time of the day the cycle should run at.
+
+    Args:
+        run_time (str): HH:MM in UTC
+        now (datetime, optional): Aware datetime to count from. Defaults to now.
+
+    Returns:
+        datetime: aware datetime in UTC
+    """
+    now = now or datetime.now(timezone.utc)
+    hour, minute = (int(part) for part in run_time.split(':'))
+
+    next_run = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+
+    if next_run <= now:
+        next_run += timedelta(days=1)
+
+    return next_run
+
+
+def commit_data() -> bool:
+    """Commits and pushes the new data, like the workflow does before the webhooks.
+
+    Returns:
+        bool: whether there was anything to commit
+    """
+    message = f'Data update @ {datetime.now().strftime("%Y-%m-%d %H:%M:%S")}'
+
+    subprocess.run(['git', 'add', '-A'], check=True)
+
+    # a rerun of the same day has nothing new
+    if subprocess.run(['git', 'diff', '--cached', '--quiet']).returncode == 0:
+        logger.info('No changes to commit')
+        return False
+
+    subprocess.run(['git', 'commit', '-m', message], check=True)
+    subprocess.run(['git', 'push'], check=True)
+    return True
+
+
+class Daemon:
+    """Keeps everything a cycle needs between cycles.
+
+    Args:
+        country (str): 2 Letter country code
+        mode (str): osu/taiko/fruits/mania
+        pages (int): Pages of the rankings to scrape
+        formatted (bool): Make the output .json to be somewhat readable
+        consistent (bool): Fetch the pages again where players moved mid-scrape
+        build_site (bool): Pre-render the pages after the scrape
+        push (bool): Commit and push the data before sending the webhooks
+        webhook (bool): Send the webhooks
+        weekly_day (int | None): Weekday (0 is Monday) to also send the 7 day rankings on
+        test (bool): Use tests/ instead
+    """
+
+    def __init__(
+            self,
+            country: str = 'PH',
+            mode: str = 'fruits',
+            pages: int = 20,
+            formatted: bool = False,
+            consistent: bool = False,
+            build_site: bool = False,
+            push: bool = False,
+            webhook: bool = True,
+            weekly_day: int = None,
+            test: bool = False,
+    ):
+        self.country = country
+        self.mode = mode
+        self.pages = pages
+        self.formatted = formatted
+        self.consistent = consistent
+        self.build_site = build_site
+        self.push = push
+        self.webhook = webhook
+        self.weekly_day = weekly_day
+        self.test = test
+
+        # imported here, so `--help` does not load ossapi for nothing
+        from scripts.api_cache import create_api
+
+        # one client for every cycle, it keeps its token and the response cache
+        self.api = create_api()
+
+    def get_snapshot_date(self) -> datetime | None:
+        """The date of the latest rankings, `None` if there are none."""
+        dates = get_manifest(self.test).get(get_file_stem(self.country, self.mode), [])
+        return datetime.strptime(dates[-1], '%Y/%m/%d') if dates else None
+
+    def run_cycle(self) -> bool:
+        """Scrapes, updates every derived file and sends the webhooks. Nothing
+        is published if a stage did not finish or the data has errors.
+
+        Returns:
+            bool: whether the day was published
+        """
+        cycle_start = time.time()
+
+        results = run_scraper(
+            mode=self.mode,
+            country=self.country,
+            pages=self.pages,
+            formatted=self.formatted,
+            test=self.test,
+            consistent=self.consistent,
+            api=self.api,
+        )
+        logger.info('Scrape done in %.2fs', time.time() - cycle_start)
+
+        unfinished = [name for name, result in results.items() if result in ('failed', 'blocked')]
+
+        if unfinished:
+            logger.error('Stages %s did not finish, not publishing this day', unfinished)
+            return False
+
+        if self.build_site:
+            from build_site import build_site
+
+            build_site(country=self.country, mode=self.mode, test=self.test)
+
+        # the same check the workflow does before committing
+        if not report(check_history(test=self.test)):
+            logger.error('The latest data has errors, not publishing it')
+            return False
+
+        if self.push:
+            commit_data()
+
+        if self.webhook:
+            # the weekday of the rankings, not of wherever this runs
+            snapshot_date = self.get_snapshot_date()
+
+            send_webhooks(
+                country=self.country,
+                mode=self.mode,
+                test=self.test,
+                weekly=snapshot_date is not None and snapshot_date.weekday() == self.weekly_day,
+                api=self.api,
+                date=snapshot_date,
+            )
+
+        logger.info('Cycle done in %.2fs', time.time() - cycle_start)
+        return True
+
+    def serve(self, run_time: str = DEFAULT_RUN_TIME, run_now: bool = False) -> None:
+        """Runs a cycle every day at the time, until interrupted. A failed
+        cycle is logged and the next one still runs.
+
+        Args:
+            run_time (str, optional): HH:MM in UTC. Defaults to `DEFAULT_RUN_TIME`.
+            run_now (bool, optional): Run a cycle right away first. Defaults to False.
+        """
+        while True:
+            if not run_now:
+                next_run = get_next_run(run_time)
+                logger.info('Next cycle at %s UTC', next_run.strftime('%Y-%m-%d %H:%M'))
+                time.sleep(max(0.0, (next_run - datetime.now(timezone.utc)).total_seconds()))
+
+            run_now = False
+
+            try:
+                self.run_cycle()
+            except Exception:
+                logger.exception('The cycle failed, trying again on the next one')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Runs the scraper, then the webhooks, every day in one process.')
+
+    parser.add_argument('--mode', type=str, default='fruits',
+                        help='Define what mode, uses the parameters used on osu site.')
+    parser.add_argument('--country', type=str, default='PH',
+                        help='What country to scrape. Uses 2 letter country codes.')
+    parser.add_argument('-p', '--pages', type=int, default=20,
+                        help='Number of pages to scan, maximum of 200. Defaults to 20')
+    parser.add_argument('--at', type=str, default=DEFAULT_RUN_TIME,
+                        help=f'Time of the day to run at, HH:MM in UTC. Defaults to {DEFAULT_RUN_TIME}.')
+    parser.add_argument('--now', action='store_true', help='Run a cycle right away, then keep the schedule.')
+    parser.add_argument('--once', action='store_true', help='Run one cycle right away and exit.')
+    parser.add_argument('--formatted', action='store_true', help='Make the output .json to be somewhat readable')
+    parser.add_argument('--consistent', action='store_true',
+                        help='Fetch the pages again where players moved between pages while scraping.')
+    parser.add_argument('--build-site', action='store_true', help='Pre-render the pages after scraping.')
+    parser.add_argument('--push', action='store_true', help='Commit and push the data before the webhooks.')
+    parser.add_argument('--no-webhook', action='store_true', help='Do not send the webhooks.')
+    parser.add_argument('--weekly-day', type=int, default=None, choices=range(7),
+                        help='Weekday (0 is Monday) to also send the 7 day rankings on.')
+    parser.add_argument('--test', action='store_true', help='Just do tests')
+
+    args = parser.parse_args()
+
+    if args.test:
+        setup_logging(level=logging.DEBUG)
+
+    load_dotenv()
+
+    daemon = Daemon(
+        country=args.country,
+        mode=args.mode,
+        pages=args.pages,
+        formatted=args.formatted,
+        consistent=args.consistent,
+        build_site=args.build_site,
+        push=args.push,
+        webhook=not args.no_webhook,
+        weekly_day=args.weekly_day,
+        test=args.test,
+    )
+
+    try:
+        if args.once:
+            daemon.run_cycle()
+        else:
+            daemon.serve(args.at, args.now)
+    except KeyboardInterrupt:
+        logger.info('Stopped')
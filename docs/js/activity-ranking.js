@@ -1,7 +1,9 @@
 import {
   dateYesterday,
+  getCumulativeData,
   getData,
   getDateValuesText,
+  getNearestDate,
   getElem,
   getWindowHashValues,
   minusDate,
@@ -10,6 +12,7 @@ import {
 } from "./module/common.js";
 
 import {
+  filterPresent,
   mapData,
   mapDifference,
 } from "./module/player-rankings.js";
@@ -93,8 +96,26 @@ function simplifyNumber(num) {
   }
 }
 
+// same shape as the top lists of the diff files: [id, ign, gain, old, new]
+function topFromDifference(attribute, oldMappedData, newMappedData, dataDifference) {
+  return Object.values(dataDifference)
+    .filter(item => item[attribute] > 0)
+    .sort((a, b) => b[attribute] - a[attribute])
+    .map(playerData => {
+      const id = playerData.user_id;
+
+      return [
+        id,
+        playerData.ign,
+        dataDifference[id][attribute],
+        oldMappedData[id][attribute],
+        newMappedData[id][attribute],
+      ];
+    });
+}
+
 // TODO: reduce code reuse, this is mostly copy pasted from main-ranking.js
-function updateTable(targetTable, attribute, oldMappedData, newMappedData, dataDifference) {
+function updateTable(targetTable, attribute, top) {
   function fNum(num) {
     const hasDecimals = attribute === 'acc';
 
@@ -106,43 +127,38 @@ function updateTable(targetTable, attribute, oldMappedData, newMappedData, dataD
     return num.toLocaleString(undefined, options);
   }
 
-  let rows = Object.values(dataDifference)
-    .filter(item => item[attribute] > 0)
-    .sort((a, b) => b[attribute] - a[attribute])
-    .map(playerData => {
-      const id = playerData.user_id;
+  let rows = top.map(([id, ign, gain, old, current]) => {
+    let diffOfStat = gain;
+    let oldStat = old;
+    let newStat = current;
+
+    if (attribute === 'play_time') {
+      diffOfStat = formatDuration(diffOfStat);
+      oldStat = formatDuration(oldStat);
+      newStat = formatDuration(newStat);
+    } else if (['ranked_score', 'total_hits'].includes(attribute)) {
+      diffOfStat = simplifyNumber(diffOfStat);
+      oldStat = simplifyNumber(oldStat);
+      newStat = simplifyNumber(newStat);
+    } else {
+      diffOfStat = fNum(diffOfStat);
+      oldStat = fNum(oldStat);
+      newStat = fNum(newStat);
+    }
 
-      let diffOfStat = dataDifference[id][attribute];
-      let oldStat = oldMappedData[id][attribute];
-      let newStat = newMappedData[id][attribute];
-
-      if (attribute === 'play_time') {
-        diffOfStat = formatDuration(diffOfStat);
-        oldStat = formatDuration(oldStat);
-        newStat = formatDuration(newStat);
-      } else if (['ranked_score', 'total_hits'].includes(attribute)) {
-        diffOfStat = simplifyNumber(diffOfStat);
-        oldStat = simplifyNumber(oldStat);
-        newStat = simplifyNumber(newStat);
-      } else {
-        diffOfStat = fNum(diffOfStat);
-        oldStat = fNum(oldStat);
-        newStat = fNum(newStat);
-      }
-
-      return `<tr>
-        <td><abbr title="${dataDifference[id][attribute]}">${diffOfStat}</abbr></td>
-        <td>
-          <a href="https://osu.ppy.sh/users/${playerData.user_id}/fruits" target="_new">
-            <img src="https://a.ppy.sh/${playerData.user_id}" loading="lazy">
-          </a>
-        </td>
-        <td>${playerData.ign}</td>
-        <td><abbr title="${oldMappedData[id][attribute]}">${oldStat}</abbr></td>
-        <td>→</td>
-        <td><abbr title="${newMappedData[id][attribute]}">${newStat}</abbr></td>
-      </tr>`;
-    });
+    return `<tr>
+      <td><abbr title="${gain}">${diffOfStat}</abbr></td>
+      <td>
+        <a href="https://osu.ppy.sh/users/${id}/fruits" target="_new">
+          <img src="https://a.ppy.sh/${id}" loading="lazy">
+        </a>
+      </td>
+      <td>${ign}</td>
+      <td><abbr title="${old}">${oldStat}</abbr></td>
+      <td>→</td>
+      <td><abbr title="${current}">${newStat}</abbr></td>
+    </tr>`;
+  });
 
   if (rows.length === 0) {
     resetTableForLoading(targetTable, 'Selected time range does not have enough data, select a more recent date!')
@@ -152,6 +168,31 @@ function updateTable(targetTable, attribute, oldMappedData, newMappedData, dataD
 
 }
 
+function showUpdateTimes(oldTimestamp, newTimestamp) {
+  const oldUpdateTime = new Date(oldTimestamp * 1000);
+  const newUpdateTime = new Date(newTimestamp * 1000);
+
+  updateTimeDisplayOld.innerHTML = `${oldUpdateTime.toDateString()} ${oldUpdateTime.toTimeString()}`;
+  updateTimeDisplayNew.innerHTML = `${newUpdateTime.toDateString()} ${newUpdateTime.toTimeString()}`;
+}
+
+// a single day already has its diff precomputed, no need for two full files
+async function updateRankingFromDiff() {
+  const diffData = await getData(datePickerNew.value, 'PH-fruits-diff');
+
+  if (!diffData) {
+    return false;
+  }
+
+  showUpdateTimes(diffData.comparison_date, diffData.update_date);
+
+  for (let table in tables) {
+    updateTable(tables[table], mainStat[table], diffData.top[mainStat[table]] ?? []);
+  }
+
+  return true;
+}
+
 async function updateRanking() {
 
   // TODO: reduce code reuse, this is copy pasted from main-ranking.js
@@ -169,8 +210,21 @@ async function updateRanking() {
   datePickerNew.setAttribute('min', datePickerOld.value);
   datePickerOld.setAttribute('max', datePickerNew.value);
 
-  const oldData = await getData(datePickerOld.value, 'PH-fruits');
-  const newData = await getData(datePickerNew.value, 'PH-fruits');
+  const isSingleDay = getDateValuesText(addDate(oldDate, 1)) === datePickerNew.value;
+
+  if (isSingleDay && await updateRankingFromDiff()) {
+    updateWindowHash({
+      start: datePickerOld.value,
+      end: datePickerNew.value,
+    });
+    return;
+  }
+
+  // the cumulative index still has players who fell off the rankings in
+  // between, fall back to the plain rankings for days without one
+  const oldDate = await getNearestDate(datePickerOld.value, 'PH-fruits');
+  const oldData = oldDate && (await getCumulativeData(oldDate, 'PH-fruits') || await getData(oldDate, 'PH-fruits'));
+  const newData = await getCumulativeData(datePickerNew.value, 'PH-fruits') || await getData(datePickerNew.value, 'PH-fruits');
 
   if (!oldData || !newData) {
     // TODO: maybe unify batch updating of tables to show messages?
@@ -180,20 +234,17 @@ async function updateRanking() {
     return;
   }
 
-  const oldUpdateTime = new Date(oldData.update_date * 1000);
-  const newUpdateTime = new Date(newData.update_date * 1000);
-
-  updateTimeDisplayOld.innerHTML = `${oldUpdateTime.toDateString()} ${oldUpdateTime.toTimeString()}`;
-  updateTimeDisplayNew.innerHTML = `${newUpdateTime.toDateString()} ${newUpdateTime.toTimeString()}`;
+  showUpdateTimes(oldData.update_date, newData.update_date);
 
   const oldMappedData = mapData(oldData);
-  const newMappedData = mapData(newData);
+  const newMappedData = filterPresent(newData, mapData(newData));
 
   const dataDifference = mapDifference(oldMappedData, newMappedData);
 
   for (let table in tables) {
     resetTableForLoading(tables[table], 'Parsing values for this stat...');
-    updateTable(tables[table], mainStat[table], oldMappedData, newMappedData, dataDifference);
+    const top = topFromDifference(mainStat[table], oldMappedData, newMappedData, dataDifference);
+    updateTable(tables[table], mainStat[table], top);
   }
 
   updateWindowHash({
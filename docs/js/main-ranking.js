@@ -2,6 +2,7 @@ import {
   dateYesterday,
   getData,
   getDateValuesText,
+  getNearestData,
   getWindowHashValues,
   addDate,
   minusDate,
@@ -13,6 +14,10 @@ import {
   mapDifference,
 } from "./module/player-rankings.js";
 
+import {
+  searchPlayers,
+} from "./module/player-search.js";
+
 const datePickerOld = document.getElementById('date-picker-old');
 const datePickerNew = document.getElementById('date-picker-new');
 
@@ -23,6 +28,9 @@ const updateTimeDisplayNew = document.getElementById('update-time-span-new');
 
 const mainTable = document.getElementById('ranking-table');
 
+const playerSearch = document.getElementById('player-search');
+const playerSearchResults = document.getElementById('player-search-results');
+
 function resetTableForLoading(text = 'gathering data...') {
   mainTable.innerHTML = `<tr>
     <td colspan="9">${text}</td>
@@ -136,9 +144,14 @@ async function updateRanking() {
   datePickerNew.setAttribute('min', datePickerOld.value);
   datePickerOld.setAttribute('max', datePickerNew.value);
 
-  const oldData = await getData(datePickerOld.value, 'PH-fruits');
   const newData = await getData(datePickerNew.value, 'PH-fruits');
 
+  // a single day already has its diff precomputed, no need for the older file
+  const isSingleDay = getDateValuesText(addDate(oldDate, 1)) === datePickerNew.value;
+  const diffData = isSingleDay ? await getData(datePickerNew.value, 'PH-fruits-diff') : false;
+
+  const oldData = diffData ? { update_date: diffData.comparison_date } : await getNearestData(datePickerOld.value, 'PH-fruits');
+
   if (!oldData || !newData) {
     resetTableForLoading(`Incomplete data. old: ${datePickerOld.value}, new: ${datePickerNew.value}`);
     return;
@@ -152,10 +165,9 @@ async function updateRanking() {
 
   resetTableForLoading(`Data loaded! Now parsing ${datePickerOld.value} to ${datePickerNew.value}. Please wait for a bit!`);
 
-  const oldMappedData = mapData(oldData);
   const newMappedData = mapData(newData);
 
-  const dataDifference = mapDifference(oldMappedData, newMappedData);
+  const dataDifference = diffData ? mapData(diffData) : mapDifference(mapData(oldData), newMappedData);
 
   updateTable(newMappedData, dataDifference);
 
@@ -165,6 +177,25 @@ async function updateRanking() {
   });
 }
 
+async function updateSearchResults() {
+  const query = playerSearch.value;
+  const players = await searchPlayers(query);
+
+  // a newer search finished first
+  if (query !== playerSearch.value) return;
+
+  playerSearchResults.replaceChildren(...players.map(([uid, name]) => {
+    const item = document.createElement('li');
+    const link = document.createElement('a');
+
+    link.href = `pages/players/PH-fruits/${uid}.html`;
+    link.textContent = name;
+    item.appendChild(link);
+
+    return item;
+  }));
+}
+
 function moveDates(e) {
   const dateAdditiveValue = e.target.dataset.days;
 
@@ -211,6 +242,8 @@ function main() {
     element.addEventListener('click', moveDates);
   });
 
+  playerSearch.addEventListener('input', updateSearchResults);
+
   datePickerNew.dispatchEvent(new Event('change'));
 }
 
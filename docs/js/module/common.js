@@ -30,6 +30,117 @@ async function getData(date, file) {
   }
 }
 
+let manifest = null;
+
+// list of dates every data file exists on, see scripts/json_player_data.py
+async function getManifest() {
+  if (manifest === null) {
+    try {
+      const response = await fetch('data/manifest.json');
+      manifest = response.ok ? await response.json() : {};
+    } catch (error) {
+      console.error(error.message);
+      manifest = {};
+    }
+  }
+
+  return manifest;
+}
+
+// closest date on or before the given one that has the file, the given date
+// is returned as is when there is no manifest to check with
+async function getNearestDate(date, file) {
+  const dates = (await getManifest())[file];
+
+  if (!dates) {
+    return date;
+  }
+
+  const [y, m, d] = getDateValues(new Date(date));
+  const target = `${y}/${m}/${d}`;
+
+  let low = 0;
+  let high = dates.length;
+
+  while (low < high) {
+    const mid = (low + high) >> 1;
+
+    if (dates[mid] <= target) {
+      low = mid + 1;
+    } else {
+      high = mid;
+    }
+  }
+
+  if (low === 0) {
+    return false;
+  }
+
+  return dates[low - 1].replaceAll('/', '-');
+}
+
+async function getNearestData(date, file) {
+  const nearestDate = await getNearestDate(date, file);
+
+  if (!nearestDate) {
+    return false;
+  }
+
+  return await getData(nearestDate, file);
+}
+
+// the cumulative index at a date that has rankings. Only some indexes are
+// kept, so the closest older one gets the rankings after it added on top,
+// like get_cumulative_index() in scripts/cumulative_index.py
+async function getCumulativeData(date, file) {
+  const dates = (await getManifest())[file];
+
+  if (!dates) {
+    return await getData(date, `${file}-cumulative`);
+  }
+
+  const [y, m, d] = getDateValues(new Date(date));
+  const target = `${y}/${m}/${d}`;
+  const indexDate = await getNearestDate(date, `${file}-cumulative`);
+
+  if (!indexDate || !dates.includes(target)) {
+    return false;
+  }
+
+  const index = await getData(indexDate, `${file}-cumulative`);
+
+  if (!index) {
+    return false;
+  }
+
+  const start = indexDate.replaceAll('-', '/');
+  const rankings = await Promise.all(
+    dates
+      .filter(day => day > start && day <= target)
+      .map(day => getData(day.replaceAll('/', '-'), file))
+  );
+
+  // the stats come after ign and last_seen
+  const stats = index.map.slice(2);
+
+  for (const data of rankings) {
+    if (!data) {
+      return false;
+    }
+
+    const ignIndex = data.map.indexOf('ign');
+    const statIndexes = stats.map(stat => data.map.indexOf(stat));
+
+    for (const [userId, row] of Object.entries(data.data)) {
+      index.data[userId] = [row[ignIndex], data.update_date, ...statIndexes.map(i => i === -1 ? 0 : row[i])];
+    }
+
+    index.update_date = data.update_date;
+  }
+
+  return index;
+}
+
 function getDateValues(date) {
   const year = date.getFullYear();
   const month = String(date.getMonth() + 1).padStart(2, '0');
@@ -84,8 +195,12 @@ function updateWindowHash(dataObject) {
 export {
   dateToday,
   dateYesterday,
+  getCumulativeData,
   getData,
   getDateValues,
+  getManifest,
+  getNearestData,
+  getNearestDate,
   getDateValuesText,
   getElem,
   getWindowHashValues,
@@ -61,7 +61,24 @@ function mapDifference(oldData, newData) {
   return diff;
 }
 
+// cumulative indexes carry forward players that are no longer on the
+// rankings, only keep the ones seen on the index's own update
+function filterPresent(data, mappedData) {
+  if (!data.map.includes('last_seen')) return mappedData;
+
+  let obj = {};
+
+  for (const key in mappedData) {
+    if (mappedData[key]['last_seen'] !== data.update_date) continue;
+
+    obj[key] = mappedData[key];
+  }
+
+  return obj;
+}
+
 export {
+  filterPresent,
   mapData,
   mapDifference,
 };
\ No newline at end of file
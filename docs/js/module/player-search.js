@@ -0,0 +1,55 @@
+// see scripts/search_index.py for how the index is made
+const GRAM_SIZE = 3;
+const SHARD_KEY_SIZE = 2;
+
+const shards = {};
+
+function getShardKey(text) {
+  return Array.from(new TextEncoder().encode(text.slice(0, SHARD_KEY_SIZE)))
+    .map(byte => byte.toString(16).padStart(2, '0'))
+    .join('');
+}
+
+async function getShard(shardKey, file) {
+  if (!(shardKey in shards)) {
+    try {
+      const response = await fetch(`data/search/${file}/${shardKey}.json`);
+      shards[shardKey] = response.ok ? await response.json() : {};
+    } catch (error) {
+      console.error(error.message);
+      shards[shardKey] = {};
+    }
+  }
+
+  return shards[shardKey];
+}
+
+// players with a current or past name containing the query, as [uid, name]
+async function searchPlayers(query, file = 'PH-fruits') {
+  query = query.toLowerCase();
+
+  if (query.length < SHARD_KEY_SIZE) {
+    return [];
+  }
+
+  // where the query is in a name starts a gram, or is the last 2 characters
+  // of the name which are a gram too, so one shard is enough
+  const shard = await getShard(getShardKey(query), file);
+  const found = {};
+
+  for (const gram in shard) {
+    if (!gram.startsWith(query.slice(0, GRAM_SIZE))) continue;
+
+    for (const [uid, name] of shard[gram]) {
+      if (name.toLowerCase().includes(query)) {
+        found[`${uid}/${name}`] = [uid, name];
+      }
+    }
+  }
+
+  return Object.values(found);
+}
+
+export {
+  searchPlayers,
+};
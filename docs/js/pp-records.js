@@ -42,6 +42,22 @@ function dataToTableRow(data) {
   </tr>`;
 }
 
+// newer files have the beatmap metadata on its own table, keyed by beatmap id
+function beatmapMetadata(records, beatmapId) {
+  if (!records.beatmaps) {
+    return {};
+  }
+
+  const values = records.beatmaps[beatmapId] ?? [];
+  const metadata = {};
+
+  for (let i = 0; i < records.beatmaps_map.length; i++) {
+    metadata[records.beatmaps_map[i]] = values[i];
+  }
+
+  return metadata;
+}
+
 async function showScores(date) {
   // TODO: unify table updating, maybe?
   table.innerHTML = `<tr>
@@ -76,7 +92,7 @@ async function showScores(date) {
 
     obj['link'] = scoreLink(obj['score_type'], id);
 
-    return obj;
+    return { ...beatmapMetadata(records, obj['beatmap_id']), ...obj };
   });
 
   mapped.sort((a, b) => {
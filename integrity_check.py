@@ -0,0 +1,356 @@
+import argparse
+import json
+import logging
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from scripts.build_state import chunked, combine_hashes, get_file_hash
+from scripts.json_player_data import (
+    get_data_file_path,
+    get_json,
+    get_project_path,
+    refresh_manifest,
+    split_file_stem,
+    write_json,
+)
+from scripts.logging_config import setup_logging, logger
+from scripts.migrations import CURRENT_VERSIONS, PLAYERS_PER_PAGE, get_file_version, upgrade_data
+
+STATE_FILE = '.cache/integrity-state.json'
+FILE_VERSIONS_FILE = 'docs/data/file_versions.json'
+
+# INFO: bump when the checks change, so every file gets checked again
+CHECK_VERSION = 2
+
+# stats that only ever go up, a decrease means one of the days is wrong
+MONOTONIC_STATS = [
+    'play_count',
+    'play_time',
+    'total_score',
+    'total_hits',
+]
+
+SCHEMA_TYPES = {
+    'int': (int, float),
+    'float': (int, float),
+    'bool': bool,
+    'str': str,
+    'list[int]': list,
+    'list[str]': list,
+    'dict': dict,
+    'dict[str,list[any]]': dict,
+}
+
+
+def load_state(test: bool) -> dict:
+    try:
+        with open(get_project_path(STATE_FILE, test)) as file:
+            return json.load(file)
+    except OSError:
+        return {'files': {}, 'results': {}}
+
+
+def save_state(state: dict, test: bool) -> None:
+    write_json(file_path=STATE_FILE, data=state, test=test)
+
+
+def check_header(data: dict, file_versions: dict) -> list[str]:
+    """Checks the header against the schema of its version in file_versions.json."""
+    version = get_file_version(data)
+    version_info = file_versions.get(f'{version:g}')
+
+    if version_info is None:
+        return [f'unknown file version {version}']
+
+    errors = []
+
+    for field, field_type in version_info['schema'].items():
+        optional = field_type.startswith('Optional[')
+        field_type = field_type.removeprefix('Optional[').removesuffix(']') if optional else field_type
+
+        if data.get(field) is None:
+            if not optional:
+                errors.append(f'missing {field}')
+            continue
+
+        expected_type = SCHEMA_TYPES.get(field_type)
+
+        if expected_type is not None and not isinstance(data[field], expected_type):
+            errors.append(f'{field} should be {field_type}, got {type(data[field]).__name__}')
+
+    return errors
+
+
+def check_rows(data: dict) -> list[str]:
+    """Checks that every row is as wide as the map."""
+    width = len(data['map'])
+    bad_rows = [key for key, row in data['data'].items() if len(row) != width]
+
+    if bad_rows:
+        return [f'{len(bad_rows)} rows do not match the map width of {width}, e.g. {bad_rows[0]}']
+
+    return []
+
+
+def check_ranks(data: dict) -> tuple[list[str], list[str]]:
+    """Checks the country ranks for duplicates and holes, a hole of a whole
+    page is a page that failed to download.
+
+    Returns:
+        tuple[0]: errors
+        tuple[1]: warnings
+    """
+    if len(data['data']) == 0:
+        return ['no players'], []
+
+    rank_index = data['map'].index('country_rank')
+    ranks = [row[rank_index] for row in data['data'].values()]
+
+    errors = []
+    warnings = []
+
+    if data['incomplete']:
+        errors.append(f'incomplete, missing pages {data["missing_pages"]}')
+
+    duplicates = len(ranks) - len(set(ranks))
+    if duplicates:
+        errors.append(f'{duplicates} duplicate country ranks')
+
+    missing = sorted(set(range(1, max(ranks) + 1)).difference(ranks))
+    missing_pages = sorted({(rank - 1) // PLAYERS_PER_PAGE + 1 for rank in missing})
+
+    if missing:
+        errors.append(f'{len(missing)} missing country ranks, on pages {missing_pages}')
+
+    # could also be a country with less players than requested
+    expected_players = data.get('pages', 0) * PLAYERS_PER_PAGE
+    if max(ranks) < expected_players:
+        warnings.append(f'only {max(ranks)} of {expected_players} players')
+
+    return errors, warnings
+
+
+def check_monotonic(data: dict, previous_data: dict) -> list[str]:
+    """Checks that the counters did not go down since the day before."""
+    errors = []
+
+    for stat in MONOTONIC_STATS:
+        index = data['map'].index(stat)
+        previous_index = previous_data['map'].index(stat)
+
+        decreased = [
+            uid
+            for uid, row in data['data'].items()
+            if uid in previous_data['data']
+            and row[index] is not None
+            and previous_data['data'][uid][previous_index] is not None
+            and row[index] < previous_data['data'][uid][previous_index]
+        ]
+
+        if decreased:
+            errors.append(f'{stat} went down for {len(decreased)} players since the day before, e.g. {decreased[0]}')
+
+    return errors
+
+
+def check_file(data: dict, previous_data: dict | None, file_versions: dict) -> dict[str, list[str]]:
+    """Runs every check on a data file, as read from disk.
+
+    Args:
+        data (dict): The data file, not upgraded
+        previous_data (dict | None): The upgraded data file of the day before, for rankings
+        file_versions (dict): The contents of file_versions.json
+
+    Returns:
+        dict[str, list[str]]: `errors` and `warnings`
+    """
+    errors = check_header(data, file_versions)
+    warnings = []
+
+    if errors:
+        return {'errors': errors, 'warnings': warnings}
+
+    errors.extend(check_rows(data))
+
+    if errors:
+        return {'errors': errors, 'warnings': warnings}
+
+    data = upgrade_data(data)
+
+    if (data.get('type') or 'rankings') == 'rankings':
+        rank_errors, rank_warnings = check_ranks(data)
+        errors.extend(rank_errors)
+        warnings.extend(rank_warnings)
+
+        if previous_data is not None:
+            errors.extend(check_monotonic(data, previous_data))
+
+    return {'errors': errors, 'warnings': warnings}
+
+
+def _check_chunk(
+        stem: str,
+        dates: list[str],
+        stale: set[str],
+        previous_date: str | None,
+        file_versions: dict,
+        test: bool,
+) -> dict[str, dict]:
+    country, mode, file_type = split_file_stem(stem)
+    results = {}
+    previous_data = None
+
+    def load(date: str) -> dict:
+        return get_json(file_path=get_data_file_path(date=date, country=country, mode=mode, file_type=file_type), test=test)
+
+    if previous_date is not None and file_type is None:
+        previous_data = upgrade_data(load(previous_date))
+
+    for date in dates:
+        data = load(date)
+
+        if date in stale:
+            results[date] = check_file(data, previous_data, file_versions)
+
+        if file_type is None:
+            # a day with broken rows can not be compared against
+            previous_data = upgrade_data(data) if 'map' in data and not check_rows(data) else None
+
+    return results
+
+
+def check_history(
+        workers: int = None,
+        chunk_size: int = 64,
+        force: bool = False,
+        test: bool = False,
+) -> dict[str, dict]:
+    """Checks every rankings and pp-records file. Files that did not change
+    since the last run, along with the day before them, reuse their results.
+
+    Args:
+        workers (int, optional): Number of processes. Defaults to the cpu count.
+        chunk_size (int, optional): Dates per work unit. Defaults to 64.
+        force (bool, optional): Check every file again. Defaults to False.
+        test (bool, optional): Use data from tests/. Defaults to False.
+
+    Returns:
+        dict[str, dict]: project root relative path to its `errors` and `warnings`
+    """
+    start_time = time.time()
+
+    state = {'files': {}, 'results': {}} if force else load_state(test)
+    file_versions = get_json(file_path=FILE_VERSIONS_FILE, test=test)
+    versions_hash = get_file_hash(FILE_VERSIONS_FILE, state, test)
+
+    results: dict[str, dict] = {}
+    check_hashes: dict[str, str] = {}
+    jobs = []
+
+    for stem, dates in refresh_manifest(test).items():
+        country, mode, file_type = split_file_stem(stem)
+
+        if (file_type or 'rankings') not in CURRENT_VERSIONS:
+            continue
+
+        stale = set()
+        previous_hash = ''
+
+        for date in dates:
+            file_path = get_data_file_path(date=date, country=country, mode=mode, file_type=file_type)
+            file_hash = get_file_hash(file_path, state, test)
+
+            # rankings are also compared with the day before
+            check_hash = combine_hashes(CHECK_VERSION, versions_hash, file_hash, previous_hash if file_type is None else '')
+            check_hashes[file_path] = check_hash
+            previous_hash = file_hash
+
+            cached = state['results'].get(file_path)
+            if cached is not None and cached[0] == check_hash:
+                results[file_path] = cached[1]
+            else:
+                stale.add(date)
+
+        for i, chunk in enumerate(chunked(dates, chunk_size)):
+            if stale.intersection(chunk):
+                previous_date = dates[i * chunk_size - 1] if i > 0 else None
+                jobs.append((stem, chunk, stale.intersection(chunk), previous_date, file_versions, test))
+
+    checked = 0
+    total = sum(len(job[2]) for job in jobs)
+    logger.info('%s of %s files need checking', total, len(check_hashes))
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(_check_chunk, *job): job for job in jobs}
+
+        for future in as_completed(futures):
+            stem = futures[future][0]
+            country, mode, file_type = split_file_stem(stem)
+
+            for date, result in future.result().items():
+                file_path = get_data_file_path(date=date, country=country, mode=mode, file_type=file_type)
+                results[file_path] = result
+                state['results'][file_path] = [check_hashes[file_path], result]
+                checked += 1
+
+            logger.info('%s/%s checked (%.2fs)', checked, total, time.time() - start_time)
+
+    save_state(state, test)
+
+    logger.info('Checked %s files in %.2fs', len(results), time.time() - start_time)
+    return results
+
+
+def report(results: dict[str, dict], strict: bool = False) -> bool:
+    """Logs the problems found, errors on the latest date are fatal.
+
+    Args:
+        results (dict[str, dict]): The output of `check_history()`
+        strict (bool, optional): Errors on older dates are fatal too. Defaults to False.
+
+    Returns:
+        bool: whether the data is fine to publish
+    """
+    if len(results) == 0:
+        return True
+
+    latest_date = max(file_path.split('/', 2)[2].rsplit('/', 1)[0] for file_path in results)
+    ok = True
+
+    for file_path, result in sorted(results.items()):
+        fatal = strict or file_path.startswith(f'docs/data/{latest_date}/')
+
+        for error in result['errors']:
+            if fatal:
+                logger.error('%s: %s', file_path, error)
+                ok = False
+            else:
+                logger.warning('%s: %s', file_path, error)
+
+        for warning in result['warnings']:
+            logger.debug('%s: %s', file_path, warning)
+
+    return ok
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Checks every data file for corrupted or missing data.')
+
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='Number of processes to use. Defaults to the cpu count.')
+    parser.add_argument('--chunk-size', type=int, default=64, help='Dates per work unit. Defaults to 64.')
+    parser.add_argument('--force', action='store_true', help='Check every file again, ignoring the cached results.')
+    parser.add_argument('--strict', action='store_true', help='Fail on errors in older files too, not just the latest.')
+    parser.add_argument('--test', action='store_true', help='Just do tests')
+
+    args = parser.parse_args()
+
+    if args.test:
+        setup_logging(level=logging.DEBUG)
+
+    check_results = check_history(workers=args.workers, chunk_size=args.chunk_size, force=args.force, test=args.test)
+
+    if not report(check_results, strict=args.strict):
+        logger.error('The latest data has errors, not publishing it')
+        sys.exit(1)
@@ -0,0 +1,149 @@
+"""Compares the json codecs on the data files of `docs/data`.
+
+Every file is read into memory first, so only the parsing and the writing
+are timed. Each codec is also checked against the json module: it has to
+read the same data, and the files it writes differently are counted.
+"""
+import argparse
+import json
+import logging
+import os
+import time
+
+from scripts.json_codec import get_available_codecs, get_codec, get_typed_decoder
+from scripts.json_player_data import (
+    RawPlayerDataCollection,
+    get_data_file_path,
+    get_manifest,
+    get_project_path,
+    split_file_stem,
+)
+from scripts.logging_config import setup_logging, logger
+
+
+def get_benchmark_files(country: str, mode: str, files: int, test: bool = False) -> list[str]:
+    """The data files of the latest dates, every type of them.
+
+    Args:
+        country (str): 2 Letter country code
+        mode (str): osu/taiko/fruits/mania
+        files (int): How many files of each type, from the latest date back
+        test (bool, optional): Use tests/ instead. Defaults to False.
+
+    Returns:
+        list[str]: project root relative paths, that exist
+    """
+    paths = []
+
+    for stem, dates in get_manifest(test).items():
+        stem_country, stem_mode, file_type = split_file_stem(stem)
+
+        if (stem_country, stem_mode) == (country, mode):
+            paths.extend(
+                get_data_file_path(date=date, country=country, mode=mode, file_type=file_type)
+                for date in dates[-files:]
+            )
+
+    # the manifest can be behind what is on disk
+    return [path for path in paths if os.path.exists(get_project_path(path, test))]
+
+
+def _best_time(function, items: list, repeat: int) -> float:
+    best = float('inf')
+
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        for item in items:
+            function(item)
+        best = min(best, time.perf_counter() - start_time)
+
+    return best
+
+
+def benchmark_codecs(paths: list[str], repeat: int = 3, test: bool = False) -> dict[str, dict]:
+    """Times reading and writing the files with every codec that is installed.
+
+    Args:
+        paths (list[str]): Project root relative data files
+        repeat (int, optional): Runs per codec, the best one counts. Defaults to 3.
+        test (bool, optional): Use tests/ instead. Defaults to False.
+
+    Returns:
+        dict[str, dict]: codec name to its `decode`, `encode` and (for the rankings,
+        if it can) `typed_decode` seconds, and how many files it read differently
+        (`decode_mismatches`) or wrote differently (`encode_differences`) than the json module
+    """
+    raws = []
+    rankings = []
+
+    for path in paths:
+        with open(get_project_path(path, test), 'rb') as file:
+            raws.append(file.read())
+
+        if split_file_stem(path.rsplit('/', 1)[-1].removesuffix('.json'))[2] is None:
+            rankings.append(raws[-1])
+
+    expected = [json.loads(raw) for raw in raws]
+    expected_output = [json.dumps(data, separators=(',', ':')).encode() for data in expected]
+
+    logger.info('%s files (%s rankings), %.1fMB', len(raws), len(rankings), sum(map(len, raws)) / 1e6)
+
+    results = {}
+
+    for name in get_available_codecs():
+        codec = get_codec(name)
+
+        result = {
+            'decode': _best_time(codec.loads, raws, repeat),
+            'encode': _best_time(lambda data: codec.dumps(data, False), expected, repeat),
+            'decode_mismatches': sum(codec.loads(raw) != data for raw, data in zip(raws, expected)),
+            'encode_differences': sum(
+                codec.dumps(data, False) != output for data, output in zip(expected, expected_output)
+            ),
+        }
+
+        if codec.typed:
+            decoder = get_typed_decoder(RawPlayerDataCollection)
+
+            result['typed_decode'] = _best_time(decoder.decode, rankings, repeat)
+            result['decode_mismatches'] += sum(decoder.decode(raw) != json.loads(raw) for raw in rankings)
+
+        results[name] = result
+
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compares the json codecs on the data files.')
+
+    parser.add_argument('--mode', type=str, default='fruits',
+                        help='Define what mode, uses the parameters used on osu site.')
+    parser.add_argument('--country', type=str, default='PH',
+                        help='What country to use. Uses 2 letter country codes.')
+    parser.add_argument('-n', '--files', type=int, default=100,
+                        help='Files of each type to use, from the latest date back. Defaults to 100.')
+    parser.add_argument('-r', '--repeat', type=int, default=3, help='Runs per codec, the best counts. Defaults to 3.')
+    parser.add_argument('--test', action='store_true', help='Just do tests')
+
+    args = parser.parse_args()
+
+    if args.test:
+        setup_logging(level=logging.DEBUG)
+
+    results = benchmark_codecs(
+        get_benchmark_files(country=args.country, mode=args.mode, files=args.files, test=args.test),
+        repeat=args.repeat,
+        test=args.test,
+    )
+    baseline = results['json']
+
+    for name, result in results.items():
+        typed = f'  typed rankings: {result["typed_decode"] * 1000:7.1f}ms' if 'typed_decode' in result else ''
+
+        logger.info('%-8s decode: %7.1fms (%.1fx)  encode: %7.1fms (%.1fx)%s', name,
+                    result['decode'] * 1000, baseline['decode'] / result['decode'],
+                    result['encode'] * 1000, baseline['encode'] / result['encode'], typed)
+
+        if result['decode_mismatches'] or result['encode_differences']:
+            logger.warning('%s read %s files differently and wrote %s differently than json', name,
+                           result['decode_mismatches'], result['encode_differences'])
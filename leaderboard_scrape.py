@@ -1,23 +1,37 @@
+from __future__ import annotations
+
 import argparse
-import json
 import logging
-import os
-import re
 import time
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import TYPE_CHECKING
 
 from dotenv import load_dotenv
-from ossapi import Ossapi, GameMode, RankingType, Score, models
 
+from scripts.beatmap_cache import add_score_beatmaps, get_beatmaps, save_beatmap_cache
+from scripts.cumulative_index import get_index_sources, update_cumulative_index
+from scripts.daily_diff import get_daily_diff, update_daily_diff
 from scripts.json_player_data import (
     MappedPlayerData,
     MappedScoreData,
     RawPlayerDataCollection,
-    get_comparison_and_mapped_data,
-    get_sorted_dict_on_stat,
+    dump_to_file,
+    get_data_file_path,
+    get_json,
 )
 from scripts.logging_config import setup_logging, logger
-from send_discord_webhook import get_recent_plays_of_user
+from scripts.migrations import BEATMAP_MAP, PLAYERS_PER_PAGE
+from scripts.pipeline import Pipeline, PipelineContext, Stage
+from scripts.player_history import append_player_histories
+from scripts.pp_records_index import get_pp_records_index_path, update_pp_records_index
+from scripts.rolling_window import WINDOWS, get_window_type, update_rolling_windows
+from scripts.search_index import get_search_dir, update_search_index
+from scripts.seen_players import get_seen_players_path, update_seen_players
+
+# ossapi takes a while to import, so it is only loaded once the api is needed
+if TYPE_CHECKING:
+    from ossapi import Ossapi, Score, models
 
 
 def encode_to_map(key_mapping: list[str], data: dict[str, str], key: str) -> tuple[str, list[any]]:
@@ -50,16 +64,18 @@ def format_data_from_rows(rows: models.Rankings) -> list[MappedPlayerData]:
 
 def get_page_rankings(
         page: int = 1,
-        mode: str = GameMode.CATCH,
+        mode: str = 'fruits',
         country: str = None,
-) -> list[MappedPlayerData]:
-    client_id = os.getenv('OSU_CLIENT_ID')
-    client_secret = os.getenv('OSU_CLIENT_SECRET')
+        retries: int = 3,
+        api: Ossapi = None,
+) -> list[MappedPlayerData] | None:
+    from ossapi import RankingType
+
+    from scripts.api_cache import create_api
+
+    if api is None:
+        api = create_api()
 
-    # noinspection PyTypeChecker
-    api = Ossapi(client_id, client_secret)
-    
-    retries = 3
     while retries > 0:
         try:
             # noinspection PyTypeChecker
@@ -67,20 +83,46 @@ def get_page_rankings(
             page_data = format_data_from_rows(data)
             return page_data
         except:
-            logger.error(f'Error on getting data for {country}-{mode} page {page}. Retrying in 3s. {retries} left')
             retries -= 1
-            time.sleep(3)
-    
+            logger.error('Error on getting data for %s-%s page %s. %s retries left', country, mode, page, retries)
+
+            if retries > 0:
+                time.sleep(3)
+
     # no more retries
-    logger.error(f'Unable to get data for {country}-{mode}  page {page}. Returning nothing.')
-    return []
+    logger.error('Unable to get data for %s-%s page %s.', country, mode, page)
+    return None
+
+
+# how many times the failed pages are tried again at the end of the run, and
+# how long to wait before each time
+DEFERRED_RETRIES = 3
+DEFERRED_DELAY = 10
 
 
 def get_rankings(
         mode: str = 'osu',
         country: str = None,
-        pages: int = 1
+        pages: int = 1,
+        consistent: bool = False,
+        api: Ossapi = None,
 ) -> RawPlayerDataCollection:
+    """Gets the rankings, page by page. A page that fails is not retried
+    right away, it is put on a queue that is retried after every other page is
+    done, so one bad page does not hold up the rest.
+
+    Args:
+        mode (str, optional): osu/taiko/fruits/mania. Defaults to 'osu'.
+        country (str, optional): 2 Letter country code, `None` for global. Defaults to None.
+        pages (int, optional): How many pages of 50 players, at most 200. Defaults to 1.
+        consistent (bool, optional): Fetch the pages around players that moved between pages
+            mid-scrape again, see `reconcile_pages()`. Defaults to False.
+        api (Ossapi, optional): The client to use. Defaults to a new one.
+
+    Returns:
+        RawPlayerDataCollection: the rankings, `incomplete` with the `missing_pages`
+        if some pages could not be gathered at all
+    """
     pages = min(pages, 200)
 
     value_mapping = [
@@ -103,72 +145,221 @@ def get_rankings(
     full_data: RawPlayerDataCollection = {
         # INFO: increment by one every time you change the format of the
         #       resulting json file and change data/file_versions.json too
-        'file_version': 1.01,
+        'file_version': 1.03,
         'file_type': 'rankings',
         'update_date': time.time(),
         'mode': mode,
         'country': country if country else 'all',
         'pages': pages,
+        'incomplete': False,
+        'missing_pages': [],
+        'reconciliation': None,
         'map': value_mapping,
         'key': values_key,
         'data': {},
     }
 
-    for page in range(int(pages)):
+    if api is None:
+        from scripts.api_cache import create_api
+
+        api = create_api()
+
+    page_rows: dict[int, list[MappedPlayerData]] = {}
+
+    def add_page(page: int, page_data: list[MappedPlayerData], fetch_start_time: float) -> None:
+        page_rows[page] = page_data
+
+        fetch_duration = time.time() - fetch_start_time
+        logger.info('c: %s m: %s c/f: %s/%s OK: %.4fs', country, mode, page, pages, fetch_duration)
+
+    deferred_pages: list[int] = []
+
+    for page in range(1, pages + 1):
         fetch_start_time = time.time()
 
-        page_data = get_page_rankings(page + 1, mode, country)
+        page_data = get_page_rankings(page, mode, country, retries=1, api=api)
 
-        if len(page_data) == 0:
-            logger.warning(f'Data for {country}-{mode} page {page} is nothing!')
+        if page_data is None:
+            logger.warning('Data for %s-%s page %s is nothing! Trying again later', country, mode, page)
+            deferred_pages.append(page)
             continue
 
-        for data in page_data:
+        add_page(page, page_data, fetch_start_time)
+
+    for attempt in range(DEFERRED_RETRIES):
+        if len(deferred_pages) == 0:
+            break
+
+        logger.info('Retrying pages %s in %ss, %s tries left',
+                    deferred_pages, DEFERRED_DELAY, DEFERRED_RETRIES - attempt)
+        time.sleep(DEFERRED_DELAY)
+
+        failed_pages = []
+
+        for page in deferred_pages:
+            fetch_start_time = time.time()
+
+            page_data = get_page_rankings(page, mode, country, api=api)
+
+            if page_data is None:
+                failed_pages.append(page)
+                continue
+
+            add_page(page, page_data, fetch_start_time)
+
+        deferred_pages = failed_pages
+
+    if deferred_pages:
+        logger.error('Pages %s of %s-%s are still missing, marking the rankings as incomplete',
+                     deferred_pages, country, mode)
+        full_data['incomplete'] = True
+        full_data['missing_pages'] = deferred_pages
+
+    full_data['reconciliation'] = reconcile_pages(page_rows, pages, mode, country, api, consistent)
+
+    # pages in order, so a player on two pages keeps the later one like before
+    for page in sorted(page_rows):
+        for data in page_rows[page]:
             uid, values = encode_to_map(value_mapping, data, values_key)
             full_data['data'][uid] = values
 
-        fetch_duration = time.time() - fetch_start_time
-        logger.info(f'c: {country} m: {mode} c/f: {page + 1}/{pages} OK: {fetch_duration:.4f}s')
-
     return full_data
 
 
-def dump_to_file(
-        data: RawPlayerDataCollection,
-        test: bool = False,
-        formatted: bool = False,
-) -> str:
-    mode = data.get('mode', None)
-    country = data.get('country', None)
+# how many times the pages around a duplicate or a gap are fetched again
+RECONCILE_ROUNDS = 3
 
-    if mode is None or country is None:
-        logger.warning('mode or country is None')
 
-    file_type = data.get('type', None)
+def find_page_inconsistencies(
+        page_rows: dict[int, list[MappedPlayerData]],
+        pages: int,
+) -> tuple[list[int], list[int], list[int]]:
+    """Finds the players that moved between pages while they were being
+    fetched: those that show up on two pages, and the ranks nobody has.
 
-    today = datetime.now()
-    date_string = today.strftime('%Y/%m/%d')
+    Args:
+        page_rows (dict[int, list[MappedPlayerData]]): page number to its players
+        pages (int): How many pages were requested
 
-    output = json.dumps(data, separators=(',', ':'), indent=0 if formatted else None)
+    Returns:
+        tuple[0]: ids of players on more than one page
+        tuple[1]: country ranks that are missing, not counting pages that failed to download
+        tuple[2]: the pages to fetch again to fix them
+    """
+    pages_of: dict[int, list[int]] = {}
+    ranks = set()
 
-    if formatted:
-        output2 = re.sub(r'(\d"):\[\s+', r'\1:[', output)
-        output3 = re.sub(r'("|\w),\s+', r'\1,', output2)
-        output = re.sub(r'(\d)\s+\]', r'\1]', output3)
+    for page, page_data in page_rows.items():
+        for data in page_data:
+            pages_of.setdefault(data['id'], []).append(page)
 
-    if file_type:
-        output_file = f'docs/data/{date_string}/{country}-{mode}-{file_type}.json'
-    else:
-        output_file = f'docs/data/{date_string}/{country}-{mode}.json'
+            if data['country_rank'] is not None:
+                ranks.add(data['country_rank'])
+
+    duplicates = sorted(uid for uid, player_pages in pages_of.items() if len(player_pages) > 1)
+
+    fetched_ranks = {
+        rank
+        for page in page_rows
+        for rank in range((page - 1) * PLAYERS_PER_PAGE + 1, page * PLAYERS_PER_PAGE + 1)
+    }
+    last_rank = max(ranks, default=0)
+    missing_ranks = sorted(rank for rank in fetched_ranks.difference(ranks) if rank <= last_rank)
+
+    affected_pages = {page for uid in duplicates for page in pages_of[uid]}
+
+    for rank in missing_ranks:
+        # the player crossed the page boundary, so the page next to it is off too
+        page = (rank - 1) // PLAYERS_PER_PAGE + 1
+        affected_pages.update(
+            neighbor for neighbor in (page - 1, page, page + 1)
+            if 1 <= neighbor <= pages and neighbor in page_rows
+        )
 
-    if test:
-        output_file = 'tests/' + output_file
+    return duplicates, missing_ranks, sorted(affected_pages)
+
+
+def reconcile_pages(
+        page_rows: dict[int, list[MappedPlayerData]],
+        pages: int,
+        mode: str,
+        country: str,
+        api: Ossapi,
+        consistent: bool = False,
+) -> dict:
+    """Checks the pages for players that moved between them mid-scrape. In
+    consistent mode, the affected pages are fetched again all at once until
+    they agree, replacing them in `page_rows`.
+
+    Returns:
+        dict: what was found and done, for the header of the rankings
+    """
+    duplicates, missing_ranks, affected_pages = find_page_inconsistencies(page_rows, pages)
+
+    reconciliation = {
+        'consistent': consistent,
+        'duplicates_found': len(duplicates),
+        'gaps_found': len(missing_ranks),
+        'refetched_pages': [],
+        'rounds': 0,
+    }
+
+    if duplicates or missing_ranks:
+        logger.warning('%s players on two pages and %s missing ranks, on pages %s',
+                       len(duplicates), len(missing_ranks), affected_pages)
+
+    while consistent and affected_pages and reconciliation['rounds'] < RECONCILE_ROUNDS:
+        reconciliation['rounds'] += 1
+        fetch_start_time = time.time()
+
+        # all at once, so the players have no time to move between them
+        with ThreadPoolExecutor(max_workers=len(affected_pages)) as pool:
+            fresh_pages = dict(zip(affected_pages, pool.map(
+                lambda page: get_page_rankings(page, mode, country, api=api),
+                affected_pages,
+            )))
+
+        for page, page_data in fresh_pages.items():
+            if page_data is not None:
+                page_rows[page] = page_data
+
+        reconciliation['refetched_pages'] = sorted(set(reconciliation['refetched_pages']).union(affected_pages))
+        duplicates, missing_ranks, affected_pages = find_page_inconsistencies(page_rows, pages)
+
+        logger.info('Fetched the pages again in %.4fs, %s players on two pages and %s missing ranks left',
+                    time.time() - fetch_start_time, len(duplicates), len(missing_ranks))
 
-    os.makedirs(os.path.dirname(output_file), exist_ok=True)
-    with open(output_file, 'w') as json_file:
-        json_file.write(output)
+    reconciliation['duplicates_left'] = len(duplicates)
+    reconciliation['gaps_left'] = len(missing_ranks)
+
+    return reconciliation
+
+
+def get_recent_plays_of_user(api: Ossapi, user_id, score_type: str = 'best', limit=5, mode: str = 'fruits') -> list[Score]:
+    logger.debug('recent plays: %s, %s, %s', user_id, score_type, limit)
+
+    if limit > 100:
+        logger.warning('some plays might not be gathered for this player (%s)', user_id)
+
+    retries = 3
+    while retries > 0:
+        try:
+            data = api.user_scores(
+                user_id,
+                score_type,
+                limit=limit,
+                mode=mode,
+                include_fails=False
+            )
+            logger.debug('# of plays: %s', len(data))
+            return data
+        except:
+            logger.error('Error on getting data for %s. Retrying in 3s. %s left', user_id, retries)
+            retries -= 1
+            time.sleep(3)
 
-    return output_file
+    logger.error('Cannot gather user scores for %s. Returning nothing', user_id)
+    return []
 
 
 def format_score_data_from_list(scores: list[Score]) -> list[MappedScoreData]:
@@ -193,11 +384,8 @@ def format_score_data_from_list(scores: list[Score]) -> list[MappedScoreData]:
             'user_id': score.user_id,
             'user_name': score._user.username,
 
-            'beatmapset_title': score.beatmapset.title,
-            'beatmap_version': score.beatmap.version,
+            # the rest is on the beatmaps table
             'beatmap_id': score.beatmap.id,
-            'beatmapset_id': score.beatmapset.id,
-            'beatmap_difficulty': score.beatmap.difficulty_rating,
 
             'full_combo': score.perfect,
             'max_combo': score.max_combo,
@@ -207,6 +395,10 @@ def format_score_data_from_list(scores: list[Score]) -> list[MappedScoreData]:
             'count_droplet_miss': score.statistics.count_katu,
             'count_miss': score.statistics.count_miss,
             'accuracy': score.accuracy,
+
+            # so the webhook does not have to look the score up again
+            'created_at': score.created_at.timestamp(),
+            'user_avatar': score._user.avatar_url,
         })
 
     return score_list
@@ -216,11 +408,13 @@ def get_pp_plays(
         mode: str = 'fruits',
         country: str = 'PH',
         test: bool = False,
+        api: Ossapi = None,
+        date: datetime = None,
 ) -> RawPlayerDataCollection | None:
-    client_id = os.getenv('OSU_CLIENT_ID')
-    client_secret = os.getenv('OSU_CLIENT_SECRET')
-    # noinspection PyTypeChecker
-    api = Ossapi(client_id, client_secret)
+    if api is None:
+        from scripts.api_cache import create_api
+
+        api = create_api()
 
     # temporarily using the function, until I placed this on a module
     def sort_scores_by_pp(
@@ -261,7 +455,8 @@ def get_pp_plays(
                 score.beatmapset.id,
             )
             if key not in best_scores or score.pp > best_scores[key].pp:
-                logger.debug(f'{score._user.username} has a better score on {score.beatmapset.title} [{score.beatmap.version}] with {score.pp}')
+                logger.debug('%s has a better score on %s [%s] with %s',
+                             score._user.username, score.beatmapset.title, score.beatmap.version, score.pp)
                 best_scores[key] = score
         
         list_of_scores = []
@@ -271,40 +466,31 @@ def get_pp_plays(
         
         return list_of_scores
 
-    processed_data = get_comparison_and_mapped_data(
-        base_date=datetime.now(),
-        compare_date_offset=1,
+    diff = get_daily_diff(
+        date=date or datetime.now(),
         country=country,
         mode=mode,
-        test=test
+        test=test,
     )
 
-    if processed_data.latest_mapped_data is None:
-        logger.info('No latest data for comparison')
-        return None
-    if processed_data.comparison_mapped_data is None:
-        logger.info('No old data for comparison')
+    if diff is None:
+        logger.info('Missing latest or old data for comparison')
         return None
 
-    active_players = get_sorted_dict_on_stat(
-        data=processed_data.data_difference,
-        stat='play_count',
-        highest_first=True,
-    )
+    # already sorted by the most plays gained
+    active_players = diff['top'].get('play_count', [])
 
     scores: list[Score] = []
 
-    for user_id in active_players:
-        # noinspection PyTypedDict
-        logger.debug(f'Fetching scores for {active_players[user_id]['ign']}...')
+    for user_id, ign, play_count, _, _ in active_players:
+        logger.debug('Fetching scores for %s...', ign)
 
-        # temporarily using the function, until I placed this on a module
-        # noinspection PyTypedDict
         user_scores = get_recent_plays_of_user(
             api=api,
             user_id=user_id,
             score_type='recent',
-            limit=active_players[user_id]['play_count'],
+            limit=play_count,
+            mode=mode,
         )
         scores += user_scores
     
@@ -319,11 +505,7 @@ def get_pp_plays(
         'score_grade',
         'user_id',
         'user_name',
-        'beatmapset_title',
-        'beatmap_version',
         'beatmap_id',
-        'beatmapset_id',
-        'beatmap_difficulty',
         'full_combo',
         'max_combo',
         'count_300',
@@ -332,11 +514,17 @@ def get_pp_plays(
         'count_droplet_miss',
         'count_miss',
         'accuracy',
+        'created_at',
+        'user_avatar',
     ]
     values_key = 'score_id'
 
+    add_score_beatmaps(scores, mode, test)
+    beatmaps = get_beatmaps([score.beatmap.id for score in scores], mode, api, test)
+    save_beatmap_cache(mode, test)
+
     full_data: RawPlayerDataCollection = {
-        'file_version': 1.011,
+        'file_version': 1.013,
         'update_date': time.time(),
         'type': 'pp-records',
         'mode': mode,
@@ -344,6 +532,8 @@ def get_pp_plays(
         'map': value_mapping,
         'key': values_key,
         'data': {},
+        'beatmaps_map': BEATMAP_MAP,
+        'beatmaps': beatmaps,
     }
 
     for scr in formatted_list:
@@ -353,6 +543,170 @@ def get_pp_plays(
     return full_data
 
 
+# -- stages of the daily update, see scripts/pipeline.py
+
+
+def _data_file(context: PipelineContext, file_type: str = None, days_ago: int = 0) -> str:
+    date_string = (context.date - timedelta(days=days_ago)).strftime('%Y/%m/%d')
+    return get_data_file_path(date=date_string, country=context.country, mode=context.mode, file_type=file_type)
+
+
+def _window_files(context: PipelineContext, days_ago: int = 0) -> list[str]:
+    return [_data_file(context, get_window_type(days), days_ago) for days in WINDOWS]
+
+
+def _cumulative_sources(context: PipelineContext) -> list[str]:
+    # what the index of the day before is built from, see `get_cumulative_index()`
+    index_date, rankings_dates = get_index_sources(context.date - timedelta(days=1), context.country, context.mode, context.test)
+    index_files = [] if index_date is None else [
+        get_data_file_path(date=index_date, country=context.country, mode=context.mode, file_type='cumulative')
+    ]
+
+    return [
+        *index_files,
+        *[get_data_file_path(date=date, country=context.country, mode=context.mode) for date in rankings_dates],
+    ]
+
+
+def _rankings_complete(context: PipelineContext) -> bool:
+    # pages that failed are fetched again on a rerun
+    rankings = get_json(file_path=_data_file(context), test=context.test)
+    return rankings is not None and not rankings.get('incomplete')
+
+
+def _scrape_rankings(context: PipelineContext) -> None:
+    data = get_rankings(
+        mode=context.mode,
+        country=context.country,
+        pages=context.options.get('pages', 20),
+        consistent=context.options.get('consistent', False),
+        api=context.api,
+    )
+    output_file = dump_to_file(data=data, test=context.test, formatted=context.formatted, date=context.date)
+    logger.info('Ranking json created at: %s', output_file)
+
+
+def _update_cumulative_index(context: PipelineContext) -> None:
+    index_file = update_cumulative_index(
+        date=context.date,
+        country=context.country,
+        mode=context.mode,
+        test=context.test,
+        formatted=context.formatted,
+    )
+    logger.info('Cumulative index json created at: %s', index_file)
+
+
+def _update_daily_diff(context: PipelineContext) -> None:
+    diff_file = update_daily_diff(
+        date=context.date,
+        country=context.country,
+        mode=context.mode,
+        test=context.test,
+        formatted=context.formatted,
+    )
+    logger.info('Diff json created at: %s', diff_file)
+
+
+def _update_rolling_windows(context: PipelineContext) -> None:
+    window_files = update_rolling_windows(
+        date=context.date,
+        country=context.country,
+        mode=context.mode,
+        test=context.test,
+        formatted=context.formatted,
+    )
+    logger.info('Rolling window json created at: %s', window_files)
+
+
+def _append_player_histories(context: PipelineContext) -> None:
+    history_count = append_player_histories(date=context.date, country=context.country, mode=context.mode, test=context.test)
+    logger.info('Player histories updated: %s', history_count)
+
+
+def _update_seen_players(context: PipelineContext) -> None:
+    seen_file = update_seen_players(date=context.date, country=context.country, mode=context.mode, test=context.test)
+    logger.info('Seen players json created at: %s', seen_file)
+
+
+def _update_search_index(context: PipelineContext) -> None:
+    shard_count = update_search_index(date=context.date, country=context.country, mode=context.mode, test=context.test)
+    logger.info('Search index shards updated: %s', shard_count)
+
+
+def _gather_pp_plays(context: PipelineContext) -> bool:
+    # Get active players, based on play count
+    pp_data = get_pp_plays(mode=context.mode, country=context.country, test=context.test, api=context.api, date=context.date)
+
+    if pp_data is None:
+        logger.info('Incomplete data for pp listing, skipping gathering of pp plays')
+        return False
+
+    output_file = dump_to_file(data=pp_data, test=context.test, formatted=context.formatted, date=context.date)
+    logger.info('pp plays json created at: %s', output_file)
+    return True
+
+
+def _update_pp_records_index(context: PipelineContext) -> None:
+    records_index_file = update_pp_records_index(date=context.date, country=context.country, mode=context.mode, test=context.test)
+    logger.info('pp records index json created at: %s', records_index_file)
+
+
+def _send_webhooks(context: PipelineContext) -> None:
+    from send_discord_webhook import main as send_webhooks
+
+    send_webhooks(
+        country=context.country,
+        mode=context.mode,
+        test=context.test,
+        weekly=context.options.get('weekly', False),
+        api=context.api,
+        date=context.date,
+    )
+
+
+# INFO: bump the version of a stage when what it writes changes, so it runs
+#       again even if its inputs did not change
+STAGES = [
+    Stage('rankings', _scrape_rankings, outputs=lambda context: [_data_file(context)], complete=_rankings_complete),
+    Stage(
+        'cumulative', _update_cumulative_index, needs=('rankings',),
+        outputs=lambda context: [_data_file(context, 'cumulative')],
+        reads=_cumulative_sources,
+    ),
+    Stage(
+        'diff', _update_daily_diff, needs=('rankings',),
+        outputs=lambda context: [_data_file(context, 'diff')],
+        reads=lambda context: [_data_file(context, days_ago=1)],
+    ),
+    Stage(
+        'windows', _update_rolling_windows, needs=('diff',),
+        outputs=_window_files,
+        reads=lambda context: _window_files(context, days_ago=1),
+    ),
+    # a file per player, they are not checked one by one
+    Stage('histories', _append_player_histories, needs=('rankings',)),
+    Stage(
+        'seen', _update_seen_players, needs=('rankings',),
+        outputs=lambda context: [get_seen_players_path(context.country, context.mode)],
+    ),
+    Stage(
+        'search', _update_search_index, needs=('rankings',),
+        outputs=lambda context: [f'{get_search_dir(context.country, context.mode)}/names.json'],
+    ),
+    Stage('pp-records', _gather_pp_plays, needs=('diff',), outputs=lambda context: [_data_file(context, 'pp-records')]),
+    Stage(
+        'records-index', _update_pp_records_index, needs=('pp-records',),
+        outputs=lambda context: [get_pp_records_index_path(context.country, context.mode)],
+    ),
+    Stage('webhook', _send_webhooks, needs=('diff', 'windows', 'seen', 'pp-records')),
+]
+STAGE_NAMES = [stage.name for stage in STAGES]
+
+# everything but the webhooks, which go out after the data is pushed
+DEFAULT_TARGETS = [name for name in STAGE_NAMES if name != 'webhook']
+
+
 def run(
         mode: str = 'fruits',
         country: str = 'PH',
@@ -361,29 +715,59 @@ def run(
         test: bool = False,
         skip_pp_plays: bool = False,
         skip_rankings: bool = False,
-) -> None:
-    logger.info(f'running main method, {skip_pp_plays=} {skip_rankings=}')
-
-    if not skip_rankings:
-        # Gather player rankings
-        data = get_rankings(mode=mode, country=country, pages=pages)
-        output_file = dump_to_file(data=data, test=test, formatted=formatted)
-        logger.info(msg=f'Ranking json created at: {output_file}')
-    else:
+        consistent: bool = False,
+        api: Ossapi = None,
+        targets: list[str] = None,
+        force: list[str] = None,
+        workers: int = 4,
+        weekly: bool = False,
+) -> dict[str, str]:
+    """Brings the files of today up to date. Stages whose inputs did not
+    change since they last ran are skipped, so running it again only does
+    what is missing.
+
+    Args:
+        mode (str, optional): osu/taiko/fruits/mania. Defaults to 'fruits'.
+        country (str, optional): 2 Letter country code. Defaults to 'PH'.
+        pages (int, optional): How many pages of the rankings to scrape. Defaults to 20.
+        formatted (bool, optional): Make the output .json somewhat readable. Defaults to False.
+        test (bool, optional): Use tests/ instead. Defaults to False.
+        skip_pp_plays (bool, optional): Do not gather the pp plays. Defaults to False.
+        skip_rankings (bool, optional): Do not scrape the rankings, use the ones there are. Defaults to False.
+        consistent (bool, optional): See `get_rankings()`. Defaults to False.
+        api (Ossapi, optional): The client to use. Defaults to a new one.
+        targets (list[str], optional): Stages to bring up to date, with what they need.
+            Defaults to `DEFAULT_TARGETS`.
+        force (list[str], optional): Stages to run even if they are up to date. Defaults to none.
+        workers (int, optional): How many stages can run at once. Defaults to 4.
+        weekly (bool, optional): The webhook stage also sends the 7 day rankings. Defaults to False.
+
+    Returns:
+        dict[str, str]: stage name to what happened to it, see `Pipeline.run()`
+    """
+    logger.info('running main method, skip_pp_plays=%r skip_rankings=%r', skip_pp_plays, skip_rankings)
+
+    skip = []
+
+    if skip_rankings:
         logger.info('Skipping gathering of rankings')
+        skip.append('rankings')
 
-    if not skip_pp_plays:
-        # Get active players, based on play count
-        pp_data = get_pp_plays(mode=mode, country=country, test=test)
+    if skip_pp_plays:
+        logger.info('Skipping gathering of pp plays')
+        skip.append('pp-records')
 
-        if pp_data is None:
-            logger.info('Incomplete data for pp listing, skipping gathering of pp plays')
-            return
+    context = PipelineContext(
+        date=datetime.now(),
+        country=country,
+        mode=mode,
+        test=test,
+        formatted=formatted,
+        api=api,
+        options={'pages': pages, 'consistent': consistent, 'weekly': weekly},
+    )
 
-        output_file = dump_to_file(data=pp_data, test=test, formatted=formatted)
-        logger.info(msg=f'pp plays json created at: {output_file}')
-    else:
-        logger.info('Skipping gathering of pp plays')
+    return Pipeline(STAGES, workers=workers).run(context, targets or DEFAULT_TARGETS, skip=skip, force=force)
 
 
 if __name__ == '__main__':
@@ -402,6 +786,15 @@ if __name__ == '__main__':
     parser.add_argument('--formatted', action='store_true', help='Make the output .json to be somewhat readable')
     parser.add_argument('--skip-pp-plays', action='store_true', help='Do not try to gather top pp plays.')
     parser.add_argument('--skip-rankings', action='store_true', help='Skip gathering leaderboard rankings.')
+    parser.add_argument('--consistent', action='store_true',
+                        help='Fetch the pages again where players moved between pages while scraping.')
+    parser.add_argument('--stages', type=str, nargs='+', choices=STAGE_NAMES,
+                        help='Only bring these stages up to date, with the ones they need. '
+                             'Defaults to everything but the webhook.')
+    parser.add_argument('--force', type=str, nargs='+', choices=STAGE_NAMES, default=[],
+                        help='Run these stages even if their inputs did not change.')
+    parser.add_argument('-w', '--workers', type=int, default=4, help='How many stages can run at once. Defaults to 4.')
+    parser.add_argument('--weekly', action='store_true', help='The webhook stage also sends the 7 day rankings.')
 
     args = parser.parse_args()
 
@@ -418,7 +811,7 @@ if __name__ == '__main__':
     }
     mode = mode_map.get(args.mode)
     if mode is None:
-        logger.warning(f'This mode: "{args.mode}" is not a valid one. Try again')
+        logger.warning('This mode: "%s" is not a valid one. Try again', args.mode)
         exit()
 
     run(
@@ -429,4 +822,9 @@ if __name__ == '__main__':
         test=args.test,
         skip_pp_plays=args.skip_pp_plays,
         skip_rankings=args.skip_rankings,
+        consistent=args.consistent,
+        targets=args.stages,
+        force=args.force,
+        workers=args.workers,
+        weekly=args.weekly,
     )
@@ -0,0 +1,113 @@
+import argparse
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from scripts.json_codec import decode
+from scripts.json_player_data import encode_data, get_project_path, refresh_manifest, split_file_stem
+from scripts.logging_config import setup_logging, logger
+from scripts.migrations import CURRENT_VERSIONS, needs_upgrade, upgrade_data
+
+
+def get_snapshot_files(test: bool = False) -> list[str]:
+    """Lists every data file of a type that has migrations, using the manifest.
+
+    Returns:
+        list[str]: project root relative paths, oldest first
+    """
+    files = []
+
+    for stem, dates in refresh_manifest(test).items():
+        _, _, file_type = split_file_stem(stem)
+
+        if (file_type or 'rankings') not in CURRENT_VERSIONS:
+            continue
+
+        files.extend(f'docs/data/{date}/{stem}.json' for date in dates)
+
+    return sorted(files)
+
+
+def migrate_file(file_path: str, dry_run: bool = False, test: bool = False) -> bool:
+    """Upgrades a data file to the current version in place. Formatted files
+    stay formatted.
+
+    Returns:
+        bool: whether the file needed upgrading
+    """
+    full_path = get_project_path(file_path, test)
+
+    with open(full_path, encoding='utf-8') as file:
+        contents = file.read()
+
+    data = decode(contents)
+
+    if not needs_upgrade(data):
+        return False
+
+    if not dry_run:
+        output = encode_data(upgrade_data(data), formatted='\n' in contents)
+
+        with open(full_path, 'w', encoding='utf-8') as file:
+            file.write(output)
+
+    return True
+
+
+def _migrate_chunk(files: list[str], dry_run: bool, test: bool) -> tuple[int, list[str]]:
+    return len(files), [file_path for file_path in files if migrate_file(file_path, dry_run, test)]
+
+
+def migrate_history(workers: int = None, chunk_size: int = 64, dry_run: bool = False, test: bool = False) -> list[str]:
+    """Upgrades every data file in place, in parallel.
+
+    Args:
+        workers (int, optional): Number of processes. Defaults to the cpu count.
+        chunk_size (int, optional): Files per work unit. Defaults to 64.
+        dry_run (bool, optional): Only list the files that would be upgraded. Defaults to False.
+        test (bool, optional): Use data from tests/. Defaults to False.
+
+    Returns:
+        list[str]: the files that were upgraded
+    """
+    start_time = time.time()
+    files = get_snapshot_files(test)
+    chunks = [files[i:i + chunk_size] for i in range(0, len(files), chunk_size)]
+
+    migrated = []
+    done = 0
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(_migrate_chunk, chunk, dry_run, test) for chunk in chunks]
+
+        for future in as_completed(futures):
+            checked, chunk_migrated = future.result()
+            done += checked
+            migrated.extend(chunk_migrated)
+            logger.info('%s/%s checked, %s outdated (%.2fs)', done, len(files), len(migrated), time.time() - start_time)
+
+    migrated.sort()
+
+    for file_path in migrated:
+        logger.debug('%s %s', 'would upgrade' if dry_run else 'upgraded', file_path)
+
+    logger.info('%s %s outdated files in %.2fs',
+                'Found' if dry_run else 'Upgraded', len(migrated), time.time() - start_time)
+    return migrated
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Upgrades every data file to the current file version, in place.')
+
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='Number of processes to use. Defaults to the cpu count.')
+    parser.add_argument('--chunk-size', type=int, default=64, help='Files per work unit. Defaults to 64.')
+    parser.add_argument('--dry-run', action='store_true', help='Only list the files that would be upgraded.')
+    parser.add_argument('--test', action='store_true', help='Just do tests')
+
+    args = parser.parse_args()
+
+    if args.test:
+        setup_logging(level=logging.DEBUG)
+
+    migrate_history(workers=args.workers, chunk_size=args.chunk_size, dry_run=args.dry_run, test=args.test)
@@ -0,0 +1,551 @@
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from scripts.build_state import chunked, combine_hashes, get_file_hash, is_fresh, run_chunks
+from scripts.cumulative_index import build_cumulative_indexes, get_kept_index_dates
+from scripts.daily_diff import build_daily_diff
+from scripts.json_player_data import (
+    dump_to_file,
+    get_comparison_and_mapped_data,
+    get_data_file_path,
+    get_file_stem,
+    get_project_path,
+    refresh_manifest,
+    write_json,
+)
+from scripts.logging_config import setup_logging, logger
+from scripts.player_history import collect_history_rows, get_players_dir, write_player_histories
+from scripts.pp_records_index import (
+    build_pp_records_index,
+    get_pp_records_index_path,
+    merge_pp_records_indexes,
+    write_pp_records_index,
+)
+from scripts.rolling_window import WINDOWS, build_window_history, get_window_type
+from scripts.search_index import collect_names, generate_search_index, get_search_dir, merge_collected_names
+from scripts.seen_players import build_seen_players, get_seen_players_path, merge_seen_players, write_seen_players
+
+STATE_FILE = '.cache/rebuild-state.json'
+
+# INFO: bump the version of an artifact when its format changes, so every
+#       file of it gets rebuilt even if the rankings did not change
+ARTIFACT_VERSIONS = {
+    'diff': 1,
+    'cumulative': 1,
+    'window': 2,
+    'players': 2,
+    'records': 1,
+    'seen': 1,
+    'search': 2,
+}
+
+
+def load_state(test: bool) -> dict:
+    try:
+        with open(get_project_path(STATE_FILE, test)) as file:
+            return json.load(file)
+    except OSError:
+        return {'files': {}, 'outputs': {}}
+
+
+def save_state(state: dict, test: bool) -> None:
+    write_json(file_path=STATE_FILE, data=state, test=test)
+
+
+def _to_datetime(date: str) -> datetime:
+    return datetime.strptime(date, '%Y/%m/%d')
+
+
+# -- workers, these run on the pool so they only take picklable arguments
+
+
+def _rebuild_diff_chunk(country: str, mode: str, dates: list[str], test: bool, formatted: bool) -> list[str]:
+    for date in dates:
+        processed_data = get_comparison_and_mapped_data(
+            base_date=_to_datetime(date),
+            compare_date_offset=1,
+            country=country,
+            mode=mode,
+            test=test,
+        )
+        diff = build_daily_diff(processed_data, country=country, mode=mode)
+        dump_to_file(data=diff, test=test, formatted=formatted, date=_to_datetime(date), update_manifest=False)
+
+    return dates
+
+
+def _collect_cumulative_chunk(country: str, mode: str, dates: list[str], test: bool) -> dict:
+    # the index at the end of the chunk, as if nothing came before it
+    indexes = build_cumulative_indexes(dates, country, mode, test=test)
+    return indexes[-1][1] if indexes else None
+
+
+def _rebuild_cumulative_chunk(
+        country: str,
+        mode: str,
+        dates: list[str],
+        stale: set[str],
+        previous_index: dict | None,
+        test: bool,
+        formatted: bool,
+) -> list[str]:
+    written = []
+
+    for date, index in build_cumulative_indexes(dates, country, mode, previous_index, test):
+        if date in stale:
+            dump_to_file(data=index, test=test, formatted=formatted, date=_to_datetime(date), update_manifest=False)
+            written.append(date)
+
+    return written
+
+
+def _rebuild_window_chunk(
+        days: int,
+        country: str,
+        mode: str,
+        dates: list[str],
+        stale: set[str],
+        test: bool,
+        formatted: bool,
+) -> list[str]:
+    written = []
+
+    for date, window in build_window_history(days, _to_datetime(dates[0]), _to_datetime(dates[-1]), country, mode, test):
+        date_string = date.strftime('%Y/%m/%d')
+
+        if date_string in stale:
+            dump_to_file(data=window, test=test, formatted=formatted, date=date, update_manifest=False)
+            written.append(date_string)
+
+    return written
+
+
+def _collect_history_chunk(country: str, mode: str, dates: list[str], test: bool) -> tuple:
+    return collect_history_rows(dates, country, mode, test)
+
+
+def _build_seen_chunk(country: str, mode: str, dates: list[str], test: bool) -> dict:
+    return build_seen_players(dates, country, mode, test)
+
+
+def _collect_names_chunk(country: str, mode: str, dates: list[str], test: bool) -> dict:
+    return collect_names(dates, country, mode, test)
+
+
+def _build_records_chunk(country: str, mode: str, dates: list[str], test: bool) -> dict:
+    return build_pp_records_index(dates, country, mode, test)
+
+
+# -- artifacts
+
+
+def rebuild_diffs(
+        pool: ProcessPoolExecutor,
+        country: str,
+        mode: str,
+        dates: list[str],
+        snapshot_hashes: dict[str, str],
+        state: dict,
+        chunk_size: int,
+        test: bool,
+        formatted: bool,
+) -> dict[str, str]:
+    """Rebuilds the diff of every date that has an older rankings to compare to.
+
+    Returns:
+        dict[str, str]: date to the source hash of its diff, for the artifacts built on diffs
+    """
+    diff_hashes = {}
+    stale = []
+
+    for previous_date, date in zip(dates, dates[1:]):
+        source_hash = combine_hashes('diff', ARTIFACT_VERSIONS['diff'], snapshot_hashes[date], snapshot_hashes[previous_date])
+        diff_hashes[date] = source_hash
+
+        output_path = get_data_file_path(date=date, country=country, mode=mode, file_type='diff')
+        if not is_fresh(output_path, source_hash, state, test):
+            stale.append(date)
+
+    logger.info('diff: %s of %s dates need rebuilding', len(stale), len(diff_hashes))
+
+    jobs = [(country, mode, chunk, test, formatted) for chunk in chunked(stale, chunk_size)]
+
+    for written in run_chunks(pool, 'diff', _rebuild_diff_chunk, jobs, len(stale)):
+        for date in written:
+            state['outputs'][get_data_file_path(date=date, country=country, mode=mode, file_type='diff')] = diff_hashes[date]
+
+    return diff_hashes
+
+
+def rebuild_cumulative(
+        pool: ProcessPoolExecutor,
+        country: str,
+        mode: str,
+        dates: list[str],
+        snapshot_hashes: dict[str, str],
+        state: dict,
+        chunk_size: int,
+        test: bool,
+        formatted: bool,
+) -> None:
+    """Rebuilds the cumulative indexes that are kept, see `get_kept_index_dates()`,
+    and deletes the others.
+
+    Each index depends on every rankings before it, so this is done in two
+    passes: each chunk first builds its own last index independently, those
+    are merged in order to get the index before every chunk, then the chunks
+    build and write their indexes on top of it.
+    """
+    source_hashes = {}
+    stale = set()
+    source_hash = ''
+    kept = get_kept_index_dates(dates)
+
+    for date in dates:
+        source_hash = combine_hashes('cumulative', ARTIFACT_VERSIONS['cumulative'], source_hash, snapshot_hashes[date])
+        source_hashes[date] = source_hash
+
+        output_path = get_data_file_path(date=date, country=country, mode=mode, file_type='cumulative')
+
+        if date not in kept:
+            state['outputs'].pop(output_path, None)
+
+            if os.path.exists(get_project_path(output_path, test)):
+                os.remove(get_project_path(output_path, test))
+        elif not is_fresh(output_path, source_hash, state, test):
+            stale.add(date)
+
+    logger.info('cumulative: %s of %s kept dates need rebuilding', len(stale), len(kept))
+
+    if len(stale) == 0:
+        return
+
+    chunks = chunked(dates, chunk_size)
+    last_chunk = max(i for i, chunk in enumerate(chunks) if stale.intersection(chunk))
+
+    partial_indexes = list(pool.map(
+        _collect_cumulative_chunk,
+        *zip(*[(country, mode, chunk, test) for chunk in chunks[:last_chunk]]),
+    )) if last_chunk > 0 else []
+
+    jobs = []
+    previous_index = None
+
+    for i, chunk in enumerate(chunks[:last_chunk + 1]):
+        if stale.intersection(chunk):
+            jobs.append((country, mode, chunk, stale.intersection(chunk), previous_index, test, formatted))
+
+        if i < len(partial_indexes) and partial_indexes[i] is not None:
+            if previous_index is None:
+                previous_index = partial_indexes[i]
+            else:
+                merged_data = {**previous_index['data'], **partial_indexes[i]['data']}
+                previous_index = {**partial_indexes[i], 'data': merged_data}
+
+    for written in run_chunks(pool, 'cumulative', _rebuild_cumulative_chunk, jobs, len(stale)):
+        for date in written:
+            output_path = get_data_file_path(date=date, country=country, mode=mode, file_type='cumulative')
+            state['outputs'][output_path] = source_hashes[date]
+
+
+def rebuild_windows(
+        pool: ProcessPoolExecutor,
+        country: str,
+        mode: str,
+        diff_hashes: dict[str, str],
+        state: dict,
+        chunk_size: int,
+        test: bool,
+        formatted: bool,
+) -> None:
+    """Rebuilds every window of every date that has a diff, each chunk
+    slides its own window across its dates.
+    """
+    diff_dates = sorted(diff_hashes)
+
+    for days in WINDOWS:
+        file_type = get_window_type(days)
+        source_hashes = {}
+        stale = set()
+
+        for i, date in enumerate(diff_dates):
+            # diffs are one per day at most, so the window is within the last `days` of them
+            window_start = _to_datetime(date).toordinal() - days
+            window_hashes = [
+                diff_hashes[window_date]
+                for window_date in diff_dates[max(0, i - days):i + 1]
+                if _to_datetime(window_date).toordinal() > window_start
+            ]
+            source_hash = combine_hashes('window', ARTIFACT_VERSIONS['window'], days, *window_hashes)
+            source_hashes[date] = source_hash
+
+            output_path = get_data_file_path(date=date, country=country, mode=mode, file_type=file_type)
+            if not is_fresh(output_path, source_hash, state, test):
+                stale.add(date)
+
+        logger.info('%s: %s of %s dates need rebuilding', file_type, len(stale), len(diff_dates))
+
+        jobs = [
+            (days, country, mode, chunk, stale.intersection(chunk), test, formatted)
+            for chunk in chunked(diff_dates, chunk_size)
+            if stale.intersection(chunk)
+        ]
+
+        for written in run_chunks(pool, file_type, _rebuild_window_chunk, jobs, len(stale)):
+            for date in written:
+                output_path = get_data_file_path(date=date, country=country, mode=mode, file_type=file_type)
+                state['outputs'][output_path] = source_hashes[date]
+
+
+def rebuild_players(
+        pool: ProcessPoolExecutor,
+        country: str,
+        mode: str,
+        dates: list[str],
+        snapshot_hashes: dict[str, str],
+        state: dict,
+        chunk_size: int,
+        test: bool,
+) -> None:
+    """Regenerates every player's history, the rankings are read in parallel."""
+    output_path = get_players_dir(country, mode)
+    source_hash = combine_hashes('players', ARTIFACT_VERSIONS['players'], *[snapshot_hashes[date] for date in dates])
+
+    if is_fresh(output_path, source_hash, state, test):
+        logger.info('players: up to date')
+        return
+
+    chunks = chunked(dates, chunk_size)
+    results = pool.map(_collect_history_chunk, *zip(*[(country, mode, chunk, test) for chunk in chunks]))
+
+    histories: dict[str, list[list]] = {}
+    names: dict[str, str] = {}
+    update_dates: dict[str, float] = {}
+
+    # pool.map keeps the chunk order, so the rows stay oldest first
+    for chunk_histories, chunk_names, chunk_update_dates in results:
+        for uid, rows in chunk_histories.items():
+            histories.setdefault(uid, []).extend(rows)
+        names.update(chunk_names)
+        update_dates.update(chunk_update_dates)
+
+    written = write_player_histories(histories, names, update_dates, country, mode, test)
+    logger.info('players: %s written', written)
+
+    state['outputs'][output_path] = source_hash
+
+
+def rebuild_seen_players(
+        pool: ProcessPoolExecutor,
+        country: str,
+        mode: str,
+        dates: list[str],
+        snapshot_hashes: dict[str, str],
+        state: dict,
+        chunk_size: int,
+        test: bool,
+) -> None:
+    """Rebuilds the index of every player ever seen, each chunk of rankings
+    builds its own index and those are merged in order.
+    """
+    output_path = get_seen_players_path(country, mode)
+    source_hash = combine_hashes('seen', ARTIFACT_VERSIONS['seen'], *dates, *[snapshot_hashes[date] for date in dates])
+
+    if is_fresh(output_path, source_hash, state, test):
+        logger.info('seen: up to date')
+        return
+
+    chunks = chunked(dates, chunk_size)
+    results = pool.map(_build_seen_chunk, *zip(*[(country, mode, chunk, test) for chunk in chunks]))
+
+    seen = None
+
+    for chunk_seen in results:
+        seen = chunk_seen if seen is None else merge_seen_players(seen, chunk_seen)
+
+    write_seen_players(seen, test)
+    logger.info('seen: %s players seen in %s days', len(seen['data']), len(dates))
+
+    state['outputs'][output_path] = source_hash
+
+
+def rebuild_search_index(
+        pool: ProcessPoolExecutor,
+        country: str,
+        mode: str,
+        dates: list[str],
+        snapshot_hashes: dict[str, str],
+        state: dict,
+        chunk_size: int,
+        test: bool,
+) -> None:
+    """Rebuilds the player search index, the names are collected from each
+    chunk of rankings in parallel and merged in order.
+    """
+    output_path = get_search_dir(country, mode)
+    source_hash = combine_hashes('search', ARTIFACT_VERSIONS['search'], *dates, *[snapshot_hashes[date] for date in dates])
+
+    if is_fresh(output_path, source_hash, state, test):
+        logger.info('search: up to date')
+        return
+
+    chunks = chunked(dates, chunk_size)
+    results = pool.map(_collect_names_chunk, *zip(*[(country, mode, chunk, test) for chunk in chunks]))
+
+    names = None
+
+    for chunk_names in results:
+        names = chunk_names if names is None else merge_collected_names(names, chunk_names)
+
+    shard_count = generate_search_index(names, test)
+    logger.info('search: %s players in %s shards', len(names['data']), shard_count)
+
+    state['outputs'][output_path] = source_hash
+
+
+def rebuild_pp_records_index(
+        pool: ProcessPoolExecutor,
+        country: str,
+        mode: str,
+        record_dates: list[str],
+        state: dict,
+        chunk_size: int,
+        test: bool,
+) -> None:
+    """Rebuilds the all-time pp records index, each chunk of pp-records
+    builds its own index and those are merged in order.
+    """
+    output_path = get_pp_records_index_path(country, mode)
+    record_hashes = [
+        get_file_hash(get_data_file_path(date=date, country=country, mode=mode, file_type='pp-records'), state, test)
+        for date in record_dates
+    ]
+    source_hash = combine_hashes('records', ARTIFACT_VERSIONS['records'], *record_dates, *record_hashes)
+
+    if is_fresh(output_path, source_hash, state, test):
+        logger.info('records: up to date')
+        return
+
+    chunks = chunked(record_dates, chunk_size)
+    results = pool.map(_build_records_chunk, *zip(*[(country, mode, chunk, test) for chunk in chunks]))
+
+    index = None
+
+    # pool.map keeps the chunk order, so older scores win the ties
+    for chunk_index in results:
+        index = chunk_index if index is None else merge_pp_records_indexes(index, chunk_index)
+
+    write_pp_records_index(index, test)
+    logger.info('records: %s scores kept from %s days', len(index['scores']), len(record_dates))
+
+    state['outputs'][output_path] = source_hash
+
+
+def rebuild(
+        country: str = 'PH',
+        mode: str = 'fruits',
+        artifacts: list[str] = None,
+        workers: int = None,
+        chunk_size: int = 32,
+        force: bool = False,
+        test: bool = False,
+        formatted: bool = False,
+) -> None:
+    """Regenerates the files derived from the rankings for every date.
+
+    Args:
+        country (str, optional): 2 Letter country code. Defaults to 'PH'.
+        mode (str, optional): osu/taiko/fruits/mania. Defaults to 'fruits'.
+        artifacts (list[str], optional): Which of `ARTIFACT_VERSIONS` to rebuild. Defaults to all.
+        workers (int, optional): Number of processes. Defaults to the cpu count.
+        chunk_size (int, optional): Dates per work unit. Defaults to 32.
+        force (bool, optional): Rebuild even the up to date files. Defaults to False.
+        test (bool, optional): Use data from tests/. Defaults to False.
+        formatted (bool, optional): Make the output .json somewhat readable. Defaults to False.
+    """
+    start_time = time.time()
+    artifacts = artifacts or list(ARTIFACT_VERSIONS)
+
+    state = {'files': {}, 'outputs': {}} if force else load_state(test)
+
+    manifest = refresh_manifest(test)
+    dates = manifest.get(get_file_stem(country, mode), [])
+
+    if len(dates) == 0:
+        logger.warning('No rankings found for %s-%s', country, mode)
+        return
+
+    snapshot_hashes = {
+        date: get_file_hash(get_data_file_path(date=date, country=country, mode=mode), state, test)
+        for date in dates
+    }
+    logger.info('Hashed %s rankings in %.2fs', len(dates), time.time() - start_time)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        diff_hashes = None
+
+        # windows are built from the diffs, so those always go first
+        if 'diff' in artifacts or 'window' in artifacts:
+            diff_hashes = rebuild_diffs(pool, country, mode, dates, snapshot_hashes, state, chunk_size, test, formatted)
+
+        if 'cumulative' in artifacts:
+            rebuild_cumulative(pool, country, mode, dates, snapshot_hashes, state, chunk_size, test, formatted)
+
+        if 'window' in artifacts:
+            rebuild_windows(pool, country, mode, diff_hashes, state, chunk_size, test, formatted)
+
+        if 'players' in artifacts:
+            rebuild_players(pool, country, mode, dates, snapshot_hashes, state, chunk_size, test)
+
+        if 'seen' in artifacts:
+            rebuild_seen_players(pool, country, mode, dates, snapshot_hashes, state, chunk_size, test)
+
+        if 'search' in artifacts:
+            rebuild_search_index(pool, country, mode, dates, snapshot_hashes, state, chunk_size, test)
+
+        record_dates = manifest.get(get_file_stem(country, mode, 'pp-records'), [])
+        if 'records' in artifacts and record_dates:
+            rebuild_pp_records_index(pool, country, mode, record_dates, state, chunk_size, test)
+
+    refresh_manifest(test)
+    save_state(state, test)
+
+    logger.info('Rebuild done in %.2fs', time.time() - start_time)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Regenerates the files derived from the rankings for every date.')
+
+    parser.add_argument('--mode', type=str, default='fruits',
+                        help='Define what mode, uses the parameters used on osu site.')
+    parser.add_argument('--country', type=str, default='PH',
+                        help='What country to rebuild. Uses 2 letter country codes.')
+    parser.add_argument('--only', type=str, nargs='+', choices=list(ARTIFACT_VERSIONS),
+                        help='Only rebuild these. Defaults to everything.')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='Number of processes to use. Defaults to the cpu count.')
+    parser.add_argument('--chunk-size', type=int, default=32, help='Dates per work unit. Defaults to 32.')
+    parser.add_argument('--force', action='store_true', help='Rebuild even the files that are up to date.')
+    parser.add_argument('--test', action='store_true', help='Just do tests')
+    parser.add_argument('--formatted', action='store_true', help='Make the output .json to be somewhat readable')
+
+    args = parser.parse_args()
+
+    if args.test:
+        setup_logging(level=logging.DEBUG)
+
+    rebuild(
+        country=args.country,
+        mode=args.mode,
+        artifacts=args.only,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        force=args.force,
+        test=args.test,
+        formatted=args.formatted,
+    )
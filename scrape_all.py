@@ -0,0 +1,207 @@
+"""Scrapes several countries and modes at once, one process per job.
+
+Every process takes its api requests from the same `TokenBucket`, so all of
+them together stay under one request rate. What each job did is merged at
+the end and written to `.cache/scrape-metrics.json`.
+"""
+import argparse
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+
+from scripts.json_player_data import refresh_manifest, write_json
+from scripts.logging_config import setup_logging, logger
+from scripts.rate_limit import DEFAULT_BURST, DEFAULT_RATE, TokenBucket
+
+METRICS_FILE = '.cache/scrape-metrics.json'
+
+MODES = ['osu', 'taiko', 'fruits', 'mania']
+
+# set on every process of the pool by `_init_worker()`
+_rate_limiter: TokenBucket | None = None
+
+
+def _init_worker(rate_limiter: TokenBucket, level: int) -> None:
+    global _rate_limiter
+    _rate_limiter = rate_limiter
+
+    setup_logging(level=level)
+
+
+def _run_shard(country: str, mode: str, options: dict) -> dict:
+    """Runs the scraper for one country and mode, on a process of the pool.
+
+    Returns:
+        dict: the metrics of the job
+    """
+    # imported here, so the parent process does not load ossapi for nothing
+    from leaderboard_scrape import run
+    from scripts.api_cache import create_api
+
+    start_time = time.time()
+    metrics = {'country': country, 'mode': mode, 'error': None, 'stages': {}}
+
+    # the counts of the bucket are per process, a process can run several jobs
+    stats_before = _rate_limiter.get_stats()
+
+    api = create_api(rate_limiter=_rate_limiter)
+
+    try:
+        metrics['stages'] = run(api=api, mode=mode, country=country, **options)
+    except Exception as exc:
+        logger.exception('%s-%s failed', country, mode)
+        metrics['error'] = repr(exc)
+
+    adapter = getattr(api, 'adapter', None)
+    stats = _rate_limiter.get_stats()
+
+    metrics.update({
+        'elapsed': round(time.time() - start_time, 3),
+        'requests': stats['requests'] - stats_before['requests'],
+        'rate_limit_wait': round(stats['rate_limit_wait'] - stats_before['rate_limit_wait'], 3),
+        'cache_hits': getattr(adapter, 'hits', 0),
+        'cache_revalidated': getattr(adapter, 'revalidated', 0),
+        'cache_misses': getattr(adapter, 'misses', 0),
+    })
+
+    return metrics
+
+
+def merge_metrics(shards: list[dict], elapsed: float) -> dict:
+    """Adds up the metrics of every job.
+
+    Args:
+        shards (list[dict]): From `_run_shard()`
+        elapsed (float): Seconds the whole run took
+
+    Returns:
+        dict: the totals, how many times each stage ended each way, and every job's metrics
+    """
+    totals = {
+        key: round(sum(shard[key] for shard in shards), 3)
+        for key in ('elapsed', 'requests', 'rate_limit_wait', 'cache_hits', 'cache_revalidated', 'cache_misses')
+    }
+    stage_results: dict[str, dict[str, int]] = {}
+
+    for shard in shards:
+        for stage, result in shard['stages'].items():
+            counts = stage_results.setdefault(stage, {})
+            counts[result] = counts.get(result, 0) + 1
+
+    return {
+        'update_date': time.time(),
+        'elapsed': round(elapsed, 3),
+        # how much of the work overlapped, the sum of the jobs over the wall time
+        'speedup': round(totals['elapsed'] / elapsed, 2) if elapsed else None,
+        'totals': totals,
+        'stages': stage_results,
+        'failed': [f'{shard["country"]}-{shard["mode"]}' for shard in shards if shard['error']],
+        'shards': sorted(shards, key=lambda shard: (shard['country'], shard['mode'])),
+    }
+
+
+def scrape_all(
+        countries: list[str],
+        modes: list[str],
+        workers: int = None,
+        rate: float = DEFAULT_RATE,
+        burst: int = DEFAULT_BURST,
+        test: bool = False,
+        **options,
+) -> dict:
+    """Runs the scraper for every country and mode on a process pool.
+
+    Args:
+        countries (list[str]): 2 Letter country codes
+        modes (list[str]): osu/taiko/fruits/mania
+        workers (int, optional): Number of processes. Defaults to one per job, at most the cpu count.
+        rate (float, optional): Api requests per second, for all processes together.
+            Defaults to `DEFAULT_RATE`.
+        burst (int, optional): Api requests that can go at once. Defaults to `DEFAULT_BURST`.
+        test (bool, optional): Use tests/ instead. Defaults to False.
+        **options: Passed to `leaderboard_scrape.run()`, like `pages` or `formatted`
+
+    Returns:
+        dict: the merged metrics, see `merge_metrics()`
+    """
+    start_time = time.time()
+    jobs = [(country, mode) for country in countries for mode in modes]
+    workers = workers or min(len(jobs), os.cpu_count() or 1)
+
+    rate_limiter = TokenBucket(rate, burst)
+    shards = []
+
+    logger.info('%s jobs on %s processes, at most %s requests a second', len(jobs), workers, rate)
+
+    with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(rate_limiter, logger.level),
+    ) as pool:
+        futures = {
+            pool.submit(_run_shard, country, mode, {**options, 'test': test}): (country, mode)
+            for country, mode in jobs
+        }
+
+        for future in as_completed(futures):
+            country, mode = futures[future]
+            shard = future.result()
+            shards.append(shard)
+
+            logger.info('%s-%s done in %.2fs, %s requests, waited %.2fs for the rate limit',
+                        country, mode, shard['elapsed'], shard['requests'], shard['rate_limit_wait'])
+
+    # every process only added its own files to the manifest
+    refresh_manifest(test)
+
+    metrics = merge_metrics(shards, time.time() - start_time)
+    write_json(file_path=METRICS_FILE, data=metrics, test=test)
+
+    logger.info('%s jobs done in %.2fs (%sx), %s requests, failed: %s',
+                len(jobs), metrics['elapsed'], metrics['speedup'], metrics['totals']['requests'], metrics['failed'])
+    return metrics
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Scrapes several countries and modes at once.')
+
+    parser.add_argument('-c', '--countries', type=str, nargs='+', default=['PH'],
+                        help='2 letter country codes to scrape. Defaults to PH.')
+    parser.add_argument('-m', '--modes', type=str, nargs='+', default=['fruits'], choices=MODES,
+                        help='Modes to scrape, as used on the osu site. Defaults to fruits.')
+    parser.add_argument('-p', '--pages', type=int, default=20,
+                        help='Number of pages to scan, maximum of 200. Defaults to 20')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='Number of processes to use. Defaults to one per job, at most the cpu count.')
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE,
+                        help=f'Api requests per second for all processes together. Defaults to {DEFAULT_RATE}.')
+    parser.add_argument('--burst', type=int, default=DEFAULT_BURST,
+                        help=f'Api requests that can go at once. Defaults to {DEFAULT_BURST}.')
+    parser.add_argument('--formatted', action='store_true', help='Make the output .json to be somewhat readable')
+    parser.add_argument('--consistent', action='store_true',
+                        help='Fetch the pages again where players moved between pages while scraping.')
+    parser.add_argument('--skip-pp-plays', action='store_true', help='Do not try to gather top pp plays.')
+    parser.add_argument('--test', action='store_true', help='Just do tests')
+
+    args = parser.parse_args()
+
+    if args.test:
+        setup_logging(level=logging.DEBUG)
+
+    load_dotenv()
+
+    scrape_all(
+        countries=args.countries,
+        modes=args.modes,
+        workers=args.workers,
+        rate=args.rate,
+        burst=args.burst,
+        test=args.test,
+        pages=args.pages,
+        formatted=args.formatted,
+        consistent=args.consistent,
+        skip_pp_plays=args.skip_pp_plays,
+    )
@@ -0,0 +1,266 @@
+"""Disk cache for the osu! api responses, so reruns do not fetch everything again.
+
+The cache sits under the ossapi session as a requests adapter. Fresh
+responses are served from disk, stale ones are revalidated with their ETag or
+Last-Modified if the api gave one, and the oldest files are evicted once the
+cache gets too big.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+from ossapi import Ossapi
+from requests import PreparedRequest, Response
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from scripts.json_player_data import get_project_path
+from scripts.logging_config import logger
+from scripts.rate_limit import TokenBucket
+
+CACHE_DIR = '.cache/http'
+MAX_CACHE_SIZE = 200 * 1024 * 1024
+
+FOREVER = float('inf')
+
+# (url pattern, seconds a response stays fresh), first match wins. Endpoints
+# not listed here are never cached. The rankings are not, every scrape has to
+# see the pages as they are, and the consistent mode fetches them again seconds
+# after the first time to catch players that moved
+API_CACHE_TTLS: list[tuple[str, float]] = [
+    (r'/users/\d+/scores/', 10 * 60),
+    (r'/users/', 60 * 60),
+    # a score or a beatmap does not change once it is set or ranked
+    (r'/scores/', FOREVER),
+    (r'/beatmaps/', FOREVER),
+]
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """Takes a token from the bucket before every request that goes out."""
+
+    def __init__(self, rate_limiter: TokenBucket = None, **kwargs):
+        super().__init__(**kwargs)
+        self.rate_limiter = rate_limiter
+
+    def send(self, request: PreparedRequest, **kwargs) -> Response:
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire()
+
+        return super().send(request, **kwargs)
+
+
+class CachingAdapter(RateLimitedAdapter):
+    """Only the requests that miss the cache take from the rate limiter."""
+
+    def __init__(
+            self,
+            cache_dir: str,
+            ttls: list[tuple[str, float]] = None,
+            max_size: int = MAX_CACHE_SIZE,
+            **kwargs,
+    ):
+        super().__init__(**kwargs)
+
+        self.cache_dir = cache_dir
+        self.ttls = [(re.compile(pattern), ttl) for pattern, ttl in (ttls or API_CACHE_TTLS)]
+        self.max_size = max_size
+
+        # the consistent mode of the scraper fetches pages from several threads
+        self._lock = threading.Lock()
+        self._written = 0
+
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def get_ttl(self, request: PreparedRequest) -> float | None:
+        if request.method != 'GET':
+            return None
+
+        for pattern, ttl in self.ttls:
+            if pattern.search(request.path_url):
+                return ttl
+
+        return None
+
+    def get_cache_file(self, url: str) -> str:
+        # the token is on a header, so the url is enough to tell responses apart
+        return os.path.join(self.cache_dir, hashlib.blake2b(url.encode(), digest_size=16).hexdigest() + '.json')
+
+    def send(self, request: PreparedRequest, **kwargs) -> Response:
+        ttl = self.get_ttl(request)
+
+        if ttl is None:
+            return super().send(request, **kwargs)
+
+        cache_file = self.get_cache_file(request.url)
+        entry = self._read_entry(cache_file)
+
+        if entry is not None and time.time() - entry['stored_at'] < ttl:
+            self.hits += 1
+            logger.debug('cache hit for %s', request.url)
+
+            # recently used files are the last to be evicted
+            os.utime(cache_file)
+            return self._cached_response(request, entry)
+
+        if entry is not None:
+            if entry['headers'].get('ETag'):
+                request.headers['If-None-Match'] = entry['headers']['ETag']
+            if entry['headers'].get('Last-Modified'):
+                request.headers['If-Modified-Since'] = entry['headers']['Last-Modified']
+
+        response = super().send(request, **kwargs)
+
+        if response.status_code == 304 and entry is not None:
+            response.close()
+            self.revalidated += 1
+            logger.debug('cache revalidated for %s', request.url)
+
+            entry['stored_at'] = time.time()
+            self._write_entry(cache_file, entry)
+            return self._cached_response(request, entry)
+
+        self.misses += 1
+
+        if response.status_code == 200:
+            self._write_entry(cache_file, {
+                'url': request.url,
+                'stored_at': time.time(),
+                'headers': {
+                    key: value for key, value in response.headers.items()
+                    if key in ('Content-Type', 'ETag', 'Last-Modified')
+                },
+                'body': response.content.decode('utf-8'),
+            })
+
+        return response
+
+    def _cached_response(self, request: PreparedRequest, entry: dict) -> Response:
+        response = Response()
+        response.status_code = 200
+        response.headers = CaseInsensitiveDict(entry['headers'])
+        response._content = entry['body'].encode('utf-8')
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        response.connection = self
+
+        return response
+
+    def _read_entry(self, cache_file: str) -> dict | None:
+        try:
+            with open(cache_file) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def _write_entry(self, cache_file: str, entry: dict) -> None:
+        # several processes can share the cache, so the pid is in the name too
+        temp_file = f'{cache_file}.{os.getpid()}.{threading.get_ident()}.tmp'
+
+        with open(temp_file, 'w') as file:
+            json.dump(entry, file, separators=(',', ':'))
+        os.replace(temp_file, cache_file)
+
+        with self._lock:
+            self._written += 1
+            check_size = self._written % 50 == 1
+
+        if check_size:
+            self.evict()
+
+    def evict(self) -> int:
+        """Deletes the least recently used responses until the cache is under
+        its size limit.
+
+        Returns:
+            int: how many responses were deleted
+        """
+        with self._lock:
+            files = []
+            total_size = 0
+
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.endswith('.json'):
+                    stat = entry.stat()
+                    files.append((stat.st_mtime, stat.st_size, entry.path))
+                    total_size += stat.st_size
+
+            evicted = 0
+
+            for _, size, path in sorted(files):
+                if total_size <= self.max_size:
+                    break
+
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    # another process evicted it first
+                    pass
+
+                total_size -= size
+                evicted += 1
+
+        if evicted:
+            logger.debug('evicted %s cached responses', evicted)
+
+        return evicted
+
+
+class CachedOssapi(Ossapi):
+    """Ossapi with an adapter, like `CachingAdapter`, on its session. ossapi
+    replaces the session when it authenticates again, so the adapter is
+    mounted on every new one.
+    """
+
+    def __init__(self, *args, adapter: RateLimitedAdapter, **kwargs):
+        self.adapter = adapter
+        super().__init__(*args, **kwargs)
+
+    @property
+    def session(self):
+        return self._session
+
+    @session.setter
+    def session(self, session):
+        session.mount('https://', self.adapter)
+        self._session = session
+
+
+def create_api(use_cache: bool = None, rate_limiter: TokenBucket = None) -> Ossapi:
+    """Creates the api client from the OSU_CLIENT_ID and OSU_CLIENT_SECRET env variables.
+
+    Args:
+        use_cache (bool, optional): Cache the responses on disk. Defaults to
+            the API_CACHE env variable, on unless it is `0`.
+        rate_limiter (TokenBucket, optional): Limits the requests, can be shared with
+            other processes. Defaults to no limit.
+
+    Returns:
+        Ossapi: the client
+    """
+    client_id = os.getenv('OSU_CLIENT_ID')
+    client_secret = os.getenv('OSU_CLIENT_SECRET')
+
+    if use_cache is None:
+        use_cache = os.getenv('API_CACHE', '1') != '0'
+
+    if not use_cache and rate_limiter is None:
+        # noinspection PyTypeChecker
+        return Ossapi(client_id, client_secret)
+
+    if not use_cache:
+        # noinspection PyTypeChecker
+        return CachedOssapi(client_id, client_secret, adapter=RateLimitedAdapter(rate_limiter))
+
+    adapter = CachingAdapter(get_project_path(CACHE_DIR), rate_limiter=rate_limiter)
+
+    # noinspection PyTypeChecker
+    return CachedOssapi(client_id, client_secret, adapter=adapter)
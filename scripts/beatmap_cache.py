@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import os
+from typing import TYPE_CHECKING
+
+from scripts.json_player_data import RawPlayerDataCollection, get_json, get_project_path, write_json
+from scripts.logging_config import logger
+from scripts.migrations import BEATMAP_MAP
+
+if TYPE_CHECKING:
+    from ossapi import Beatmap, Ossapi, Score
+
+# the api takes at most this many ids per call
+BEATMAPS_PER_LOOKUP = 50
+
+# cache per mode and test flag, so it is only read from disk once
+_beatmap_caches: dict[tuple[str, bool], RawPlayerDataCollection] = {}
+
+
+def get_beatmap_cache_path(mode: str) -> str:
+    return f'docs/data/beatmaps/{mode}.json'
+
+
+def get_beatmap_cache(mode: str, test: bool = False) -> RawPlayerDataCollection:
+    """Gets every beatmap seen so far on the mode.
+
+    Args:
+        mode (str): osu/taiko/fruits/mania
+        test (bool, optional): Use data from tests/. Defaults to False.
+
+    Returns:
+        RawPlayerDataCollection: beatmap id to `BEATMAP_MAP` rows
+    """
+    if (mode, test) in _beatmap_caches:
+        return _beatmap_caches[(mode, test)]
+
+    cache = get_json(file_path=get_beatmap_cache_path(mode), test=test)
+
+    if cache is None:
+        cache = {
+            'file_version': 1,
+            'type': 'beatmaps',
+            'mode': mode,
+            'map': BEATMAP_MAP,
+            'key': 'beatmap_id',
+            'data': {},
+        }
+
+    _beatmap_caches[(mode, test)] = cache
+    return cache
+
+
+def save_beatmap_cache(mode: str, test: bool = False) -> str:
+    """Writes the beatmaps of the mode. Beatmaps another process saved since
+    the cache was read are kept, so shards of the same mode can share it.
+    """
+    cache = get_beatmap_cache(mode, test)
+    on_disk = get_json(file_path=get_beatmap_cache_path(mode), test=test) \
+        if os.path.exists(get_project_path(get_beatmap_cache_path(mode), test)) else None
+
+    if on_disk is not None:
+        for beatmap_id, row in on_disk['data'].items():
+            cache['data'].setdefault(beatmap_id, row)
+
+    return write_json(file_path=get_beatmap_cache_path(mode), data=cache, test=test)
+
+
+def get_beatmap_row(beatmap: Beatmap) -> list:
+    return [
+        beatmap.beatmapset_id,
+        beatmap.beatmapset().title,
+        beatmap.version,
+        beatmap.difficulty_rating,
+        str(beatmap.url),
+        beatmap.beatmapset().covers.cover,
+    ]
+
+
+def add_score_beatmaps(scores: list[Score], mode: str, test: bool = False) -> int:
+    """Adds the beatmaps of the scores to the cache, they come with the
+    scores so this needs no api calls. Known beatmaps are left alone.
+
+    Returns:
+        int: how many beatmaps were new
+    """
+    data = get_beatmap_cache(mode, test)['data']
+    added = 0
+
+    for score in scores:
+        beatmap_id = str(score.beatmap.id)
+
+        if beatmap_id in data:
+            continue
+
+        data[beatmap_id] = [
+            score.beatmapset.id,
+            score.beatmapset.title,
+            score.beatmap.version,
+            score.beatmap.difficulty_rating,
+            str(score.beatmap.url),
+            score.beatmapset.covers.cover,
+        ]
+        added += 1
+
+    return added
+
+
+def get_beatmaps(
+        beatmap_ids: list[int | str],
+        mode: str,
+        api: Ossapi = None,
+        test: bool = False,
+) -> dict[str, list]:
+    """Gets the metadata of the beatmaps from the cache. Unknown ones are
+    looked up in batches and added to it if an api client is given.
+
+    Args:
+        beatmap_ids (list[int | str]): The beatmap ids
+        mode (str): osu/taiko/fruits/mania
+        api (Ossapi, optional): To look unknown beatmaps up with. Defaults to None.
+        test (bool, optional): Use data from tests/. Defaults to False.
+
+    Returns:
+        dict[str, list]: beatmap id to its `BEATMAP_MAP` row, unknown beatmaps are left out
+    """
+    data = get_beatmap_cache(mode, test)['data']
+    beatmap_ids = list(dict.fromkeys(str(beatmap_id) for beatmap_id in beatmap_ids))
+
+    unknown_ids = [beatmap_id for beatmap_id in beatmap_ids if beatmap_id not in data]
+
+    if unknown_ids and api is not None:
+        logger.info('Looking up %s unknown beatmaps', len(unknown_ids))
+
+        for i in range(0, len(unknown_ids), BEATMAPS_PER_LOOKUP):
+            for beatmap in api.beatmaps([int(beatmap_id) for beatmap_id in unknown_ids[i:i + BEATMAPS_PER_LOOKUP]]):
+                data[str(beatmap.id)] = get_beatmap_row(beatmap)
+
+    return {beatmap_id: data[beatmap_id] for beatmap_id in beatmap_ids if beatmap_id in data}
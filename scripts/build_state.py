@@ -0,0 +1,77 @@
+"""Helpers for the scripts that only redo the work whose inputs changed.
+
+Their state keeps the hash of every file they read under `files`, and the
+hash of the inputs of every output they wrote under `outputs`.
+"""
+import hashlib
+import os
+import time
+from concurrent.futures import Executor, as_completed
+
+from scripts.json_player_data import get_project_path
+from scripts.logging_config import logger
+
+
+def get_file_hash(file_path: str, state: dict, test: bool, missing_ok: bool = False) -> str:
+    """Hashes a project root relative file. The hash is reused as long as
+    the file's mtime and size did not change since the last run.
+
+    Args:
+        file_path (str): Project root relative path
+        state (dict): The state with the cached hashes, under `files`
+        test (bool): Use tests/ instead
+        missing_ok (bool, optional): Hash a missing file as `''` instead of
+            raising `OSError`. Defaults to False.
+
+    Returns:
+        str: the hash
+    """
+    full_path = get_project_path(file_path, test)
+
+    try:
+        stat = os.stat(full_path)
+    except OSError:
+        if missing_ok:
+            return ''
+        raise
+
+    cached = state['files'].get(file_path)
+    if cached is not None and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        return cached[2]
+
+    with open(full_path, 'rb') as file:
+        digest = hashlib.blake2b(file.read(), digest_size=16).hexdigest()
+
+    state['files'][file_path] = [stat.st_mtime_ns, stat.st_size, digest]
+    return digest
+
+
+def combine_hashes(*parts) -> str:
+    return hashlib.blake2b('|'.join(str(part) for part in parts).encode(), digest_size=16).hexdigest()
+
+
+def is_fresh(output_path: str, source_hash: str, state: dict, test: bool) -> bool:
+    return state['outputs'].get(output_path) == source_hash and os.path.exists(get_project_path(output_path, test))
+
+
+def chunked(items: list, size: int) -> list[list]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def run_chunks(pool: Executor, name: str, worker, jobs: list[tuple], total: int) -> list:
+    """Runs the jobs on the pool, logging the progress as chunks finish.
+    Every job's result is a list, `total` is their lengths added up.
+    """
+    results = []
+    done = 0
+    start_time = time.time()
+
+    futures = [pool.submit(worker, *job) for job in jobs]
+
+    for future in as_completed(futures):
+        result = future.result()
+        results.append(result)
+        done += len(result)
+        logger.info('%s: %s/%s written (%.2fs)', name, done, total, time.time() - start_time)
+
+    return results
@@ -0,0 +1,339 @@
+import os
+from datetime import datetime, timedelta
+
+from scripts.json_player_data import (
+    ComparisonAndMappedData,
+    MappedPlayerDataCollection,
+    RawPlayerDataCollection,
+    compare_player_data,
+    dump_to_file,
+    get_data_at_date,
+    get_data_file_path,
+    get_file_stem,
+    get_manifest,
+    get_nearest_date,
+    get_project_path,
+    map_player_data,
+    remove_from_manifest,
+)
+from scripts.logging_config import logger
+
+# stats carried forward on the index, every one of them is either a counter
+# or a rank so the gain between two rows is just a subtraction
+CUMULATIVE_STATS = [
+    'country_rank',
+    'global_rank',
+    'pp',
+    'acc',
+    'play_count',
+    'rank_x',
+    'rank_s',
+    'rank_a',
+    'play_time',
+    'total_score',
+    'ranked_score',
+    'total_hits',
+]
+
+
+def build_cumulative_index(
+        latest_data: RawPlayerDataCollection,
+        previous_index: RawPlayerDataCollection | None = None,
+) -> RawPlayerDataCollection:
+    """Builds the cumulative index for the latest rankings.
+
+    The index has a row for every player that was ever seen on the rankings,
+    holding their stats the last time they were seen. Players on the latest
+    rankings get their row overwritten, everyone else is carried forward from
+    the previous index, so building a day only costs O(players).
+
+    Args:
+        latest_data (RawPlayerDataCollection): The latest rankings
+        previous_index (RawPlayerDataCollection, optional): The index before the latest rankings
+
+    Returns:
+        RawPlayerDataCollection: the index, `last_seen` is the `update_date` of
+        the rankings the player was last seen on
+    """
+    value_mapping = ['ign', 'last_seen', *CUMULATIVE_STATS]
+
+    index: RawPlayerDataCollection = {
+        'file_version': 1,
+        'type': 'cumulative',
+        'update_date': latest_data['update_date'],
+        'mode': latest_data['mode'],
+        'country': latest_data['country'],
+        'map': value_mapping,
+        'key': 'id',
+        'data': {},
+    }
+
+    if previous_index is not None:
+        if previous_index['map'] == value_mapping:
+            index['data'].update(previous_index['data'])
+        else:
+            for uid, player in map_player_data(previous_index).items():
+                index['data'][uid] = [player.get(stat, 0) for stat in value_mapping]
+
+    last_seen = latest_data['update_date']
+
+    for uid, player in map_player_data(latest_data).items():
+        index['data'][uid] = [
+            player['ign'],
+            last_seen,
+            *[player.get(stat, 0) for stat in CUMULATIVE_STATS],
+        ]
+
+    return index
+
+
+def build_cumulative_indexes(
+        dates: list[str],
+        country: str,
+        mode: str,
+        previous_index: RawPlayerDataCollection | None = None,
+        test: bool = False,
+) -> list[tuple[str, RawPlayerDataCollection]]:
+    """Builds the index for each of the dates in order, each one on top of
+    the one before it.
+
+    Args:
+        dates (list[str]): Dates in YYYY/MM/DD format that have rankings, oldest first
+        country (str): 2 Letter country code
+        mode (str): osu/taiko/fruits/mania
+        previous_index (RawPlayerDataCollection, optional): The index before the first date
+        test (bool, optional): Use data from tests/. Defaults to False.
+
+    Returns:
+        list[tuple[str, RawPlayerDataCollection]]: the date and index
+    """
+    indexes = []
+
+    for date in dates:
+        latest_data = get_data_at_date(date=date, country=country, mode=mode, test=test)
+
+        if latest_data is None:
+            continue
+
+        previous_index = build_cumulative_index(latest_data, previous_index)
+        indexes.append((date, previous_index))
+
+    return indexes
+
+
+def get_kept_index_dates(dates: list[str]) -> set[str]:
+    """The dates whose index is kept in docs/data: the first one of every
+    week and the latest. The ones in between are built again from the
+    rankings when they are needed, see `get_cumulative_index()`.
+
+    Args:
+        dates (list[str]): Dates in YYYY/MM/DD format that have an index, oldest first
+
+    Returns:
+        set[str]: the dates to keep
+    """
+    kept = set(dates[-1:])
+    weeks = set()
+
+    for date in dates:
+        week = datetime.strptime(date, '%Y/%m/%d').isocalendar()[:2]
+
+        if week not in weeks:
+            weeks.add(week)
+            kept.add(date)
+
+    return kept
+
+
+def get_index_sources(date: datetime | str, country: str, mode: str, test: bool = False) -> tuple[str | None, list[str]]:
+    """What the index at the date is built from.
+
+    Returns:
+        tuple[0]: the date of the closest kept index on or before it, `None` if there is none
+        tuple[1]: the dates of the rankings after that index, up to the date
+    """
+    if isinstance(date, datetime):
+        date = date.strftime('%Y/%m/%d')
+
+    index_date = get_nearest_date(date=date, country=country, mode=mode, file_type='cumulative', test=test)
+    rankings_dates = get_manifest(test).get(get_file_stem(country, mode), [])
+
+    return index_date, [day for day in rankings_dates if (index_date is None or day > index_date) and day <= date]
+
+
+def get_cumulative_index(
+        date: datetime | str,
+        country: str,
+        mode: str,
+        test: bool = False,
+) -> RawPlayerDataCollection | None:
+    """The index as of the date, from the closest kept index with the rankings
+    after it added on top.
+
+    Args:
+        date (datetime | str): The date, a string should be in YYYY/MM/DD format
+        country (str): 2 Letter country code
+        mode (str): osu/taiko/fruits/mania
+        test (bool, optional): Use data from tests/. Defaults to False.
+
+    Returns:
+        RawPlayerDataCollection | None: the index, `None` if there is no kept index
+        on or before the date. Do not modify it, it can be the cached file.
+    """
+    index_date, rankings_dates = get_index_sources(date, country, mode, test)
+
+    if index_date is None:
+        return None
+
+    index = get_data_at_date(date=index_date, country=country, mode=mode, file_type='cumulative', test=test)
+    indexes = build_cumulative_indexes(rankings_dates, country, mode, index, test)
+
+    return indexes[-1][1] if indexes else index
+
+
+def prune_cumulative_indexes(country: str, mode: str, test: bool = False) -> int:
+    """Deletes the indexes that are not kept, see `get_kept_index_dates()`.
+
+    Returns:
+        int: how many were deleted
+    """
+    dates = list(get_manifest(test).get(get_file_stem(country, mode, 'cumulative'), []))
+    kept = get_kept_index_dates(dates)
+    removed = 0
+
+    for date in dates:
+        if date in kept:
+            continue
+
+        full_path = get_project_path(get_data_file_path(date=date, country=country, mode=mode, file_type='cumulative'), test)
+
+        if os.path.exists(full_path):
+            os.remove(full_path)
+
+        remove_from_manifest(date=date, country=country, mode=mode, file_type='cumulative', test=test)
+        removed += 1
+
+    return removed
+
+
+def update_cumulative_index(
+        date: datetime,
+        country: str,
+        mode: str,
+        test: bool = False,
+        formatted: bool = False,
+) -> str | None:
+    """Builds and writes the cumulative index for the rankings at the date,
+    on top of the index of the day before. The index before it is deleted
+    if it is not kept.
+
+    Args:
+        date (datetime): The date of the rankings
+        country (str): 2 Letter country code
+        mode (str): osu/taiko/fruits/mania
+        test (bool, optional): Use data from tests/. Defaults to False.
+        formatted (bool, optional): Make the output .json somewhat readable. Defaults to False.
+
+    Returns:
+        str | None: the output file, `None` if there are no rankings for the date
+    """
+    latest_data = get_data_at_date(date=date.strftime('%Y/%m/%d'), country=country, mode=mode, test=test)
+
+    if latest_data is None:
+        logger.warning('No rankings for %s to build the cumulative index from', date.strftime('%Y/%m/%d'))
+        return None
+
+    previous_index = get_cumulative_index(date - timedelta(days=1), country=country, mode=mode, test=test)
+
+    if previous_index is None:
+        logger.info('No older cumulative index, starting a new one')
+
+    index = build_cumulative_index(latest_data, previous_index)
+    output_file = dump_to_file(data=index, test=test, formatted=formatted, date=date)
+
+    removed = prune_cumulative_indexes(country, mode, test)
+    logger.debug('%s old cumulative indexes deleted', removed)
+
+    return output_file
+
+
+def get_cumulative_difference(
+        latest_index: RawPlayerDataCollection,
+        comparison_index: RawPlayerDataCollection,
+) -> tuple[MappedPlayerDataCollection, MappedPlayerDataCollection, MappedPlayerDataCollection]:
+    """Compares two cumulative indexes, only for the players present on the
+    latest rankings.
+
+    Args:
+        latest_index (RawPlayerDataCollection): The newer index
+        comparison_index (RawPlayerDataCollection): The older index
+
+    Returns:
+        tuple[0]: the latest players' stats
+        tuple[1]: every player's stats on the older index
+        tuple[2]: the difference, same shape as `compare_player_data()`
+    """
+    latest_update = latest_index['update_date']
+
+    latest_mapped_data: MappedPlayerDataCollection = {}
+
+    for uid, player in map_player_data(latest_index).items():
+        last_seen = player.pop('last_seen')
+
+        # not on the latest rankings, only carried forward
+        if last_seen != latest_update:
+            continue
+
+        latest_mapped_data[uid] = player
+
+    comparison_mapped_data = map_player_data(comparison_index)
+
+    data_difference = compare_player_data(latest_mapped_data, comparison_mapped_data)
+
+    return latest_mapped_data, comparison_mapped_data, data_difference
+
+
+def get_range_difference(
+        start_date: datetime,
+        end_date: datetime,
+        country: str,
+        mode: str,
+        test: bool = False,
+) -> ComparisonAndMappedData:
+    """Gets the gains between any two dates by subtracting their cumulative
+    indexes. Dates without rankings fall back to the closest older rankings.
+
+    Args:
+        start_date (datetime): The older date
+        end_date (datetime): The newer date
+        country (str): 2 Letter country code
+        mode (str): osu/taiko/fruits/mania
+        test (bool, optional): Use data from tests/. Defaults to False.
+
+    Returns:
+        ComparisonAndMappedData: same as `get_comparison_and_mapped_data()`
+    """
+    latest_index = get_cumulative_index(end_date, country=country, mode=mode, test=test)
+    comparison_index = get_cumulative_index(start_date, country=country, mode=mode, test=test)
+
+    if latest_index is None or comparison_index is None:
+        return ComparisonAndMappedData(
+            latest_mapped_data=None,
+            comparison_mapped_data=None,
+            data_difference=None,
+            latest_data_timestamp=None,
+            comparison_data_timestamp=None,
+        )
+
+    latest_mapped_data, comparison_mapped_data, data_difference = get_cumulative_difference(
+        latest_index=latest_index,
+        comparison_index=comparison_index,
+    )
+
+    return ComparisonAndMappedData(
+        latest_mapped_data=latest_mapped_data,
+        comparison_mapped_data=comparison_mapped_data,
+        data_difference=data_difference,
+        latest_data_timestamp=latest_index['update_date'],
+        comparison_data_timestamp=comparison_index['update_date'],
+    )
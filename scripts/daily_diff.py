@@ -0,0 +1,184 @@
+from datetime import datetime
+
+from scripts.json_player_data import (
+    ComparisonAndMappedData,
+    RawPlayerDataCollection,
+    dump_to_file,
+    get_comparison_and_mapped_data,
+    get_data_at_date,
+)
+from scripts.logging_config import logger
+
+
+def build_daily_diff(
+        processed_data: ComparisonAndMappedData,
+        country: str,
+        mode: str,
+) -> RawPlayerDataCollection:
+    """Turns a comparison into the diff file, so it only has to be computed
+    once for the scraper, the webhook and the site.
+
+    On top of the usual `map`/`data` of per-player differences, it has:
+    ```
+    comparison_date: float  # update_date of the older rankings
+    new_entries: list[[id, ign, country_rank]]
+    aggregates: {stat: {'count': players who gained, 'total': sum of gains}}
+    top_map: ['id', 'ign', 'gain', 'old', 'new']
+    top: {stat: list[top_map rows]}  # only gains above 0, highest first
+    ```
+
+    Args:
+        processed_data (ComparisonAndMappedData): From `get_comparison_and_mapped_data()`
+        country (str): 2 Letter country code
+        mode (str): osu/taiko/fruits/mania
+
+    Returns:
+        RawPlayerDataCollection: the diff
+    """
+    latest_mapped_data = processed_data.latest_mapped_data
+    comparison_mapped_data = processed_data.comparison_mapped_data
+    data_difference = processed_data.data_difference
+
+    stats = []
+    for player in latest_mapped_data.values():
+        stats = [stat for stat in player if stat != 'ign']
+        break
+
+    # names are already on the top lists and new entries, no need to repeat them
+    value_mapping = ['new_entry', *stats]
+
+    diff: RawPlayerDataCollection = {
+        'file_version': 1,
+        'type': 'diff',
+        'update_date': processed_data.latest_data_timestamp,
+        'comparison_date': processed_data.comparison_data_timestamp,
+        'mode': mode,
+        'country': country,
+        'map': value_mapping,
+        'key': 'id',
+        'data': {},
+        'new_entries': [],
+        'aggregates': {},
+        'top_map': ['id', 'ign', 'gain', 'old', 'new'],
+        'top': {},
+    }
+
+    for uid, player in data_difference.items():
+        diff['data'][uid] = [_round_stat(player.get(stat, 0)) for stat in value_mapping]
+
+        if player['new_entry']:
+            diff['new_entries'].append([uid, player['ign'], latest_mapped_data[uid]['country_rank']])
+
+    diff['new_entries'].sort(key=lambda entry: entry[2])
+
+    for stat in stats:
+        gainers = sorted(
+            [uid for uid in data_difference if data_difference[uid].get(stat, 0) > 0],
+            key=lambda uid: data_difference[uid][stat],
+            reverse=True,
+        )
+
+        diff['aggregates'][stat] = {
+            'count': len(gainers),
+            'total': _round_stat(sum(data_difference[uid][stat] for uid in gainers)),
+        }
+
+        diff['top'][stat] = [
+            [
+                uid,
+                data_difference[uid]['ign'],
+                _round_stat(data_difference[uid][stat]),
+                comparison_mapped_data[uid].get(stat, 0),
+                latest_mapped_data[uid][stat],
+            ]
+            for uid in gainers
+        ]
+
+    return diff
+
+
+def _round_stat(value):
+    # float noise from subtracting accuracies just bloats the file
+    if isinstance(value, float):
+        return round(value, 4)
+
+    return value
+
+
+def get_daily_diff(
+        date: datetime,
+        country: str,
+        mode: str,
+        test: bool = False,
+) -> RawPlayerDataCollection | None:
+    """Gets the diff file for the date, computing it from the rankings if it
+    was not written yet.
+
+    Args:
+        date (datetime): The date of the latest rankings
+        country (str): 2 Letter country code
+        mode (str): osu/taiko/fruits/mania
+        test (bool, optional): Use data from tests/. Defaults to False.
+
+    Returns:
+        RawPlayerDataCollection | None: the diff, `None` if either rankings are missing
+    """
+    diff = get_data_at_date(
+        date=date.strftime('%Y/%m/%d'),
+        country=country,
+        mode=mode,
+        file_type='diff',
+        test=test,
+    )
+
+    if diff is not None:
+        return diff
+
+    processed_data = get_comparison_and_mapped_data(
+        base_date=date,
+        compare_date_offset=1,
+        country=country,
+        mode=mode,
+        test=test,
+    )
+
+    if processed_data.data_difference is None:
+        return None
+
+    return build_daily_diff(processed_data, country=country, mode=mode)
+
+
+def update_daily_diff(
+        date: datetime,
+        country: str,
+        mode: str,
+        test: bool = False,
+        formatted: bool = False,
+) -> str | None:
+    """Computes and writes the diff file for the rankings at the date.
+
+    Args:
+        date (datetime): The date of the latest rankings
+        country (str): 2 Letter country code
+        mode (str): osu/taiko/fruits/mania
+        test (bool, optional): Use data from tests/. Defaults to False.
+        formatted (bool, optional): Make the output .json somewhat readable. Defaults to False.
+
+    Returns:
+        str | None: the output file, `None` if either rankings are missing
+    """
+    processed_data = get_comparison_and_mapped_data(
+        base_date=date,
+        compare_date_offset=1,
+        country=country,
+        mode=mode,
+        test=test,
+    )
+
+    if processed_data.data_difference is None:
+        logger.info('Incomplete data for the diff, skipping')
+        return None
+
+    diff = build_daily_diff(processed_data, country=country, mode=mode)
+
+    return dump_to_file(data=diff, test=test, formatted=formatted, date=date)
@@ -1,8 +1,23 @@
 import os
-import requests
-from typing import TypedDict, NotRequired
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, TypedDict, NotRequired
+
 from scripts.logging_config import logger
 
+if TYPE_CHECKING:
+    import requests
+
+# https://discord.com/developers/docs/resources/message#embed-object-embed-limits
+MAX_EMBEDS_PER_MESSAGE = 10
+MAX_EMBED_CHARS = 6000
+
+MAX_RETRIES = 5
+# seconds, doubled on every retry of an error that is not a rate limit
+RETRY_DELAY = 1
+
 
 class EmbedAuthor(TypedDict):
     name: NotRequired[str]
@@ -56,31 +71,226 @@ def embed_maker(
     }
 
 
+class WebhookMessage(TypedDict):
+    content: NotRequired[str]
+    embeds: list[Embed]
+    username: NotRequired[str]
+    avatar_url: NotRequired[str]
+
+
+def get_webhook_urls() -> list[str]:
+    """Gets the webhook urls from the WEBHOOK_URL env variable, several can
+    be given separated by commas or whitespace.
+    """
+    return [url for url in re.split(r'[\s,]+', os.getenv('WEBHOOK_URL') or '') if url]
+
+
+def embed_length(embed: Embed) -> int:
+    """Counts the characters of an embed the way Discord does for its limit."""
+    length = len(embed.get('title', '')) + len(embed.get('description', ''))
+    length += len(embed.get('footer', {}).get('text', '')) + len(embed.get('author', {}).get('name', ''))
+
+    for field in embed.get('fields', []):
+        length += len(field['name']) + len(field['value'])
+
+    return length
+
+
+def pack_messages(messages: list[WebhookMessage]) -> list[WebhookMessage]:
+    """Packs the embeds of consecutive messages from the same username and
+    avatar into as few messages as Discord allows, keeping their order. The
+    content of a message only goes with its own embeds.
+
+    Args:
+        messages (list[WebhookMessage]): The messages, in the order to send them
+
+    Returns:
+        list[WebhookMessage]: the packed messages
+    """
+    packed: list[WebhookMessage] = []
+    length = 0
+
+    for message in messages:
+        last = packed[-1] if packed else None
+
+        if (
+                last is None
+                or message.get('content')
+                or (last.get('username'), last.get('avatar_url')) != (message.get('username'), message.get('avatar_url'))
+        ):
+            last = {**message, 'embeds': []}
+            packed.append(last)
+            length = 0
+
+        for embed in message.get('embeds') or []:
+            if len(last['embeds']) == MAX_EMBEDS_PER_MESSAGE or length + embed_length(embed) > MAX_EMBED_CHARS:
+                last = {key: value for key, value in last.items() if key != 'content'}
+                last['embeds'] = []
+                packed.append(last)
+                length = 0
+
+            last['embeds'].append(embed)
+            length += embed_length(embed)
+
+    return packed
+
+
+class WebhookSender:
+    """Sends webhook messages over one pooled session, to every url at the
+    same time. Messages are queued and packed together on `flush()`.
+
+    Waits out Discord's rate limits: the remaining requests of each bucket
+    are tracked from the response headers, and a 429 is retried after its
+    `retry_after`. Other failures are retried with a growing delay.
+    """
+
+    def __init__(self, urls: list[str] = None, max_retries: int = MAX_RETRIES):
+        self.urls = get_webhook_urls() if urls is None else urls
+        self.max_retries = max_retries
+        self.messages: list[WebhookMessage] = []
+
+        # imported here, requests takes longer to import than the rest of the script
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.session = requests.Session()
+        self.session.mount('https://', HTTPAdapter(pool_maxsize=max(len(self.urls), 1)))
+        self.session.mount('http://', HTTPAdapter(pool_maxsize=max(len(self.urls), 1)))
+
+        # url -> bucket, bucket -> (remaining requests, monotonic time it resets)
+        self._url_buckets: dict[str, str] = {}
+        self._buckets: dict[str, tuple[int, float]] = {}
+        self._lock = threading.Lock()
+
+    def queue(
+            self,
+            content: str = None,
+            embeds: list[Embed] = None,
+            username: str = None,
+            avatar_url: str = None,
+    ) -> None:
+        message = {'content': content, 'embeds': embeds or [], 'username': username, 'avatar_url': avatar_url}
+        self.messages.append({key: value for key, value in message.items() if value is not None})
+
+    def flush(self) -> bool:
+        """Sends the queued messages to every url.
+
+        Returns:
+            bool: whether every message reached every url
+        """
+        messages = pack_messages(self.messages)
+        self.messages = []
+
+        if len(self.urls) == 0:
+            logger.error('No webhook url found. Not sending anything.')
+            return False
+
+        if len(messages) == 0:
+            return True
+
+        # every url gets its messages in order, the urls go at the same time
+        with ThreadPoolExecutor(max_workers=len(self.urls)) as pool:
+            results = list(pool.map(lambda url: all([self.post(url, message) for message in messages]), self.urls))
+
+        return all(results)
+
+    def post(self, url: str, message: WebhookMessage) -> bool:
+        """Sends a message to a url, waiting out rate limits and retrying failures.
+
+        Returns:
+            bool: whether it was sent
+        """
+        import requests
+
+        delay = RETRY_DELAY
+
+        for attempt in range(self.max_retries + 1):
+            self._wait_for_bucket(url)
+
+            try:
+                response = self.session.post(url, json=message, timeout=30)
+            except requests.RequestException as e:
+                logger.warning('Webhook request failed, attempt %s: %s', attempt + 1, e)
+                time.sleep(delay)
+                delay *= 2
+                continue
+
+            self._update_bucket(url, response)
+
+            if response.status_code in (200, 204):
+                logger.info('Webhook sent. [[ %s ]]', message.get('username'))
+                return True
+
+            if response.status_code == 429:
+                retry_after = self._get_retry_after(response)
+                logger.warning('Rate limited by Discord, retrying in %.2fs', retry_after)
+                time.sleep(retry_after)
+                continue
+
+            if response.status_code < 500:
+                # the message itself is wrong, sending it again will not help
+                logger.error('Failed to send webhook. Status code: %s %s', response.status_code, response.text)
+                return False
+
+            logger.warning('Webhook failed with status code %s, attempt %s', response.status_code, attempt + 1)
+            time.sleep(delay)
+            delay *= 2
+
+        logger.error('Failed to send webhook after %s attempts. [[ %s ]]',
+                     self.max_retries + 1, message.get('username'))
+        return False
+
+    def _wait_for_bucket(self, url: str) -> None:
+        with self._lock:
+            bucket = self._url_buckets.get(url, url)
+            remaining, reset_at = self._buckets.get(bucket, (1, 0))
+
+            wait = reset_at - time.monotonic() if remaining <= 0 else 0
+
+            # claim the request, so other threads on the bucket wait too
+            if remaining > 0:
+                self._buckets[bucket] = (remaining - 1, reset_at)
+
+        if wait > 0:
+            logger.debug('Waiting %.2fs for the rate limit of %s', wait, bucket)
+            time.sleep(wait)
+
+    def _update_bucket(self, url: str, response: 'requests.Response') -> None:
+        headers = response.headers
+
+        if 'X-RateLimit-Remaining' not in headers:
+            return
+
+        with self._lock:
+            bucket = headers.get('X-RateLimit-Bucket', url)
+            self._url_buckets[url] = bucket
+            self._buckets[bucket] = (
+                int(headers['X-RateLimit-Remaining']),
+                time.monotonic() + float(headers.get('X-RateLimit-Reset-After', 0)),
+            )
+
+    @staticmethod
+    def _get_retry_after(response: 'requests.Response') -> float:
+        try:
+            return float(response.json()['retry_after'])
+        except (ValueError, KeyError, TypeError):
+            return float(response.headers.get('Retry-After', 1))
+
+
 def send_webhook(
         content: str = None,
         embeds: list[Embed] = None,
         username: str = None,
-        avatar_url: str = None
+        avatar_url: str = None,
+        sender: WebhookSender = None,
 ):
-    webhook_url = os.getenv('WEBHOOK_URL')
-
-    if webhook_url is None:
-        logger.error('No webhook url found. Not sending anything.')
+    """Sends a webhook message right away, or queues it on the sender to be
+    packed with the others and sent on its `flush()`.
+    """
+    if sender is not None:
+        sender.queue(content=content, embeds=embeds, username=username, avatar_url=avatar_url)
         return
 
-    payload = {
-        'username': username,
-        'avatar_url': avatar_url,
-        'embeds': embeds,
-        'content': content,
-    }
-
-    response = requests.post(
-        webhook_url,
-        json=payload
-    )
-
-    if response.status_code == 204:
-        logger.info(f'Webhook sent. [[ {username} ]]')
-    else:
-        logger.error(f'Failed to send webhook. Status code: {response.status_code}')
+    sender = WebhookSender()
+    sender.queue(content=content, embeds=embeds, username=username, avatar_url=avatar_url)
+    sender.flush()
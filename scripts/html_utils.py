@@ -1,6 +1,22 @@
+import io
 import os
+import re
+from functools import lru_cache
+from typing import Iterable, Iterator, TextIO
+
 from scripts.logging_config import logger
 
+# `{{__name__}}`, split on it the names land on the odd indexes
+PLACEHOLDER_PATTERN = re.compile(r'\{\{__(\w+?)__\}\}')
+
+NON_CLOSING_TAGS = frozenset([
+    'br',
+    'hr',
+    'img',
+    'input',
+    'link',
+])
+
 
 def elem(
         tag_name: str,
@@ -35,14 +51,6 @@ def elem(
         ```
     """
 
-    non_closing_tags = [
-        'br',
-        'hr',
-        'img',
-        'input',
-        'link',
-    ]
-
     full_content = ''.join(content)
 
     attrs = ' '.join([
@@ -56,7 +64,7 @@ def elem(
     else:
         head = tag_name
 
-    if tag_name in non_closing_tags:
+    if tag_name in NON_CLOSING_TAGS:
         return f'<{head}/>'
     else:
         return f'<{head}>{full_content}</{tag_name}>'
@@ -79,19 +87,103 @@ def table_row(
     return elem('tr', *td, **attributes)
 
 
+def table_rows(
+        rows: Iterable[Iterable[str]],
+        cell_tag: str = 'td',
+) -> Iterator[str]:
+    """Create many `tr` elements at once, for big tables. Meant to be given
+    straight to a template, so the rows are never joined into one string.
+
+    Args:
+        rows (Iterable[Iterable[str]]): the contents of the cells of each row
+        cell_tag (str, optional): `td` or `th`. Defaults to 'td'.
+
+    Returns:
+        Iterator[str]: the `tr` elements
+    """
+    open_cell = f'<{cell_tag}>'
+    between_cells = f'</{cell_tag}><{cell_tag}>'
+    close_row = f'</{cell_tag}></tr>'
+
+    for row in rows:
+        yield f'<tr>{open_cell}{between_cells.join(row)}{close_row}'
+
+
+class Template:
+    """A template parsed once into its literal text and placeholders, so
+    rendering it is a single pass over the chunks.
+
+    A variable can be a string, or an iterable of strings like
+    `table_rows()` that is written piece by piece. Placeholders without a
+    variable are left as they are.
+    """
+
+    def __init__(self, source: str):
+        # literal, name, literal, name, ..., literal
+        self.chunks = PLACEHOLDER_PATTERN.split(source)
+
+    def stream(self, file: TextIO, **variables) -> None:
+        """Writes the rendered template to an open file."""
+        for i, chunk in enumerate(self.chunks):
+            if i % 2 == 0:
+                file.write(chunk)
+            elif chunk not in variables:
+                file.write('{{__' + chunk + '__}}')
+            else:
+                value = variables[chunk]
+
+                if isinstance(value, str):
+                    file.write(value)
+                elif isinstance(value, Iterable):
+                    file.writelines(map(str, value))
+                else:
+                    file.write(str(value))
+
+    def render(self, **variables) -> str:
+        """Renders the template to a string."""
+        buffer = io.StringIO()
+        self.stream(buffer, **variables)
+        return buffer.getvalue()
+
+
+@lru_cache(maxsize=32)
+def _parse_template(full_path: str, mtime_ns: int) -> Template:
+    with open(full_path, encoding='utf-8') as file:
+        return Template(file.read())
+
+
+def load_template(template_path: str) -> Template | None:
+    """Gets a parsed template, it is only read and parsed again when the file changes.
+
+    Args:
+        template_path (str): A project root relative path to the template
+
+    Returns:
+        Template | None: the template, None if it does not exist
+    """
+    full_path = os.path.join(os.path.dirname(__file__), '../' + template_path)
+
+    try:
+        return _parse_template(full_path, os.stat(full_path).st_mtime_ns)
+    except OSError:
+        logger.warning('Supplied template does not exist.')
+        return None
+
+
 def create_page_from_template(
         template_path: str,
         output_path: str,
-        **variables: str,
+        **variables: str | Iterable[str],
 ) -> str | None:
     """Create a page from a template with the supplied variables.
 
     Args:
         template_path (str): A project root relative path to the template
         output_path (str): The output file, path also relative to the project root
-        **variables (str): Variables to be supplied to the template.
+        **variables (str | Iterable[str]): Variables to be supplied to the template.
         
         Templates should have `{{__name__}}` on them, `name` is the variable.
+        Iterables, like the rows from `table_rows()`, are streamed to the file.
         
         index.template.html:
         ```html
@@ -113,47 +205,44 @@ def create_page_from_template(
         str | None: the output path if the operation succeeds, None if otherwise
     """
 
-    current_dir = os.path.dirname(__file__)
-    template_path = os.path.join(current_dir, '../' + template_path)
+    template = load_template(template_path)
 
-    try:
-        with open(template_path) as file:
-            html_template = file.read()
-    except OSError:
-        logger.warning('Supplied template does not exist.')
-        return None
-    except:
-        logger.error('Unexpected error occured')
+    if template is None:
         return None
 
-    for var in variables:
-        html_template = html_template.replace(
-            '{{__' + var + '__}}',
-            str(variables[var])
-        )
-
-    full_output_path = os.path.join(current_dir, '../', output_path)
+    full_output_path = os.path.join(os.path.dirname(__file__), '../', output_path)
     os.makedirs(os.path.dirname(full_output_path), exist_ok=True)
-    with open(output_path, 'w', encoding='utf-8') as file:
-        file.write(html_template)
+    with open(full_output_path, 'w', encoding='utf-8') as file:
+        template.stream(file, **variables)
 
-    logger.info('Created html file at: ' + output_path)
+    logger.info('Created html file at: %s', output_path)
     return full_output_path
 
 
 if __name__ == '__main__':
-    h1_expect = '<h1 id="hhhhh" dumb-attribute="some value">meow quack</h1>'
+    h1_expect = '<h1 id="hhhhh" dumb-attribute="some value">meowquack</h1>'
     h1_actual = elem('h1', 'meow', 'quack', id='hhhhh', **{
         'dumb-attribute': 'some value'
     })
     assert h1_expect == h1_actual, f'Output mismatch:\n{h1_expect}\n{h1_actual}'
 
-    tr_expect = '<tr data-gggg="quack">owo uwu nyaa</tr>'
+    tr_expect = '<tr data-gggg="quack">owouwunyaa</tr>'
     tr_actual = table_row('owo', 'uwu', 'nyaa', **{'data-gggg': 'quack'})
     assert tr_expect == tr_actual, f'Output mismatch:\n{tr_expect}\n{tr_actual}'
 
+    rows_expect = '<tr><td>1</td><td>owo</td></tr><tr><td>2</td><td>uwu</td></tr>'
+    rows_actual = ''.join(table_rows([['1', 'owo'], ['2', 'uwu']]))
+    assert rows_expect == rows_actual, f'Output mismatch:\n{rows_expect}\n{rows_actual}'
+
+    page_expect = '<p>now</p><table><tr><td>1</td></tr></table>{{__missing__}}'
+    page_actual = Template('<p>{{__updated_at__}}</p><table>{{__rows__}}</table>{{__missing__}}').render(
+        updated_at='now',
+        rows=table_rows([['1']]),
+    )
+    assert page_expect == page_actual, f'Output mismatch:\n{page_expect}\n{page_actual}'
+
     create_page_from_template(
-        'docs/main-page.template.html',
+        'docs/templates/main-page.template.html',
         'tests/test.test.html',
         updated_at='now'
     )
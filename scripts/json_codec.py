@@ -0,0 +1,145 @@
+"""Reads and writes json with the fastest library that is installed.
+
+orjson is used if it is installed, then msgspec, then the json module. Set
+`JSON_CODEC` to `orjson`, `msgspec` or `json` to pick one. They all read the
+same data. orjson and msgspec also write the same values, but floats under
+0.0001 are written without an exponent and characters outside of ascii are
+written as they are instead of escaped.
+
+msgspec can also decode straight into a TypedDict like
+`RawPlayerDataCollection`, checking the shape on the way. Keys the TypedDict
+does not have are dropped, so only use it with a type that lists every key
+of the file.
+"""
+import json
+import os
+from functools import lru_cache
+from typing import Any, Callable, NamedTuple
+
+from scripts.logging_config import logger
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+CODEC_ENV = 'JSON_CODEC'
+
+# in order of preference
+CODECS = ['orjson', 'msgspec', 'json']
+
+
+class Codec(NamedTuple):
+    """A json library.
+
+    name: one of `CODECS`
+    loads: parses bytes or a string
+    dumps: compact json as bytes, gets the data and whether to sort the keys
+    typed: can decode into a TypedDict, see `decode()`
+    """
+    name: str
+    loads: Callable[[bytes | str], Any]
+    dumps: Callable[[Any, bool], bytes]
+    typed: bool = False
+
+
+def _json_dumps(data: Any, sort_keys: bool) -> bytes:
+    return json.dumps(data, separators=(',', ':'), sort_keys=sort_keys).encode()
+
+
+def _orjson_dumps(data: Any, sort_keys: bool) -> bytes:
+    # the json module turns int keys into strings too
+    option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_SORT_KEYS if sort_keys else 0)
+    return orjson.dumps(data, option=option)
+
+
+@lru_cache(maxsize=2)
+def _get_msgspec_encoder(sort_keys: bool):
+    return msgspec.json.Encoder(order='sorted' if sort_keys else None)
+
+
+def _msgspec_dumps(data: Any, sort_keys: bool) -> bytes:
+    return _get_msgspec_encoder(sort_keys).encode(data)
+
+
+@lru_cache(maxsize=16)
+def get_typed_decoder(record_type: type):
+    return msgspec.json.Decoder(record_type)
+
+
+def get_available_codecs() -> list[str]:
+    """The codecs that can be used here, in order of preference."""
+    installed = {'orjson': orjson is not None, 'msgspec': msgspec is not None, 'json': True}
+    return [name for name in CODECS if installed[name]]
+
+
+def get_codec(name: str = None) -> Codec:
+    """Gets a codec by its name.
+
+    Args:
+        name (str, optional): One of `CODECS`. Defaults to the `JSON_CODEC` env
+            variable, or the fastest one installed.
+
+    Returns:
+        Codec: the codec
+    """
+    name = name or os.getenv(CODEC_ENV) or get_available_codecs()[0]
+
+    if name not in get_available_codecs():
+        raise ValueError(f'json codec {name} is not installed, use one of {get_available_codecs()}')
+
+    if name == 'orjson':
+        return Codec(name, orjson.loads, _orjson_dumps)
+    if name == 'msgspec':
+        return Codec(name, msgspec.json.decode, _msgspec_dumps, typed=True)
+
+    return Codec(name, json.loads, _json_dumps)
+
+
+codec = get_codec()
+logger.debug('using the %s json codec', codec.name)
+
+
+def decode(raw: bytes | str, record_type: type = None) -> Any:
+    """Parses json.
+
+    Args:
+        raw (bytes | str): The json
+        record_type (type, optional): TypedDict to decode into, if the codec can.
+            Data of the wrong shape is decoded as it is. Defaults to none.
+
+    Returns:
+        Any: the data
+    """
+    if record_type is not None and codec.typed:
+        try:
+            return get_typed_decoder(record_type).decode(raw)
+        except msgspec.ValidationError as exc:
+            logger.warning('not a %s (%s), decoding it as it is', record_type.__name__, exc)
+
+    return codec.loads(raw)
+
+
+def encode(data: Any, sort_keys: bool = False) -> bytes:
+    """Compact json, with the json module if the codec cannot write the data
+    (like ints bigger than 64 bits).
+
+    Returns:
+        bytes: utf-8 json
+    """
+    try:
+        return codec.dumps(data, sort_keys)
+    except (TypeError, OverflowError) as exc:
+        logger.debug('%s cannot write it (%s), using json', codec.name, exc)
+        return _json_dumps(data, sort_keys)
+
+
+def load_file(full_path: str, record_type: type = None) -> Any:
+    """Reads a json file, see `decode()`. Raises `OSError` if it cannot be read."""
+    with open(full_path, 'rb') as file:
+        return decode(file.read(), record_type)
@@ -1,10 +1,16 @@
+import bisect
 import json
 import os
+import re
+import threading
 from collections import namedtuple
 from datetime import datetime, timedelta
+from functools import lru_cache
 from typing import Optional, TypedDict, NotRequired
 
+from scripts.json_codec import decode, encode, load_file
 from scripts.logging_config import logger
+from scripts.migrations import upgrade_data
 
 
 class MappedPlayerData(TypedDict):
@@ -42,7 +48,7 @@ class MappedPlayerData(TypedDict):
 
 
 class MappedScoreData(TypedDict):
-    """Object for score data
+    """Object for score data, the beatmap metadata is on `MappedBeatmapData`
     ```
     score_type: str
     score_mods: str
@@ -50,18 +56,17 @@ class MappedScoreData(TypedDict):
     score_grade: str
     user_id: int
     user_name: str
-    beatmapset_title: str
-    beatmap_version: str
     beatmap_id: int
-    beatmapset_id: int
-    beatmap_difficulty: float
     full_combo: bool
     max_combo: int
     count_300: int
     count_100: int
     count_50: int
+    count_droplet_miss: int
     count_miss: int
     accuracy: float
+    created_at: float
+    user_avatar: str
     ```
     """
     score_type: str
@@ -72,20 +77,39 @@ class MappedScoreData(TypedDict):
     user_id: int
     user_name: str
 
-    beatmapset_title: str
-    beatmap_version: str
     beatmap_id: int
-    beatmapset_id: int
-    beatmap_difficulty: float
 
     full_combo: bool
     max_combo: int
     count_300: int
     count_100: int
     count_50: int
+    count_droplet_miss: int
     count_miss: int
     accuracy: float
 
+    created_at: Optional[float]
+    user_avatar: Optional[str]
+
+
+class MappedBeatmapData(TypedDict):
+    """Object for beatmap metadata, from the `beatmaps` table of pp-records
+    ```
+    beatmapset_id: int
+    beatmapset_title: str
+    beatmap_version: str
+    beatmap_difficulty: float
+    beatmap_url: str
+    beatmapset_cover: str
+    ```
+    """
+    beatmapset_id: int
+    beatmapset_title: Optional[str]
+    beatmap_version: Optional[str]
+    beatmap_difficulty: Optional[float]
+    beatmap_url: Optional[str]
+    beatmapset_cover: Optional[str]
+
 
 class MappedPlayerDataCollection(TypedDict):
     """A collection of player data that includes the player id
@@ -120,10 +144,15 @@ class RawPlayerDataCollection(TypedDict):
     pages: int
     key_mapping: list[str]
     key: Optional[str]
+    incomplete: Optional[bool]
+    missing_pages: Optional[list[int]]
+    reconciliation: Optional[dict]
     data: dict[str, list[int | str | float]]
     ```
+    Rankings files are decoded straight into this when the json codec can,
+    so it has to have every key of a rankings file, see `scripts/json_codec`.
     """
-    file_version: Optional[float]
+    file_version: NotRequired[Optional[float]]
     type: NotRequired[str]
     update_date: float
     file_type: NotRequired[str]
@@ -132,7 +161,10 @@ class RawPlayerDataCollection(TypedDict):
     pages: NotRequired[int]
     map: list[str]
     key: NotRequired[str]
-    data: dict[str, list[int | str | float]]
+    incomplete: NotRequired[bool]
+    missing_pages: NotRequired[list[int]]
+    reconciliation: NotRequired[Optional[dict]]
+    data: dict[str, list[int | float | str | bool | None]]
 
 
 def sort_data_dictionary(
@@ -150,7 +182,7 @@ def sort_data_dictionary(
     Returns:
         dict: The mapped player data, now sorted to specified key.
     """
-    logger.debug(f'sorting dict with {key=}')
+    logger.debug('sorting dict with key=%r', key)
     return dict(
         sorted(data.items(), key=lambda x: x[1].get(key, 0), reverse=highest_first)
     )
@@ -171,7 +203,7 @@ def get_sorted_dict_on_stat(
     Returns:
         dict[str, dict[str, str|int|float]]: Sorted and filtered mapped player data
     """
-    logger.debug(f'sorting dict with {stat=}')
+    logger.debug('sorting dict with stat=%r', stat)
     return {
         i: data[i]
         for i in sort_data_dictionary(data, stat, highest_first)
@@ -189,20 +221,14 @@ def get_json(file_path: str, test: bool) -> dict | None:
     Returns:
         dict: The json data in dict
     """
-    current_dir = os.path.dirname(__file__)
-
-    if test:
-        file_path = 'tests/' + file_path
-
-    logger.debug(f'trying to get {file_path}...')
+    logger.debug('trying to get %s...', file_path)
 
-    file_path = os.path.join(current_dir, '../' + file_path)
+    file_path = get_project_path(file_path, test)
 
     try:
-        with open(file_path) as file:
-            data = json.load(file)
-    except OSError as osx:
-        print(f'{file_path} does not exist.')
+        data = load_file(file_path)
+    except OSError:
+        logger.debug('%s does not exist.', file_path)
         return None
 
     return data
@@ -225,16 +251,433 @@ def get_data_at_date(
         test (bool, optional): Uses files in tests/ to avoid cluttering up main files. Defaults to False.
 
     Returns:
-        dict: json as dictionary, `None` if the file does not exist yet
+        dict: json as dictionary, `None` if the file does not exist yet.
+        Upgraded to the current file version and shared between callers, do not modify it.
+    """
+
+    target_file = get_data_file_path(date=date, country=country, mode=mode, file_type=file_type)
+
+    # only the rankings have a type that lists all of their keys
+    record_type = RawPlayerDataCollection if file_type is None else None
+
+    return load_data_file(file_path=target_file, test=test, record_type=record_type)
+
+
+def load_data_file(
+        file_path: str,
+        test: bool = False,
+        record_type: type = None,
+) -> RawPlayerDataCollection | None:
+    """Gets a data file upgraded to the current version of its file type.
+    The upgraded data is cached until the file changes on disk, so reading the
+    same day again (e.g. as the comparison of the next day) is free.
+
+    Args:
+        file_path (str): Project root relative path
+        test (bool, optional): Is grabbing from the test folder?. Defaults to False.
+        record_type (type, optional): TypedDict to decode into if the json codec can,
+            see `scripts.json_codec.decode()`. Defaults to none.
+
+    Returns:
+        dict: json as dictionary, `None` if the file does not exist yet.
+        Shared between callers, do not modify it.
+    """
+    full_path = get_project_path(file_path, test)
+
+    try:
+        stat = os.stat(full_path)
+    except OSError:
+        logger.debug('%s does not exist.', full_path)
+        return None
+
+    written = _written_files.get(os.path.abspath(full_path))
+
+    # just written by this process and untouched since, no need to read it back
+    if written is not None and written[:2] == (stat.st_mtime_ns, stat.st_size):
+        return written[2]
+
+    return _load_upgraded(full_path, stat.st_mtime_ns, stat.st_size, record_type)
+
+
+# the files written by `dump_to_file()`, so the next step of a run gets them
+# from memory. Absolute path to `(mtime_ns, size, data)`, oldest first
+_written_files: dict[str, tuple[int, int, RawPlayerDataCollection]] = {}
+_written_files_lock = threading.Lock()
+MAX_WRITTEN_FILES = 64
+
+
+def _remember_written_file(full_path: str, output: str) -> None:
+    stat = os.stat(full_path)
+    full_path = os.path.abspath(full_path)
+
+    # parsed back from the output so it is exactly what a read would give
+    data = upgrade_data(decode(output))
+
+    with _written_files_lock:
+        _written_files.pop(full_path, None)
+        _written_files[full_path] = (stat.st_mtime_ns, stat.st_size, data)
+
+        while len(_written_files) > MAX_WRITTEN_FILES:
+            del _written_files[next(iter(_written_files))]
+
+
+@lru_cache(maxsize=64)
+def _load_upgraded(full_path: str, mtime_ns: int, size: int, record_type: type = None) -> RawPlayerDataCollection:
+    # mtime and size are only here to be part of the cache key
+    logger.debug('loading %s...', full_path)
+
+    return upgrade_data(load_file(full_path, record_type))
+
+
+def get_data_file_path(
+        date: str,
+        country: str,
+        mode: str,
+        file_type: str = None,
+) -> str:
+    """Builds the project root relative path of a data file
+
+    Args:
+        date (str): The date, in YYYY/MM/DD format
+        country (str): Uses 2 letter country code
+        mode (str): osu/taiko/fruits/mania
+        file_type (str, optional): appended to the end of the file name, `None` for the rankings
+
+    Returns:
+        str: the path, e.g. `docs/data/2024/06/13/PH-fruits-pp-records.json`
     """
+    return f'docs/data/{date}/{get_file_stem(country, mode, file_type)}.json'
 
-    # TODO: maybe do something about this
+
+def get_file_stem(country: str, mode: str, file_type: str = None) -> str:
+    """The file name of a data file without the extension, also used as the
+    manifest key. e.g. `PH-fruits`, `PH-fruits-pp-records`
+    """
     if file_type is not None:
-        target_file = f'docs/data/{date}/{country}-{mode}-{file_type}.json'
-    else:
-        target_file = f'docs/data/{date}/{country}-{mode}.json'
+        return f'{country}-{mode}-{file_type}'
+
+    return f'{country}-{mode}'
+
+
+def split_file_stem(stem: str) -> tuple[str, str, str | None]:
+    """The reverse of `get_file_stem()`.
+
+    Returns:
+        tuple[str, str, str | None]: country, mode, and file type or `None` for the rankings
+    """
+    country, mode, *file_type = stem.split('-', 2)
+
+    return country, mode, file_type[0] if file_type else None
+
+
+MANIFEST_FILE = 'docs/data/manifest.json'
+
+# manifest per test flag, so it is only read from disk once
+_manifest_cache: dict[bool, dict[str, list[str]]] = {}
+
+# the pipeline writes files from several threads at once
+_manifest_lock = threading.RLock()
+
+
+def build_manifest(test: bool = False) -> dict[str, list[str]]:
+    """Scans the data folder for every data file.
+
+    Args:
+        test (bool, optional): Scan tests/ instead. Defaults to False.
+
+    Returns:
+        dict[str, list[str]]: file stem to the sorted list of dates (YYYY/MM/DD) it exists on
+    """
+    data_dir = get_project_path('docs/data', test)
+    manifest: dict[str, list[str]] = {}
+
+    for root, _, files in os.walk(data_dir):
+        date = os.path.relpath(root, data_dir).replace(os.sep, '/')
+
+        if not re.fullmatch(r'\d{4}/\d{2}/\d{2}', date):
+            continue
+
+        for file in files:
+            if not file.endswith('.json'):
+                continue
+
+            manifest.setdefault(file.removesuffix('.json'), []).append(date)
+
+    for dates in manifest.values():
+        dates.sort()
+
+    return manifest
+
+
+def get_manifest(test: bool = False) -> dict[str, list[str]]:
+    """Gets the manifest of available data files, building it if it does not
+    exist yet.
+
+    Args:
+        test (bool, optional): Use the manifest in tests/. Defaults to False.
+
+    Returns:
+        dict[str, list[str]]: file stem to the sorted list of dates (YYYY/MM/DD) it exists on
+    """
+    with _manifest_lock:
+        if test in _manifest_cache:
+            return _manifest_cache[test]
+
+        manifest = get_json(file_path=MANIFEST_FILE, test=test)
+
+        if manifest is None:
+            logger.info('No manifest yet, building one from the data folder')
+            manifest = build_manifest(test)
+            _write_manifest(manifest, test)
+
+        _manifest_cache[test] = manifest
+        return manifest
+
+
+def refresh_manifest(test: bool = False) -> dict[str, list[str]]:
+    """Rebuilds the manifest from the data folder and writes it.
+
+    Args:
+        test (bool, optional): Use tests/ instead. Defaults to False.
+
+    Returns:
+        dict[str, list[str]]: the new manifest
+    """
+    with _manifest_lock:
+        manifest = build_manifest(test)
+        _write_manifest(manifest, test)
+
+        _manifest_cache[test] = manifest
+        return manifest
+
+
+def _write_manifest(manifest: dict[str, list[str]], test: bool) -> None:
+    write_json(file_path=MANIFEST_FILE, data=manifest, test=test)
+
 
-    return get_json(file_path=target_file, test=test)
+def write_json(file_path: str, data: dict, test: bool = False) -> str:
+    """Writes compact json to a project root relative path, for files that
+    do not live in a date folder. Use `dump_to_file()` for those.
+
+    Args:
+        file_path (str): Project root relative path
+        data (dict): The data to write
+        test (bool, optional): Write to tests/ instead. Defaults to False.
+
+    Returns:
+        str: the full path of the written file
+    """
+    output_file = get_project_path(file_path, test)
+    temp_file = f'{output_file}.{os.getpid()}.{threading.get_ident()}.tmp'
+
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    with open(temp_file, 'wb') as json_file:
+        json_file.write(encode(data, sort_keys=True))
+
+    # replaced at once, so another process never reads it half written
+    os.replace(temp_file, output_file)
+
+    return output_file
+
+
+def add_to_manifest(
+        date: str,
+        country: str,
+        mode: str,
+        file_type: str = None,
+        test: bool = False,
+) -> None:
+    """Records a written data file on the manifest.
+
+    Args:
+        date (str): The date, in YYYY/MM/DD format
+        country (str): Uses 2 letter country code
+        mode (str): osu/taiko/fruits/mania
+        file_type (str, optional): The file type, `None` for the rankings
+        test (bool, optional): Use the manifest in tests/. Defaults to False.
+    """
+    with _manifest_lock:
+        manifest = get_manifest(test)
+        dates = manifest.setdefault(get_file_stem(country, mode, file_type), [])
+
+        index = bisect.bisect_left(dates, date)
+
+        if index < len(dates) and dates[index] == date:
+            return
+
+        dates.insert(index, date)
+        _write_manifest(manifest, test)
+
+
+def remove_from_manifest(
+        date: str,
+        country: str,
+        mode: str,
+        file_type: str = None,
+        test: bool = False,
+) -> None:
+    """Takes a deleted data file off the manifest, see `add_to_manifest()`."""
+    with _manifest_lock:
+        manifest = get_manifest(test)
+        dates = manifest.get(get_file_stem(country, mode, file_type), [])
+
+        index = bisect.bisect_left(dates, date)
+
+        if index == len(dates) or dates[index] != date:
+            return
+
+        del dates[index]
+        _write_manifest(manifest, test)
+
+
+def get_nearest_date(
+        date: datetime | str,
+        country: str,
+        mode: str,
+        file_type: str = None,
+        test: bool = False,
+) -> str | None:
+    """Gets the closest date on or before the specified date that has a data
+    file, in O(log n) with the manifest.
+
+    Args:
+        date (datetime | str): The date, a string should be in YYYY/MM/DD format
+        country (str): Uses 2 letter country code
+        mode (str): osu/taiko/fruits/mania
+        file_type (str, optional): The file type, `None` for the rankings
+        test (bool, optional): Use the manifest in tests/. Defaults to False.
+
+    Returns:
+        str | None: the date in YYYY/MM/DD format, `None` if there is no older file
+    """
+    if isinstance(date, datetime):
+        date = date.strftime('%Y/%m/%d')
+
+    dates = get_manifest(test).get(get_file_stem(country, mode, file_type), [])
+
+    index = bisect.bisect_right(dates, date)
+
+    if index == 0:
+        return None
+
+    return dates[index - 1]
+
+
+def get_nearest_data(
+        date: datetime | str,
+        country: str,
+        mode: str,
+        file_type: str = None,
+        test: bool = False,
+) -> RawPlayerDataCollection | None:
+    """Gets the closest data file on or before the specified date, skipping
+    over days that have no file.
+
+    Args:
+        date (datetime | str): The latest date to look from, a string should be in YYYY/MM/DD format
+        country (str): Uses 2 letter country code
+        mode (str): osu/taiko/fruits/mania
+        file_type (str, optional): specifies the file type to get
+        test (bool, optional): Use data from tests/. Defaults to False.
+
+    Returns:
+        dict: json as dictionary, `None` if there is no older file
+    """
+    nearest_date = get_nearest_date(date=date, country=country, mode=mode, file_type=file_type, test=test)
+
+    if nearest_date is None:
+        return None
+
+    return get_data_at_date(date=nearest_date, country=country, mode=mode, file_type=file_type, test=test)
+
+
+def get_project_path(file_path: str, test: bool = False) -> str:
+    """Resolves a project root relative path, used so scripts can be run
+    from anywhere.
+
+    Args:
+        file_path (str): Project root relative path
+        test (bool, optional): Points to the tests/ folder instead. Defaults to False.
+
+    Returns:
+        str: the full path
+    """
+    if test:
+        file_path = 'tests/' + file_path
+
+    return os.path.join(os.path.dirname(__file__), '../' + file_path)
+
+
+def dump_to_file(
+        data: RawPlayerDataCollection,
+        test: bool = False,
+        formatted: bool = False,
+        date: datetime = None,
+        update_manifest: bool = True,
+) -> str:
+    """Writes the collection to its data file, based on its mode, country and type.
+
+    Args:
+        data (RawPlayerDataCollection): The data to write
+        test (bool, optional): Write to tests/ instead. Defaults to False.
+        formatted (bool, optional): Make the output somewhat readable. Defaults to False.
+        date (datetime, optional): The date folder to write to. Defaults to today.
+        update_manifest (bool, optional): Record the file on the manifest. Turn off when
+            writing from several processes, then call `refresh_manifest()` after. Defaults to True.
+
+    Returns:
+        str: the project root relative path of the written file
+    """
+    mode = data.get('mode', None)
+    country = data.get('country', None)
+
+    if mode is None or country is None:
+        logger.warning('mode or country is None')
+
+    file_type = data.get('type', None)
+
+    if date is None:
+        date = datetime.now()
+    date_string = date.strftime('%Y/%m/%d')
+
+    output = encode_data(data, formatted)
+
+    output_file = get_data_file_path(date=date_string, country=country, mode=mode, file_type=file_type)
+
+    if test:
+        output_file = 'tests/' + output_file
+
+    os.makedirs(os.path.dirname(output_file), exist_ok=True)
+    with open(output_file, 'w', encoding='utf-8') as json_file:
+        json_file.write(output)
+
+    _remember_written_file(output_file, output)
+
+    if update_manifest:
+        add_to_manifest(date=date_string, country=country, mode=mode, file_type=file_type, test=test)
+
+    return output_file
+
+
+def encode_data(data: RawPlayerDataCollection, formatted: bool = False) -> str:
+    """Serializes a data file the way it is stored.
+
+    Args:
+        data (RawPlayerDataCollection): The data to serialize
+        formatted (bool, optional): One player per line, somewhat readable. Defaults to False.
+
+    Returns:
+        str: the json
+    """
+    if not formatted:
+        return encode(data).decode()
+
+    # the layout below depends on how the json module indents
+    output = json.dumps(data, separators=(',', ':'), indent=0)
+
+    output2 = re.sub(r'(\d"):\[\s+', r'\1:[', output)
+    output3 = re.sub(r'("|\w),\s+', r'\1,', output2)
+    return re.sub(r'(\d|null)\s+\]', r'\1]', output3)
 
 
 def compare_player_data(
@@ -267,6 +710,12 @@ def compare_player_data(
 
             t_stat = player.get(stat, 0)
             y_stat = y_player.get(stat, 0)
+
+            # the api sometimes has no global rank for a player
+            if t_stat is None or y_stat is None:
+                data[t][stat] = 0
+                continue
+
             difference = t_stat - y_stat
 
             if stat in ['country_rank', 'global_rank']:
@@ -278,18 +727,23 @@ def compare_player_data(
 
 
 def map_player_data(data: RawPlayerDataCollection) -> MappedPlayerDataCollection | MappedScoreDataCollection:
-    decoded_data: MappedPlayerDataCollection = {}
-
+    # every row has the same length as the map, data files are upgraded on read
     map = data['map']
-    player_data = data['data']
 
-    for player in player_data:
-        decoded_data[player] = {
-            map[i]: player_data[player][i]
-            for i in range(len(map))
-        }
+    return {
+        player: dict(zip(map, values))
+        for player, values in data['data'].items()
+    }
+
 
-    return decoded_data
+def map_beatmap_data(data: RawPlayerDataCollection) -> dict[str, MappedBeatmapData]:
+    """Maps the `beatmaps` table of pp-records, keyed by beatmap id."""
+    map = data['beatmaps_map']
+
+    return {
+        beatmap_id: dict(zip(map, values))
+        for beatmap_id, values in data['beatmaps'].items()
+    }
 
 
 ComparisonAndMappedData = namedtuple(
@@ -348,7 +802,8 @@ def get_comparison_and_mapped_data(
 
     data_difference = None
 
-    comparison_data = get_data_at_date(date=comparison_string, country=country, mode=mode, test=test)
+    # a skipped day should not break the comparison, use the closest older one
+    comparison_data = get_nearest_data(date=comparison_string, country=country, mode=mode, test=test)
     comparison_mapped_data = None
 
     if comparison_data is not None and latest_data is not None:
@@ -1,7 +1,18 @@
+import atexit
+import copy
+import json
 import logging
+import os
+import queue
+from logging.handlers import QueueHandler, QueueListener
+
+# where to also write the logs as json lines, if set
+LOG_JSON_ENV = 'LOG_JSON_FILE'
+
+# writes the json lines on its own thread, see `setup_logging()`
+_listener: QueueListener | None = None
 
 
-# messes with the logs in the file but i kinda dont care anymore
 class ColoredFormatter(logging.Formatter):
     COLORS = {
         'DEBUG': '\033[0;37m',  # White
@@ -16,16 +27,85 @@ class ColoredFormatter(logging.Formatter):
     def format(self, record):
         loglevel_color = self.COLORS.get(record.levelname, self.RESET)
 
+        # the colors go on a copy, the record is shared with the other handlers
         # https://docs.python.org/3/library/logging.html#logging.LogRecord
-        record.levelname = f'{loglevel_color} {record.levelname.ljust(8)} {self.RESET}'
-        record.msg = f'{loglevel_color}{record.msg}{self.RESET}'
+        colored = logging.makeLogRecord(record.__dict__)
+        colored.levelname = f'{loglevel_color} {record.levelname.ljust(8)} {self.RESET}'
+        colored.msg = f'{loglevel_color}{record.getMessage()}{self.RESET}'
+        colored.args = None
+
+        return super().format(colored)
+
+
+class JsonFormatter(logging.Formatter):
+    """One json object per record, for reading the logs with other tools."""
+
+    def format(self, record):
+        entry = {
+            'time': record.created,
+            'level': record.levelname,
+            'message': record.getMessage(),
+            'function': record.funcName,
+            'file': record.filename,
+            'line': record.lineno,
+            'process': record.process,
+            'thread': record.threadName,
+        }
+
+        if record.exc_info:
+            record.exc_text = record.exc_text or self.formatException(record.exc_info)
+
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class _JsonQueueHandler(QueueHandler):
+    """Like `QueueHandler`, but the traceback stays out of the message."""
+
+    def prepare(self, record):
+        # what the listener's thread gets, the args and the traceback as text
+        # so the record can cross over. The original is left as it is
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+
+        if record.exc_info:
+            record.exc_text = record.exc_text or logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
 
-        return super().format(record)
+        return record
+
+
+def _stop_listener() -> None:
+    global _listener
+
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+
+        _listener = None
 
 
 def setup_logging(
         level: int = logging.INFO,
+        json_file: str = None,
 ) -> logging.Logger:
+    """Sets up the project logger, printing coloured logs.
+
+    Log with `%` style arguments, `logger.debug('got %s', value)`, so the
+    message is only made if the level is on.
+
+    Args:
+        level (int, optional): The lowest level that is logged. Defaults to logging.INFO.
+        json_file (str, optional): Also append the logs to this file as json lines. Defaults
+            to the LOG_JSON_FILE env variable, none if it is not set.
+
+    Returns:
+        logging.Logger: the logger
+    """
     # Assisited by ChatGPT(tm)
 
     logger = logging.getLogger(name='ctbph-rank-daily')
@@ -49,7 +129,30 @@ def setup_logging(
     logger.handlers = []  # Clear existing handlers
     logger.addHandler(ch)
 
+    _stop_listener()
+    json_file = json_file or os.getenv(LOG_JSON_ENV)
+
+    if json_file:
+        global _listener
+
+        file_handler = logging.FileHandler(json_file, encoding='utf-8')
+        file_handler.setFormatter(JsonFormatter())
+
+        # the threads logging only put the record on the queue, the file is
+        # written by the listener's thread
+        log_queue = queue.SimpleQueue()
+        queue_handler = _JsonQueueHandler(log_queue)
+        queue_handler.setLevel(level=level)
+
+        _listener = QueueListener(log_queue, file_handler, respect_handler_level=True)
+        _listener.start()
+
+        logger.addHandler(queue_handler)
+
     return logger
 
 
+# the json lines left on the queue are written before exiting
+atexit.register(_stop_listener)
+
 logger = setup_logging()
@@ -0,0 +1,254 @@
+"""Upgrades old data files to the current format, see docs/data/file_versions.json
+
+Each step upgrades one file type from one version to the next one, and is
+registered with `@migration`. `upgrade_data()` runs the steps one after the
+other until the file is on the current version, so readers only ever have
+to deal with the latest format.
+"""
+from typing import Callable
+
+from scripts.logging_config import logger
+
+# INFO: add a step below and bump this every time the format changes
+CURRENT_VERSIONS: dict[str, float] = {
+    'rankings': 1.03,
+    'pp-records': 1.013,
+}
+
+PLAYERS_PER_PAGE = 50
+
+RANKINGS_MAP = [
+    'country_rank',
+    'global_rank',
+    'ign',
+    'pp',
+    'acc',
+    'play_count',
+    'rank_x',
+    'rank_s',
+    'rank_a',
+    'play_time',
+    'total_score',
+    'ranked_score',
+    'total_hits',
+]
+
+PP_RECORDS_MAP_1_011 = [
+    'score_type',
+    'score_mods',
+    'score_pp',
+    'score_grade',
+    'user_id',
+    'user_name',
+    'beatmapset_title',
+    'beatmap_version',
+    'beatmap_id',
+    'beatmapset_id',
+    'beatmap_difficulty',
+    'full_combo',
+    'max_combo',
+    'count_300',
+    'count_100',
+    'count_50',
+    'count_droplet_miss',
+    'count_miss',
+    'accuracy',
+]
+
+PP_RECORDS_MAP_1_012 = [
+    *PP_RECORDS_MAP_1_011,
+    'created_at',
+    'beatmap_url',
+    'beatmapset_cover',
+    'user_avatar',
+]
+
+# the beatmap metadata is on its own table, see BEATMAP_MAP
+PP_RECORDS_MAP = [
+    'score_type',
+    'score_mods',
+    'score_pp',
+    'score_grade',
+    'user_id',
+    'user_name',
+    'beatmap_id',
+    'full_combo',
+    'max_combo',
+    'count_300',
+    'count_100',
+    'count_50',
+    'count_droplet_miss',
+    'count_miss',
+    'accuracy',
+    'created_at',
+    'user_avatar',
+]
+
+BEATMAP_MAP = [
+    'beatmapset_id',
+    'beatmapset_title',
+    'beatmap_version',
+    'beatmap_difficulty',
+    'beatmap_url',
+    'beatmapset_cover',
+]
+
+# (file type, from version) -> (to version, step)
+_migrations: dict[tuple[str, float], tuple[float, Callable[[dict], None]]] = {}
+
+
+def migration(file_type: str, from_version: float, to_version: float):
+    """Registers an upgrade step. The step changes the data in place."""
+    def decorator(step: Callable[[dict], None]) -> Callable[[dict], None]:
+        _migrations[(file_type, from_version)] = (to_version, step)
+        return step
+
+    return decorator
+
+
+def get_file_type(data: dict) -> str:
+    # rankings have `file_type`, the rest have `type` since that is what
+    # dump_to_file() names the file after
+    return data.get('type') or data.get('file_type') or 'rankings'
+
+
+def get_file_version(data: dict) -> float:
+    return data.get('file_version') or 0
+
+
+def needs_upgrade(data: dict) -> bool:
+    current_version = CURRENT_VERSIONS.get(get_file_type(data))
+
+    if current_version is None:
+        return False
+
+    return get_file_version(data) < current_version or _needs_normalizing(data)
+
+
+def upgrade_data(data: dict) -> dict:
+    """Upgrades the data to the current version of its file type, in place.
+    File types without migrations are returned as is.
+
+    Args:
+        data (dict): The contents of a data file
+
+    Returns:
+        dict: the same data, upgraded
+    """
+    file_type = get_file_type(data)
+    current_version = CURRENT_VERSIONS.get(file_type)
+
+    if current_version is None:
+        return data
+
+    version = get_file_version(data)
+
+    while version < current_version:
+        step = _migrations.get((file_type, version))
+
+        if step is None:
+            logger.warning('No migration for %s version %s, leaving it as is', file_type, version)
+            return data
+
+        version, upgrade = step
+        upgrade(data)
+        data['file_version'] = version
+
+    _normalize(data)
+
+    return data
+
+
+def remap_rows(data: dict, new_map: list[str]) -> None:
+    """Reorders every row to the new map, stats the old map does not have are
+    set to `None`."""
+    old_map = data['map']
+
+    if old_map == new_map:
+        return
+
+    indexes = [old_map.index(stat) if stat in old_map else None for stat in new_map]
+
+    data['data'] = {
+        key: [row[index] if index is not None else None for index in indexes]
+        for key, row in data['data'].items()
+    }
+    data['map'] = list(new_map)
+
+
+def _needs_normalizing(data: dict) -> bool:
+    if get_file_type(data) == 'rankings':
+        return 'file_type' not in data or data['map'] != RANKINGS_MAP
+
+    return data['map'] != PP_RECORDS_MAP or 'beatmaps' not in data
+
+
+def _normalize(data: dict) -> None:
+    # changes that went in without bumping the version
+    if get_file_type(data) == 'rankings':
+        data.setdefault('file_type', 'rankings')
+        remap_rows(data, RANKINGS_MAP)
+    else:
+        remap_rows(data, PP_RECORDS_MAP)
+
+
+@migration('rankings', 0, 1)
+def _rankings_0_to_1(data: dict) -> None:
+    # global ranks, play time, total score, ranked score and total hits
+    # did not exist yet
+    remap_rows(data, RANKINGS_MAP)
+
+
+@migration('rankings', 1, 1.01)
+def _rankings_1_to_1_01(data: dict) -> None:
+    data['key'] = 'id'
+    data['file_type'] = 'rankings'
+
+
+@migration('rankings', 1.01, 1.02)
+def _rankings_1_01_to_1_02(data: dict) -> None:
+    # failed pages used to be skipped silently, they show up as a page with
+    # no players before the last page that has some
+    rank_index = data['map'].index('country_rank')
+    pages_with_players = {(row[rank_index] - 1) // PLAYERS_PER_PAGE + 1 for row in data['data'].values()}
+    last_page = max(pages_with_players, default=data.get('pages', 0))
+
+    missing_pages = [page for page in range(1, last_page + 1) if page not in pages_with_players]
+
+    data['incomplete'] = len(missing_pages) > 0
+    data['missing_pages'] = missing_pages
+
+
+@migration('rankings', 1.02, 1.03)
+def _rankings_1_02_to_1_03(data: dict) -> None:
+    # not known for older files
+    data['reconciliation'] = None
+
+
+@migration('pp-records', 1.01, 1.011)
+def _pp_records_1_01_to_1_011(data: dict) -> None:
+    # the first few days only had the ids, then droplet misses were added
+    remap_rows(data, PP_RECORDS_MAP_1_011)
+
+
+@migration('pp-records', 1.011, 1.012)
+def _pp_records_1_011_to_1_012(data: dict) -> None:
+    # what the webhook used to look up from the api
+    remap_rows(data, PP_RECORDS_MAP_1_012)
+
+
+@migration('pp-records', 1.012, 1.013)
+def _pp_records_1_012_to_1_013(data: dict) -> None:
+    # every score on the same beatmap repeated its metadata
+    indexes = [data['map'].index(stat) for stat in BEATMAP_MAP]
+    beatmap_index = data['map'].index('beatmap_id')
+
+    beatmaps = {}
+
+    for row in data['data'].values():
+        beatmaps.setdefault(str(row[beatmap_index]), [row[index] for index in indexes])
+
+    data['beatmaps_map'] = list(BEATMAP_MAP)
+    data['beatmaps'] = beatmaps
+
+    remap_rows(data, PP_RECORDS_MAP)
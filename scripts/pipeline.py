@@ -0,0 +1,305 @@
+"""Runs the daily update as named stages that depend on each other.
+
+Every stage declares the stages it needs and the files it writes. Before a
+stage runs, a key is made from its version and the content of everything it
+reads. If the key is the same as on its last run and the files it wrote
+then are still there unchanged, the stage is skipped. Only the stages of
+the current date are remembered. Stages whose inputs
+are done run at the same time, on threads, so the api calls of one stage do
+not hold up the file work of another.
+"""
+import json
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from datetime import datetime
+from typing import Callable, NamedTuple
+
+from scripts.build_state import combine_hashes, get_file_hash
+from scripts.json_player_data import get_file_stem, get_project_path, write_json
+from scripts.logging_config import logger
+
+STATE_DIR = '.cache/pipeline'
+
+
+class PipelineContext:
+    """What every stage of one run works on.
+
+    Args:
+        date (datetime): The date of the rankings
+        country (str): 2 Letter country code
+        mode (str): osu/taiko/fruits/mania
+        test (bool, optional): Use tests/ instead. Defaults to False.
+        formatted (bool, optional): Make the output .json somewhat readable. Defaults to False.
+        api (Ossapi, optional): The client to use. Defaults to a new one, made once a stage needs it.
+        options (dict, optional): Anything else the stages look at. Defaults to nothing.
+    """
+
+    def __init__(
+            self,
+            date: datetime,
+            country: str,
+            mode: str,
+            test: bool = False,
+            formatted: bool = False,
+            api=None,
+            options: dict = None,
+    ):
+        self.date = date
+        self.date_string = date.strftime('%Y/%m/%d')
+        self.country = country
+        self.mode = mode
+        self.test = test
+        self.formatted = formatted
+        self.options = options or {}
+
+        self._api = api
+        self._api_lock = threading.Lock()
+
+    @property
+    def api(self):
+        # several stages can ask at once, only one client is made
+        with self._api_lock:
+            if self._api is None:
+                from scripts.api_cache import create_api
+
+                self._api = create_api()
+
+            return self._api
+
+
+class Stage(NamedTuple):
+    """A step of the pipeline.
+
+    name: unique name, used in the state and by other stages
+    run: does the work, gets the `PipelineContext`. Returns `False` if there
+        was nothing to do, the stages after it still run but it is tried
+        again on the next run
+    needs: names of the stages that have to be done first
+    outputs: project relative files the stage writes. A stage without outputs
+        is remembered as done for its inputs, like sending the webhooks
+    reads: project relative files from outside the run that the stage also
+        depends on, e.g. the rankings of the day before. Missing ones are fine
+    complete: whether the outputs are whole. Partial outputs are still used,
+        but the stage is never fresh so the next run tries again
+    version: bump when the stage changes, so it runs again on the same inputs
+    """
+    name: str
+    run: Callable[[PipelineContext], bool | None]
+    needs: tuple[str, ...] = ()
+    outputs: Callable[[PipelineContext], list[str]] = lambda context: []
+    reads: Callable[[PipelineContext], list[str]] = lambda context: []
+    complete: Callable[[PipelineContext], bool] = lambda context: True
+    version: int = 1
+
+
+def get_state_path(country: str, mode: str) -> str:
+    # one per country and mode, so their runs can go at the same time
+    return f'{STATE_DIR}/{get_file_stem(country, mode)}.json'
+
+
+def load_state(country: str, mode: str, test: bool) -> dict:
+    try:
+        with open(get_project_path(get_state_path(country, mode), test)) as file:
+            return json.load(file)
+    except OSError:
+        return {'files': {}, 'stages': {}}
+
+
+def save_state(state: dict, country: str, mode: str, test: bool) -> None:
+    write_json(file_path=get_state_path(country, mode), data=state, test=test)
+
+
+def get_required_stages(stages: dict[str, Stage], names: list[str]) -> list[str]:
+    """The stages and every stage they need, in the order they are declared."""
+    required = set()
+    pending = list(names)
+
+    while pending:
+        name = pending.pop()
+
+        if name not in required:
+            required.add(name)
+            pending.extend(stages[name].needs)
+
+    return [name for name in stages if name in required]
+
+
+class Pipeline:
+    """Runs stages in order of their needs, skipping the ones that are fresh.
+
+    Args:
+        stages (list[Stage]): Every stage, a stage has to come after the ones it needs
+        workers (int, optional): How many stages can run at once. Defaults to 4.
+    """
+
+    def __init__(self, stages: list[Stage], workers: int = 4):
+        self.stages = {stage.name: stage for stage in stages}
+        self.workers = workers
+
+        for stage in stages:
+            unknown = [name for name in stage.needs if name not in self.stages]
+
+            if unknown:
+                raise ValueError(f'stage {stage.name} needs unknown stages {unknown}')
+
+    def _state_key(self, stage: Stage, context: PipelineContext) -> str:
+        return f'{context.date_string}/{stage.name}'
+
+    def _input_key(self, stage: Stage, context: PipelineContext, output_keys: dict[str, str], state: dict) -> str:
+        return combine_hashes(
+            stage.name,
+            stage.version,
+            self._state_key(stage, context),
+            *[output_keys[name] for name in stage.needs],
+            *[get_file_hash(file_path, state, context.test, missing_ok=True) for file_path in stage.reads(context)],
+        )
+
+    def _output_key(self, stage: Stage, context: PipelineContext, input_key: str, state: dict) -> str | None:
+        """What the stages after it see of the stage, `None` if an output is
+        missing. Only the content of the outputs counts, so a stage that wrote
+        the same files again does not make the stages after it run.
+        """
+        output_hashes = [get_file_hash(file_path, state, context.test, missing_ok=True) for file_path in stage.outputs(context)]
+
+        if '' in output_hashes:
+            return None
+
+        return combine_hashes(*output_hashes) if output_hashes else input_key
+
+    def _prune_state(self, context: PipelineContext, state: dict) -> None:
+        # the date is part of every input key, so the entries of other days
+        # can never be fresh again, only the files of today's stages are kept
+        prefix = f'{context.date_string}/'
+        file_paths = {
+            file_path
+            for stage in self.stages.values()
+            for file_path in [*stage.outputs(context), *stage.reads(context)]
+        }
+
+        state['stages'] = {key: value for key, value in state['stages'].items() if key.startswith(prefix)}
+        state['files'] = {key: value for key, value in state['files'].items() if key in file_paths}
+
+    def run(
+            self,
+            context: PipelineContext,
+            targets: list[str] = None,
+            skip: list[str] = None,
+            force: list[str] = None,
+    ) -> dict[str, str]:
+        """Runs the target stages and everything they need.
+
+        Args:
+            context (PipelineContext): What the stages work on
+            targets (list[str], optional): Stages to bring up to date. Defaults to all of them.
+            skip (list[str], optional): Stages to never run, their outputs are used as they are.
+                Defaults to none.
+            force (list[str], optional): Stages to run even if they are fresh. Defaults to none.
+
+        Returns:
+            dict[str, str]: stage name to what happened to it, one of `'ran'`, `'fresh'`,
+            `'skipped'`, `'nothing'` (it had nothing to do), `'failed'` or `'blocked'`
+            (something it needs failed or is missing)
+        """
+        start_time = time.time()
+        names = get_required_stages(self.stages, targets or list(self.stages))
+        skip = set(skip or [])
+        force = set(force or [])
+
+        state = load_state(context.country, context.mode, context.test)
+        self._prune_state(context, state)
+
+        results: dict[str, str] = {}
+        output_keys: dict[str, str] = {}
+        running: dict[Future, tuple[Stage, str]] = {}
+
+        def finish(stage: Stage, result: str, input_key: str) -> None:
+            state_key = self._state_key(stage, context)
+
+            # not remembered, so the next run tries it again
+            if result == 'nothing':
+                output_key = input_key
+                state['stages'].pop(state_key, None)
+            else:
+                output_key = self._output_key(stage, context, input_key, state)
+
+            if result == 'ran' and output_key is None:
+                logger.error('stage %s did not write all of its outputs', stage.name)
+                result = 'failed'
+            elif result == 'ran':
+                if stage.complete(context):
+                    state['stages'][state_key] = {'input': input_key, 'output': output_key}
+                else:
+                    logger.warning('stage %s wrote incomplete outputs, it runs again on the next run', stage.name)
+                    state['stages'].pop(state_key, None)
+
+                # saved right away, so a crash later on does not lose it
+                save_state(state, context.country, context.mode, context.test)
+
+            results[stage.name] = result
+
+            # a skipped stage without its outputs blocks the stages after it
+            if output_key is not None and result != 'failed':
+                output_keys[stage.name] = output_key
+
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            while True:
+                running_names = {stage.name for stage, _ in running.values()}
+
+                for name in names:
+                    stage = self.stages[name]
+
+                    if name in results or name in running_names:
+                        continue
+
+                    if any(need in results and need not in output_keys for need in stage.needs):
+                        logger.warning('stage %s is blocked, not everything in %s is done', name, list(stage.needs))
+                        results[name] = 'blocked'
+                        continue
+
+                    if any(need not in results for need in stage.needs):
+                        continue
+
+                    input_key = self._input_key(stage, context, output_keys, state)
+
+                    if name in skip:
+                        logger.info('stage %s is skipped, using its outputs as they are', name)
+                        finish(stage, 'skipped', input_key)
+                        continue
+
+                    previous = state['stages'].get(self._state_key(stage, context))
+
+                    if (
+                            name not in force
+                            and previous is not None
+                            and previous['input'] == input_key
+                            and previous['output'] == self._output_key(stage, context, input_key, state)
+                            and stage.complete(context)
+                    ):
+                        logger.info('stage %s is fresh', name)
+                        finish(stage, 'fresh', input_key)
+                        continue
+
+                    logger.info('stage %s started', name)
+                    running[pool.submit(stage.run, context)] = (stage, input_key)
+
+                if not running:
+                    break
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    stage, input_key = running.pop(future)
+
+                    try:
+                        did_something = future.result()
+                    except Exception:
+                        logger.exception('stage %s failed', stage.name)
+                        results[stage.name] = 'failed'
+                        continue
+
+                    finish(stage, 'nothing' if did_something is False else 'ran', input_key)
+                    logger.info('stage %s %s (%.2fs)', stage.name, results[stage.name], time.time() - start_time)
+
+        logger.info('pipeline done in %.2fs: %s', time.time() - start_time, results)
+        return results
@@ -0,0 +1,242 @@
+import argparse
+import logging
+import os
+from datetime import datetime, timedelta
+
+from scripts.json_player_data import (
+    get_data_at_date,
+    get_file_stem,
+    get_json,
+    get_manifest,
+    get_project_path,
+    map_player_data,
+    write_json,
+)
+from scripts.logging_config import setup_logging, logger
+
+HISTORY_STATS = [
+    'country_rank',
+    'pp',
+    'play_count',
+]
+
+# rows older than this are thinned down to one per week
+DAILY_DAYS = 90
+
+
+def get_players_dir(country: str, mode: str) -> str:
+    return f'docs/data/players/{get_file_stem(country, mode)}'
+
+
+def get_player_history_path(uid: str, country: str, mode: str) -> str:
+    return f'{get_players_dir(country, mode)}/{uid}.json'
+
+
+def _drop_repeated_rows(rows: list[list]) -> list[list]:
+    # keeps the first row of a run of the same stats, the day they changed
+    return [row for i, row in enumerate(rows) if i == 0 or rows[i - 1][1:] != row[1:]]
+
+
+def downsample_history(rows: list[list], latest_date: str, daily_days: int = DAILY_DAYS) -> list[list]:
+    """Shrinks a player's history. Rows that are the same as the one before
+    them are dropped, and rows older than `daily_days` only keep the last one
+    of each week.
+
+    Downsampling again later, with the new rows added, gives the same rows as
+    downsampling everything at once, so the histories can be appended to.
+
+    Args:
+        rows (list[list]): `[date, *HISTORY_STATS]` rows, oldest first
+        latest_date (str): The date the player was last on the rankings, in YYYY/MM/DD format
+        daily_days (int, optional): How many days keep every row. Defaults to `DAILY_DAYS`.
+
+    Returns:
+        list[list]: the downsampled rows, oldest first
+    """
+    cutoff = (datetime.strptime(latest_date, '%Y/%m/%d') - timedelta(days=daily_days)).strftime('%Y/%m/%d')
+
+    rows = _drop_repeated_rows(rows)
+    thinned: list[list] = []
+    previous_week = None
+
+    for row in rows:
+        if row[0] < cutoff:
+            week = datetime.strptime(row[0], '%Y/%m/%d').isocalendar()[:2]
+
+            # only the last row of the week survives
+            if week == previous_week:
+                thinned.pop()
+
+            previous_week = week
+
+        thinned.append(row)
+
+    # the weeks that are left can repeat each other
+    return _drop_repeated_rows(thinned)
+
+
+def _create_history(uid: str, ign: str, update_date: float, country: str, mode: str, rows: list[list]) -> dict:
+    return {
+        'file_version': 1,
+        'type': 'player-history',
+        'update_date': update_date,
+        'mode': mode,
+        'country': country,
+        'id': uid,
+        'ign': ign,
+        'map': ['date', *HISTORY_STATS],
+        'data': rows,
+    }
+
+
+def collect_history_rows(
+        dates: list[str],
+        country: str,
+        mode: str,
+        test: bool = False,
+) -> tuple[dict[str, list[list]], dict[str, str], dict[str, float]]:
+    """Reads the rankings on the dates into per player rows.
+
+    Args:
+        dates (list[str]): Dates in YYYY/MM/DD format, oldest first
+        country (str): 2 Letter country code
+        mode (str): osu/taiko/fruits/mania
+        test (bool, optional): Use data from tests/. Defaults to False.
+
+    Returns:
+        tuple[0]: uid to `[date, *HISTORY_STATS]` rows, oldest first
+        tuple[1]: uid to their latest ign
+        tuple[2]: uid to the update_date of the latest rankings they were on
+    """
+    histories: dict[str, list[list]] = {}
+    names: dict[str, str] = {}
+    update_dates: dict[str, float] = {}
+
+    for date in dates:
+        data = get_data_at_date(date=date, country=country, mode=mode, test=test)
+
+        if data is None:
+            continue
+
+        for uid, player in map_player_data(data).items():
+            histories.setdefault(uid, []).append([date, *[player.get(stat, 0) for stat in HISTORY_STATS]])
+            names[uid] = player['ign']
+            update_dates[uid] = data['update_date']
+
+    return histories, names, update_dates
+
+
+def write_player_histories(
+        histories: dict[str, list[list]],
+        names: dict[str, str],
+        update_dates: dict[str, float],
+        country: str,
+        mode: str,
+        test: bool = False,
+) -> int:
+    """Downsamples and writes every player's history, replacing what is there.
+    Each one is downsampled from the last day the player was on the rankings,
+    the same as `append_player_histories()` left it.
+
+    Returns:
+        int: how many player files were written
+    """
+    for uid, rows in histories.items():
+        rows = downsample_history(rows, latest_date=rows[-1][0])
+        history = _create_history(uid, names[uid], update_dates[uid], country, mode, rows)
+        write_json(file_path=get_player_history_path(uid, country, mode), data=history, test=test)
+
+    return len(histories)
+
+
+def generate_player_histories(country: str, mode: str, test: bool = False) -> int:
+    """Generates every player's history from every rankings on the manifest.
+
+    Args:
+        country (str): 2 Letter country code
+        mode (str): osu/taiko/fruits/mania
+        test (bool, optional): Use data from tests/. Defaults to False.
+
+    Returns:
+        int: how many player files were written
+    """
+    dates = get_manifest(test).get(get_file_stem(country, mode), [])
+
+    if len(dates) == 0:
+        logger.warning('No rankings to generate player histories from for %s-%s', country, mode)
+        return 0
+
+    histories, names, update_dates = collect_history_rows(dates, country, mode, test)
+    written = write_player_histories(histories, names, update_dates, country, mode, test)
+
+    logger.info('Generated %s player histories for %s-%s', written, country, mode)
+    return written
+
+
+def append_player_histories(date: datetime, country: str, mode: str, test: bool = False) -> int:
+    """Appends the rankings at the date to the history of every player on it,
+    generating every history first if there are none yet.
+
+    Args:
+        date (datetime): The date of the rankings
+        country (str): 2 Letter country code
+        mode (str): osu/taiko/fruits/mania
+        test (bool, optional): Use data from tests/. Defaults to False.
+
+    Returns:
+        int: how many player files were written
+    """
+    if not os.path.isdir(get_project_path(get_players_dir(country, mode), test)):
+        logger.info('No player histories yet, generating them from every rankings')
+        return generate_player_histories(country, mode, test)
+
+    date_string = date.strftime('%Y/%m/%d')
+    data = get_data_at_date(date=date_string, country=country, mode=mode, test=test)
+
+    if data is None:
+        logger.warning('No rankings for %s to append to the player histories', date_string)
+        return 0
+
+    written = 0
+
+    for uid, player in map_player_data(data).items():
+        history_path = get_player_history_path(uid, country, mode)
+        row = [date_string, *[player.get(stat, 0) for stat in HISTORY_STATS]]
+
+        history = get_json(file_path=history_path, test=test)
+
+        if history is None:
+            history = _create_history(uid, player['ign'], data['update_date'], country, mode, [])
+
+        rows = history['data']
+
+        # already appended, e.g. a rerun of the same day
+        if rows and rows[-1][0] >= date_string:
+            continue
+
+        # older rows are thinned out as they pass the cutoff, so the file stays small
+        history['data'] = downsample_history([*rows, row], latest_date=date_string)
+        history['ign'] = player['ign']
+        history['update_date'] = data['update_date']
+
+        write_json(file_path=history_path, data=history, test=test)
+        written += 1
+
+    return written
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generates the per player history files from all of the rankings.')
+
+    parser.add_argument('--mode', type=str, default='fruits',
+                        help='Define what mode, uses the parameters used on osu site.')
+    parser.add_argument('--country', type=str, default='PH',
+                        help='What country to generate for. Uses 2 letter country codes.')
+    parser.add_argument('--test', action='store_true', help='Just do tests')
+
+    args = parser.parse_args()
+
+    if args.test:
+        setup_logging(level=logging.DEBUG)
+
+    generate_player_histories(country=args.country, mode=args.mode, test=args.test)
@@ -0,0 +1,236 @@
+import argparse
+import heapq
+import logging
+from datetime import datetime
+
+from scripts.json_player_data import (
+    RawPlayerDataCollection,
+    get_data_at_date,
+    get_file_stem,
+    get_json,
+    get_manifest,
+    write_json,
+)
+from scripts.logging_config import setup_logging, logger
+from scripts.migrations import BEATMAP_MAP, PP_RECORDS_MAP
+
+# how many scores the all-time top keeps
+TOP_SCORES = 100
+
+INDEX_MAP = ['date', *PP_RECORDS_MAP]
+
+_PP_INDEX = INDEX_MAP.index('score_pp')
+_DATE_INDEX = INDEX_MAP.index('date')
+_USER_INDEX = INDEX_MAP.index('user_id')
+_BEATMAP_INDEX = INDEX_MAP.index('beatmap_id')
+
+
+def get_pp_records_index_path(country: str, mode: str) -> str:
+    return f'docs/data/records/{get_file_stem(country, mode)}.json'
+
+
+def create_pp_records_index(country: str, mode: str) -> dict:
+    """An empty index. Every structure refers to the scores by id:
+    ```
+    scores: {score_id: INDEX_MAP row}  # only the ones referenced below
+    top: list[score_id]  # at most TOP_SCORES, highest pp first
+    player_best: {user_id: score_id}
+    beatmap_best: {beatmap_id: score_id}
+    beatmaps: {beatmap_id: BEATMAP_MAP row}  # for the scores above
+    ```
+    """
+    return {
+        'file_version': 1,
+        'type': 'pp-records-index',
+        'update_date': None,
+        'last_date': None,
+        'mode': mode,
+        'country': country,
+        'map': INDEX_MAP,
+        'key': 'score_id',
+        'scores': {},
+        'top': [],
+        'player_best': {},
+        'beatmap_best': {},
+        'beatmaps_map': BEATMAP_MAP,
+        'beatmaps': {},
+    }
+
+
+def _is_better(row: list, other: list | None) -> bool:
+    # on a tie the older score stays, it was there first
+    if other is None:
+        return True
+
+    return (row[_PP_INDEX], other[_DATE_INDEX]) > (other[_PP_INDEX], row[_DATE_INDEX])
+
+
+def _merge_scores(index: dict, scores: dict[str, list], beatmaps: dict[str, list], update_date: float) -> None:
+    """Merges scores into the index, in place. Costs O(scores + TOP_SCORES),
+    no matter how big the index is.
+    """
+    candidates = {score_id: index['scores'][score_id] for score_id in index['top']}
+    # scores that might not be referenced anymore
+    replaced = set()
+
+    for score_id, row in scores.items():
+        # the same score can be on more than one day, keep the first
+        known_row = index['scores'].get(score_id) or candidates.get(score_id)
+        if known_row is not None and known_row[_DATE_INDEX] <= row[_DATE_INDEX]:
+            row = known_row
+
+        candidates[score_id] = row
+        index['scores'][score_id] = row
+        replaced.add(score_id)
+
+        # every beatmap keeps its best score, so its metadata is always needed, newest first
+        if str(row[_BEATMAP_INDEX]) in beatmaps:
+            index['beatmaps'][str(row[_BEATMAP_INDEX])] = beatmaps[str(row[_BEATMAP_INDEX])]
+
+        for best, key in ((index['player_best'], _USER_INDEX), (index['beatmap_best'], _BEATMAP_INDEX)):
+            best_id = best.get(str(row[key]))
+
+            if best_id != score_id and _is_better(row, index['scores'].get(best_id)):
+                best[str(row[key])] = score_id
+                replaced.add(best_id)
+
+    replaced.update(index['top'])
+    index['top'] = heapq.nlargest(
+        TOP_SCORES,
+        candidates,
+        key=lambda score_id: (candidates[score_id][_PP_INDEX], -int(candidates[score_id][_DATE_INDEX].replace('/', ''))),
+    )
+    top = set(index['top'])
+
+    for score_id in replaced:
+        row = index['scores'].get(score_id)
+
+        if row is None:
+            continue
+
+        if (
+                score_id not in top
+                and index['player_best'].get(str(row[_USER_INDEX])) != score_id
+                and index['beatmap_best'].get(str(row[_BEATMAP_INDEX])) != score_id
+        ):
+            del index['scores'][score_id]
+
+    if update_date is not None:
+        index['update_date'] = max(update_date, index['update_date'] or 0)
+
+
+def merge_pp_records(index: dict, records: RawPlayerDataCollection, date: str) -> dict:
+    """Merges a day of pp-records into the index, in place.
+
+    Args:
+        index (dict): The index, from `create_pp_records_index()`
+        records (RawPlayerDataCollection): The pp-records of the day, on the current file version
+        date (str): The date of the pp-records, in YYYY/MM/DD format
+
+    Returns:
+        dict: the same index
+    """
+    scores = {
+        score_id: [date, *row]
+        for score_id, row in records['data'].items()
+        if row[PP_RECORDS_MAP.index('score_pp')] is not None
+    }
+
+    _merge_scores(index, scores, records.get('beatmaps', {}), records['update_date'])
+    index['last_date'] = max(date, index['last_date'] or date)
+
+    return index
+
+
+def merge_pp_records_indexes(index: dict, newer_index: dict) -> dict:
+    """Merges an index built from later dates into another, in place. Used to
+    put together indexes that were built in parallel.
+
+    Returns:
+        dict: the older index
+    """
+    _merge_scores(index, newer_index['scores'], newer_index['beatmaps'], newer_index['update_date'])
+    index['last_date'] = max(filter(None, [index['last_date'], newer_index['last_date']]), default=None)
+
+    return index
+
+
+def build_pp_records_index(dates: list[str], country: str, mode: str, test: bool = False) -> dict:
+    """Builds the index from the pp-records on the dates.
+
+    Args:
+        dates (list[str]): Dates in YYYY/MM/DD format that have pp-records, oldest first
+        country (str): 2 Letter country code
+        mode (str): osu/taiko/fruits/mania
+        test (bool, optional): Use data from tests/. Defaults to False.
+
+    Returns:
+        dict: the index
+    """
+    index = create_pp_records_index(country, mode)
+
+    for date in dates:
+        records = get_data_at_date(date=date, country=country, mode=mode, file_type='pp-records', test=test)
+
+        if records is not None:
+            merge_pp_records(index, records, date)
+
+    return index
+
+
+def write_pp_records_index(index: dict, test: bool = False) -> str:
+    return write_json(file_path=get_pp_records_index_path(index['country'], index['mode']), data=index, test=test)
+
+
+def update_pp_records_index(date: datetime, country: str, mode: str, test: bool = False) -> str | None:
+    """Merges the pp-records of the date into the index, building it from
+    every pp-records if there is none yet.
+
+    Args:
+        date (datetime): The date of the pp-records
+        country (str): 2 Letter country code
+        mode (str): osu/taiko/fruits/mania
+        test (bool, optional): Use data from tests/. Defaults to False.
+
+    Returns:
+        str | None: the output file, `None` if there was nothing to merge
+    """
+    date_string = date.strftime('%Y/%m/%d')
+    index = get_json(file_path=get_pp_records_index_path(country, mode), test=test)
+
+    if index is None:
+        logger.info('No pp records index yet, building it from every pp-records')
+        dates = get_manifest(test).get(get_file_stem(country, mode, 'pp-records'), [])
+        return write_pp_records_index(build_pp_records_index(dates, country, mode, test), test)
+
+    # already merged, e.g. a rerun of the same day
+    if index['last_date'] is not None and index['last_date'] >= date_string:
+        logger.info('pp records index already has %s', date_string)
+        return None
+
+    records = get_data_at_date(date=date_string, country=country, mode=mode, file_type='pp-records', test=test)
+
+    if records is None:
+        logger.warning('No pp-records for %s to add to the index', date_string)
+        return None
+
+    return write_pp_records_index(merge_pp_records(index, records, date_string), test)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Builds the all-time pp records index from every pp-records.')
+
+    parser.add_argument('--mode', type=str, default='fruits',
+                        help='Define what mode, uses the parameters used on osu site.')
+    parser.add_argument('--country', type=str, default='PH',
+                        help='What country to build for. Uses 2 letter country codes.')
+    parser.add_argument('--test', action='store_true', help='Just do tests')
+
+    args = parser.parse_args()
+
+    if args.test:
+        setup_logging(level=logging.DEBUG)
+
+    record_dates = get_manifest(args.test).get(get_file_stem(args.country, args.mode, 'pp-records'), [])
+    output_file = write_pp_records_index(build_pp_records_index(record_dates, args.country, args.mode, args.test), args.test)
+    logger.info('pp records index created at: %s', output_file)
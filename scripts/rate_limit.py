@@ -0,0 +1,87 @@
+"""A token bucket for the osu! api requests, shared between processes.
+
+The bucket lives in shared memory, so every process of a pool that got it
+from the parent takes its tokens from the same place and together they stay
+under one rate.
+"""
+import multiprocessing
+import time
+
+# the api allows 1200 requests a minute, this stays well under it
+DEFAULT_RATE = 10.0
+DEFAULT_BURST = 20
+
+
+class TokenBucket:
+    """Lets `rate` requests through a second on average, and up to `burst`
+    at once after a quiet while.
+
+    Pass it to the processes through `initargs` of the pool (or as an
+    argument of `multiprocessing.Process`), it cannot be sent to a process
+    that is already running.
+
+    Args:
+        rate (float, optional): Tokens added per second. Defaults to `DEFAULT_RATE`.
+        burst (int, optional): Most tokens the bucket holds. Defaults to `DEFAULT_BURST`.
+    """
+
+    def __init__(self, rate: float = DEFAULT_RATE, burst: int = DEFAULT_BURST):
+        self.rate = rate
+        self.burst = burst
+
+        # [tokens, time of the last refill], starts full
+        self._state = multiprocessing.Array('d', [float(burst), time.monotonic()], lock=False)
+        self._lock = multiprocessing.Lock()
+
+        # counted per process, see `get_stats()`
+        self.acquired = 0
+        self.waited = 0.0
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        state['acquired'] = 0
+        state['waited'] = 0.0
+        return state
+
+    def _take(self, tokens: float) -> float:
+        """Takes the tokens if there are enough.
+
+        Returns:
+            float: 0 if they were taken, otherwise the seconds until there are enough
+        """
+        with self._lock:
+            now = time.monotonic()
+            available = min(float(self.burst), self._state[0] + (now - self._state[1]) * self.rate)
+            self._state[1] = now
+
+            if available >= tokens:
+                self._state[0] = available - tokens
+                return 0.0
+
+            self._state[0] = available
+            return (tokens - available) / self.rate
+
+    def acquire(self, tokens: float = 1) -> float:
+        """Blocks until the tokens are taken.
+
+        Returns:
+            float: the seconds it waited
+        """
+        start_time = time.monotonic()
+
+        while (delay := self._take(tokens)) > 0:
+            time.sleep(delay)
+
+        waited = time.monotonic() - start_time
+
+        # the stages of a job can run on several threads
+        with self._lock:
+            self.acquired += 1
+            self.waited += waited
+
+        return waited
+
+    def get_stats(self) -> dict:
+        """What this process took from the bucket."""
+        with self._lock:
+            return {'requests': self.acquired, 'rate_limit_wait': self.waited}
@@ -0,0 +1,328 @@
+import os
+from datetime import datetime, timedelta
+
+from scripts.cumulative_index import get_range_difference
+from scripts.daily_diff import get_daily_diff
+from scripts.json_player_data import (
+    MappedPlayerDataCollection,
+    RawPlayerDataCollection,
+    dump_to_file,
+    get_data_at_date,
+    get_data_file_path,
+    get_project_path,
+    map_player_data,
+)
+from scripts.logging_config import logger
+
+WINDOWS = [7, 30]
+
+# most active, pp farmers and rank climbers
+WINDOW_STATS = [
+    'play_count',
+    'pp',
+    'country_rank',
+]
+
+
+def get_window_type(days: int) -> str:
+    return f'window-{days}d'
+
+
+def build_rolling_window(
+        days: int,
+        previous_window: RawPlayerDataCollection,
+        today_diff: RawPlayerDataCollection,
+        outgoing_diff: RawPlayerDataCollection | None,
+        player_names: dict[str, str],
+) -> RawPlayerDataCollection:
+    """Moves the window one day forward: adds today's diff and subtracts the
+    diff of the day that falls out of the window, so it costs O(players) no
+    matter how long the window is.
+
+    Args:
+        days (int): The length of the window
+        previous_window (RawPlayerDataCollection): Yesterday's window
+        today_diff (RawPlayerDataCollection): Today's diff file
+        outgoing_diff (RawPlayerDataCollection | None): The diff `days` days ago, `None` if there is none
+        player_names (dict[str, str]): uid to ign, for players new to the window
+
+    Returns:
+        RawPlayerDataCollection: today's window
+    """
+    totals = _window_totals(previous_window)
+
+    _add_diff(totals, today_diff, 1)
+
+    if outgoing_diff is not None:
+        _add_diff(totals, outgoing_diff, -1)
+
+    names = {uid: player['ign'] for uid, player in map_player_data(previous_window).items()}
+    names.update(player_names)
+
+    return _create_window(days, today_diff['update_date'], today_diff, totals, names)
+
+
+def seed_rolling_window(
+        days: int,
+        date: datetime,
+        today_diff: RawPlayerDataCollection,
+        player_names: dict[str, str],
+        test: bool = False,
+) -> RawPlayerDataCollection:
+    """Starts a window from scratch, used when yesterday's window is missing.
+
+    The gains come from the cumulative indexes at both ends of the window.
+    Without those, it falls back on adding up every diff in the window.
+
+    Args:
+        days (int): The length of the window
+        date (datetime): The last day of the window
+        today_diff (RawPlayerDataCollection): Today's diff file
+        player_names (dict[str, str]): uid to ign
+        test (bool, optional): Use data from tests/. Defaults to False.
+
+    Returns:
+        RawPlayerDataCollection: today's window
+    """
+    country = today_diff['country']
+    mode = today_diff['mode']
+    totals: dict[str, list[int]] = {}
+
+    processed_data = get_range_difference(
+        start_date=date - timedelta(days=days),
+        end_date=date,
+        country=country,
+        mode=mode,
+        test=test,
+    )
+
+    if processed_data.data_difference is not None:
+        for uid, player in processed_data.data_difference.items():
+            totals[uid] = [player.get(stat, 0) for stat in WINDOW_STATS]
+    else:
+        logger.info('No cumulative index for the %sd window, adding up the diffs instead', days)
+
+        _add_diff(totals, today_diff, 1)
+
+        for offset in range(1, days):
+            diff = get_daily_diff(date=date - timedelta(days=offset), country=country, mode=mode, test=test)
+
+            if diff is not None:
+                _add_diff(totals, diff, 1)
+
+    return _create_window(days, today_diff['update_date'], today_diff, totals, player_names)
+
+
+def _window_totals(window: RawPlayerDataCollection) -> dict[str, list[int]]:
+    return {
+        uid: [player.get(stat, 0) for stat in WINDOW_STATS]
+        for uid, player in map_player_data(window).items()
+    }
+
+
+def _add_diff(totals: dict[str, list[int]], diff: RawPlayerDataCollection, sign: int) -> None:
+    indexes = [diff['map'].index(stat) if stat in diff['map'] else None for stat in WINDOW_STATS]
+
+    for uid, values in diff['data'].items():
+        row = totals.setdefault(uid, [0] * len(WINDOW_STATS))
+
+        for i, index in enumerate(indexes):
+            if index is not None:
+                row[i] += sign * values[index]
+
+
+def _create_window(
+        days: int,
+        update_date: float,
+        today_diff: RawPlayerDataCollection,
+        totals: dict[str, list[int]],
+        names: dict[str, str],
+) -> RawPlayerDataCollection:
+    window: RawPlayerDataCollection = {
+        'file_version': 1,
+        'type': get_window_type(days),
+        'days': days,
+        'update_date': update_date,
+        'mode': today_diff['mode'],
+        'country': today_diff['country'],
+        'map': ['ign', *WINDOW_STATS],
+        'key': 'id',
+        'data': {},
+    }
+
+    for uid, row in totals.items():
+        # players who did nothing in the window only take up space
+        if not any(row):
+            continue
+
+        window['data'][uid] = [names.get(uid, '???'), *row]
+
+    return window
+
+
+def get_window_leaders(
+        window: RawPlayerDataCollection,
+        stat: str,
+        top: int = 5,
+) -> MappedPlayerDataCollection:
+    """Gets the players with the highest gains on the window.
+
+    Args:
+        window (RawPlayerDataCollection): The window
+        stat (str): One of `WINDOW_STATS`
+        top (int, optional): How many players to get. Defaults to 5.
+
+    Returns:
+        MappedPlayerDataCollection: The top players, highest first
+    """
+    mapped_data = map_player_data(window)
+
+    leaders = sorted(
+        [uid for uid in mapped_data if mapped_data[uid][stat] > 0],
+        key=lambda uid: mapped_data[uid][stat],
+        reverse=True,
+    )[:top]
+
+    return {uid: mapped_data[uid] for uid in leaders}
+
+
+def build_window_history(
+        days: int,
+        start_date: datetime,
+        end_date: datetime,
+        country: str,
+        mode: str,
+        test: bool = False,
+) -> list[tuple[datetime, RawPlayerDataCollection]]:
+    """Builds the windows for every day between two dates by sliding one
+    window across them, for rebuilding the history. Only the first day has
+    to add up a whole window of diffs.
+
+    Args:
+        days (int): The length of the window
+        start_date (datetime): The first day to build
+        end_date (datetime): The last day to build
+        country (str): 2 Letter country code
+        mode (str): osu/taiko/fruits/mania
+        test (bool, optional): Use data from tests/. Defaults to False.
+
+    Returns:
+        list[tuple[datetime, RawPlayerDataCollection]]: the date and window, for the days that have a diff file
+    """
+    diffs: dict[datetime, RawPlayerDataCollection | None] = {}
+
+    def diff_at(date: datetime) -> RawPlayerDataCollection | None:
+        if date not in diffs:
+            date_string = date.strftime('%Y/%m/%d')
+            diff_path = get_data_file_path(date=date_string, country=country, mode=mode, file_type='diff')
+
+            diffs[date] = None
+            if os.path.exists(get_project_path(diff_path, test)):
+                diffs[date] = get_data_at_date(date=date_string, country=country, mode=mode, file_type='diff', test=test)
+        return diffs[date]
+
+    def names_at(date: datetime) -> dict[str, str]:
+        rankings = get_data_at_date(date=date.strftime('%Y/%m/%d'), country=country, mode=mode, test=test)
+        return {uid: player['ign'] for uid, player in map_player_data(rankings).items()} if rankings else {}
+
+    totals: dict[str, list[int]] = {}
+    names: dict[str, str] = {}
+
+    # a player whose gains went back to 0 loses their name until they are on
+    # the rankings again, so the windows of the `days` days before are also
+    # slid through to get the names the way the daily update has them
+    warmup_date = start_date - timedelta(days=days)
+
+    # the window that ends the day before the warmup, the first loop moves it forward
+    for offset in range(days, 0, -1):
+        diff = diff_at(warmup_date - timedelta(days=offset))
+
+        if diff is not None:
+            _add_diff(totals, diff, 1)
+            names.update(names_at(warmup_date - timedelta(days=offset)))
+
+    windows = []
+    date = warmup_date
+
+    while date <= end_date:
+        today_diff = diff_at(date)
+        outgoing_diff = diff_at(date - timedelta(days=days))
+
+        if today_diff is not None:
+            _add_diff(totals, today_diff, 1)
+
+        if outgoing_diff is not None:
+            _add_diff(totals, outgoing_diff, -1)
+
+        # the outgoing day is not needed anymore
+        diffs.pop(date - timedelta(days=days), None)
+
+        if today_diff is not None:
+            # like `build_rolling_window()`, the names of yesterday's window are
+            # kept for the players that left the rankings
+            names.update(names_at(date))
+            window = _create_window(days, today_diff['update_date'], today_diff, totals, names)
+            names = {uid: row[0] for uid, row in window['data'].items()}
+
+            if date >= start_date:
+                windows.append((date, window))
+        else:
+            # no window today, so tomorrow's starts over with only its rankings
+            # names, see `update_rolling_windows()`
+            names = {}
+
+        date += timedelta(days=1)
+
+    return windows
+
+
+def update_rolling_windows(
+        date: datetime,
+        country: str,
+        mode: str,
+        test: bool = False,
+        formatted: bool = False,
+) -> list[str]:
+    """Moves every window in `WINDOWS` to the date and writes them next to
+    that day's rankings.
+
+    Args:
+        date (datetime): The date of the latest rankings
+        country (str): 2 Letter country code
+        mode (str): osu/taiko/fruits/mania
+        test (bool, optional): Use data from tests/. Defaults to False.
+        formatted (bool, optional): Make the output .json somewhat readable. Defaults to False.
+
+    Returns:
+        list[str]: the output files
+    """
+    today_diff = get_daily_diff(date=date, country=country, mode=mode, test=test)
+
+    if today_diff is None:
+        logger.info('No diff for today, skipping the rolling windows')
+        return []
+
+    rankings = get_data_at_date(date=date.strftime('%Y/%m/%d'), country=country, mode=mode, test=test)
+    player_names = {uid: player['ign'] for uid, player in map_player_data(rankings).items()}
+
+    output_files = []
+
+    for days in WINDOWS:
+        previous_window = get_data_at_date(
+            date=(date - timedelta(days=1)).strftime('%Y/%m/%d'),
+            country=country,
+            mode=mode,
+            file_type=get_window_type(days),
+            test=test,
+        )
+
+        if previous_window is None:
+            logger.info('No %sd window yesterday, starting a new one', days)
+            window = seed_rolling_window(days, date, today_diff, player_names, test)
+        else:
+            outgoing_diff = get_daily_diff(date=date - timedelta(days=days), country=country, mode=mode, test=test)
+            window = build_rolling_window(days, previous_window, today_diff, outgoing_diff, player_names)
+
+        output_files.append(dump_to_file(data=window, test=test, formatted=formatted, date=date))
+
+    return output_files
@@ -0,0 +1,293 @@
+import argparse
+import logging
+import os
+from datetime import datetime
+
+from scripts.json_player_data import (
+    RawPlayerDataCollection,
+    get_data_at_date,
+    get_file_stem,
+    get_json,
+    get_manifest,
+    get_project_path,
+    write_json,
+)
+from scripts.logging_config import setup_logging, logger
+
+NAMES_MAP = ['name', 'past_names']
+
+# names are indexed by every 3 characters in them and their last 2, and
+# sharded by the first 2
+GRAM_SIZE = 3
+SHARD_KEY_SIZE = 2
+
+
+def get_search_dir(country: str, mode: str) -> str:
+    return f'docs/data/search/{get_file_stem(country, mode)}'
+
+
+def get_shard_key(text: str) -> str:
+    """The shard a normalized gram or query is in, as a file name safe hex
+    of its first characters. The site does the same in `player-search.js`.
+    """
+    return text[:SHARD_KEY_SIZE].encode('utf-8').hex()
+
+
+def get_shard_path(shard_key: str, country: str, mode: str) -> str:
+    return f'{get_search_dir(country, mode)}/{shard_key}.json'
+
+
+def normalize_name(name: str) -> str:
+    return name.lower()
+
+
+def get_grams(name: str) -> set[str]:
+    """Every 3 characters of the normalized name, names shorter than that
+    are a gram of their own. The last 2 characters are a gram too, a 2
+    character query at the end of a name does not start any of the others.
+    """
+    name = normalize_name(name)
+    end_gram = {name[-SHARD_KEY_SIZE:]} if len(name) >= SHARD_KEY_SIZE else set()
+
+    if len(name) <= GRAM_SIZE:
+        return {name} | end_gram
+
+    return {name[i:i + GRAM_SIZE] for i in range(len(name) - GRAM_SIZE + 1)} | end_gram
+
+
+def create_search_names(country: str, mode: str) -> RawPlayerDataCollection:
+    """Every name ever seen per player:
+    ```
+    data: {uid: [name, past_names]}  # past_names oldest first
+    last_date: str  # the latest rankings merged
+    ```
+    """
+    return {
+        'file_version': 1,
+        'type': 'search-names',
+        'update_date': None,
+        'last_date': None,
+        'mode': mode,
+        'country': country,
+        'map': NAMES_MAP,
+        'key': 'id',
+        'data': {},
+    }
+
+
+def merge_names(names: RawPlayerDataCollection, players: dict[str, str], date: str, update_date: float) -> list[tuple[str, str]]:
+    """Adds the current names of the players, in place. Dates have to be
+    merged oldest first.
+
+    Args:
+        names (RawPlayerDataCollection): From `create_search_names()`
+        players (dict[str, str]): uid to their name on the date
+        date (str): The date, in YYYY/MM/DD format
+        update_date (float): The update_date of the rankings
+
+    Returns:
+        list[tuple[str, str]]: the `(uid, name)` pairs that were not seen before
+    """
+    data = names['data']
+    new_names = []
+
+    for uid, name in players.items():
+        row = data.get(uid)
+
+        if row is None:
+            data[uid] = [name, []]
+            new_names.append((uid, name))
+        elif row[0] != name:
+            # a name can come back, it is only indexed once
+            if name not in row[1]:
+                new_names.append((uid, name))
+            else:
+                row[1].remove(name)
+
+            row[1].append(row[0])
+            row[0] = name
+
+    names['last_date'] = max(date, names['last_date'] or date)
+    names['update_date'] = update_date
+
+    return new_names
+
+
+def _get_players(rankings: RawPlayerDataCollection) -> dict[str, str]:
+    ign_index = rankings['map'].index('ign')
+    return {uid: row[ign_index] for uid, row in rankings['data'].items()}
+
+
+def collect_names(dates: list[str], country: str, mode: str, test: bool = False) -> RawPlayerDataCollection:
+    """Collects every name on the rankings of the dates.
+
+    Args:
+        dates (list[str]): Dates in YYYY/MM/DD format that have rankings, oldest first
+        country (str): 2 Letter country code
+        mode (str): osu/taiko/fruits/mania
+        test (bool, optional): Use data from tests/. Defaults to False.
+
+    Returns:
+        RawPlayerDataCollection: the names, from `create_search_names()`
+    """
+    names = create_search_names(country, mode)
+
+    for date in dates:
+        rankings = get_data_at_date(date=date, country=country, mode=mode, test=test)
+
+        if rankings is not None:
+            merge_names(names, _get_players(rankings), date, rankings['update_date'])
+
+    return names
+
+
+def merge_collected_names(names: RawPlayerDataCollection, newer_names: RawPlayerDataCollection) -> RawPlayerDataCollection:
+    """Merges names collected from later dates into others, in place. Used to
+    put together names that were collected in parallel.
+
+    Returns:
+        RawPlayerDataCollection: the older names
+    """
+    for uid, (name, past_names) in newer_names['data'].items():
+        row = names['data'].get(uid)
+
+        if row is None:
+            names['data'][uid] = [name, past_names]
+            continue
+
+        history = [*row[1], row[0], *past_names, name]
+
+        # only the last time a name was used counts
+        ordered = list(reversed(dict.fromkeys(reversed(history))))
+        names['data'][uid] = [ordered[-1], ordered[:-1]]
+
+    names['last_date'] = newer_names['last_date'] or names['last_date']
+    names['update_date'] = newer_names['update_date'] or names['update_date']
+
+    return names
+
+
+def build_shards(names: RawPlayerDataCollection) -> dict[str, dict[str, list[list[str]]]]:
+    """Indexes every current and past name.
+
+    Returns:
+        dict: shard key to `{gram: [[uid, name], ...]}`
+    """
+    shards: dict[str, dict[str, list[list[str]]]] = {}
+
+    for uid, (name, past_names) in names['data'].items():
+        for indexed_name in [name, *past_names]:
+            _add_to_shards(shards, uid, indexed_name)
+
+    return shards
+
+
+def _add_to_shards(shards: dict[str, dict[str, list[list[str]]]], uid: str, name: str) -> None:
+    for gram in get_grams(name):
+        entries = shards.setdefault(get_shard_key(gram), {}).setdefault(gram, [])
+
+        if [uid, name] not in entries:
+            entries.append([uid, name])
+
+
+def write_search_index(
+        names: RawPlayerDataCollection,
+        shards: dict[str, dict[str, list[list[str]]]],
+        test: bool = False,
+) -> int:
+    """Writes the names and the shards.
+
+    Returns:
+        int: how many shards were written
+    """
+    country, mode = names['country'], names['mode']
+
+    for shard_key, shard in shards.items():
+        write_json(file_path=get_shard_path(shard_key, country, mode), data=shard, test=test)
+
+    write_json(file_path=f'{get_search_dir(country, mode)}/names.json', data=names, test=test)
+    return len(shards)
+
+
+def generate_search_index(names: RawPlayerDataCollection, test: bool = False) -> int:
+    """Writes the whole index from the names, replacing the old shards.
+
+    Returns:
+        int: how many shards were written
+    """
+    search_dir = get_project_path(get_search_dir(names['country'], names['mode']), test)
+
+    if os.path.isdir(search_dir):
+        for file_name in os.listdir(search_dir):
+            os.remove(os.path.join(search_dir, file_name))
+
+    return write_search_index(names, build_shards(names), test)
+
+
+def update_search_index(date: datetime, country: str, mode: str, test: bool = False) -> int:
+    """Adds the names on the rankings of the date to the index. Only the
+    shards of the names never seen before are touched.
+
+    Args:
+        date (datetime): The date of the rankings
+        country (str): 2 Letter country code
+        mode (str): osu/taiko/fruits/mania
+        test (bool, optional): Use data from tests/. Defaults to False.
+
+    Returns:
+        int: how many shards were written
+    """
+    date_string = date.strftime('%Y/%m/%d')
+    names = get_json(file_path=f'{get_search_dir(country, mode)}/names.json', test=test)
+
+    if names is None:
+        logger.info('No search index yet, building it from every rankings')
+        dates = get_manifest(test).get(get_file_stem(country, mode), [])
+        return generate_search_index(collect_names(dates, country, mode, test), test)
+
+    # already merged, e.g. a rerun of the same day
+    if names['last_date'] is not None and names['last_date'] >= date_string:
+        logger.info('search index already has %s', date_string)
+        return 0
+
+    rankings = get_data_at_date(date=date_string, country=country, mode=mode, test=test)
+
+    if rankings is None:
+        logger.warning('No rankings for %s to add to the search index', date_string)
+        return 0
+
+    new_names = merge_names(names, _get_players(rankings), date_string, rankings['update_date'])
+    shards = {}
+
+    for uid, name in new_names:
+        for gram in get_grams(name):
+            shard_key = get_shard_key(gram)
+
+            if shard_key not in shards:
+                shard_path = get_shard_path(shard_key, country, mode)
+                exists = os.path.exists(get_project_path(shard_path, test))
+                shards[shard_key] = get_json(file_path=shard_path, test=test) if exists else {}
+
+        _add_to_shards(shards, uid, name)
+
+    logger.info('%s new names in the search index', len(new_names))
+    return write_search_index(names, shards, test)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Builds the player search index from every rankings.')
+
+    parser.add_argument('--mode', type=str, default='fruits',
+                        help='Define what mode, uses the parameters used on osu site.')
+    parser.add_argument('--country', type=str, default='PH',
+                        help='What country to build for. Uses 2 letter country codes.')
+    parser.add_argument('--test', action='store_true', help='Just do tests')
+
+    args = parser.parse_args()
+
+    if args.test:
+        setup_logging(level=logging.DEBUG)
+
+    ranking_dates = get_manifest(args.test).get(get_file_stem(args.country, args.mode), [])
+    shard_count = generate_search_index(collect_names(ranking_dates, args.country, args.mode, args.test), args.test)
+    logger.info('Search index created with %s shards', shard_count)
@@ -0,0 +1,223 @@
+import argparse
+import bisect
+import logging
+from datetime import datetime
+
+from scripts.json_player_data import (
+    RawPlayerDataCollection,
+    get_data_at_date,
+    get_file_stem,
+    get_json,
+    get_manifest,
+    write_json,
+)
+from scripts.logging_config import setup_logging, logger
+
+SEEN_MAP = ['first_seen', 'last_seen', 'previous_seen']
+
+_FIRST_SEEN, _LAST_SEEN, _PREVIOUS_SEEN = range(len(SEEN_MAP))
+
+
+def get_seen_players_path(country: str, mode: str) -> str:
+    return f'docs/data/seen/{get_file_stem(country, mode)}.json'
+
+
+def create_seen_players(country: str, mode: str) -> RawPlayerDataCollection:
+    """An empty index of every player ever seen on the rankings:
+    ```
+    data: {uid: [first_seen, last_seen, previous_seen]}  # dates, previous_seen is the appearance before last_seen
+    dates: list[str]  # every rankings merged, oldest first
+    incomplete_dates: list[str]  # rankings that had pages missing
+    ```
+    """
+    return {
+        'file_version': 1,
+        'type': 'seen-players',
+        'update_date': None,
+        'mode': mode,
+        'country': country,
+        'map': SEEN_MAP,
+        'key': 'id',
+        'data': {},
+        'dates': [],
+        'incomplete_dates': [],
+    }
+
+
+def merge_rankings(seen: RawPlayerDataCollection, rankings: RawPlayerDataCollection, date: str) -> RawPlayerDataCollection:
+    """Marks every player on the rankings as seen on the date, in place.
+    Dates have to be merged oldest first.
+
+    Args:
+        seen (RawPlayerDataCollection): The index, from `create_seen_players()`
+        rankings (RawPlayerDataCollection): The rankings of the date, on the current file version
+        date (str): The date of the rankings, in YYYY/MM/DD format
+
+    Returns:
+        RawPlayerDataCollection: the same index
+    """
+    data = seen['data']
+
+    for uid in rankings['data']:
+        row = data.get(uid)
+
+        if row is None:
+            data[uid] = [date, date, None]
+        elif row[_LAST_SEEN] != date:
+            row[_PREVIOUS_SEEN] = row[_LAST_SEEN]
+            row[_LAST_SEEN] = date
+
+    if rankings.get('incomplete') and date not in seen['incomplete_dates']:
+        seen['incomplete_dates'].append(date)
+
+    if not seen['dates'] or seen['dates'][-1] != date:
+        seen['dates'].append(date)
+
+    seen['update_date'] = rankings['update_date']
+
+    return seen
+
+
+def merge_seen_players(seen: RawPlayerDataCollection, newer_seen: RawPlayerDataCollection) -> RawPlayerDataCollection:
+    """Merges an index built from later dates into another, in place. Used to
+    put together indexes that were built in parallel.
+
+    Returns:
+        RawPlayerDataCollection: the older index
+    """
+    data = seen['data']
+
+    for uid, (first_seen, last_seen, previous_seen) in newer_seen['data'].items():
+        row = data.get(uid)
+
+        if row is None:
+            data[uid] = [first_seen, last_seen, previous_seen]
+        else:
+            data[uid] = [row[_FIRST_SEEN], last_seen, previous_seen or row[_LAST_SEEN]]
+
+    seen['dates'].extend(newer_seen['dates'])
+    seen['incomplete_dates'].extend(newer_seen['incomplete_dates'])
+    seen['update_date'] = newer_seen['update_date']
+
+    return seen
+
+
+def build_seen_players(dates: list[str], country: str, mode: str, test: bool = False) -> RawPlayerDataCollection:
+    """Builds the index from the rankings on the dates.
+
+    Args:
+        dates (list[str]): Dates in YYYY/MM/DD format that have rankings, oldest first
+        country (str): 2 Letter country code
+        mode (str): osu/taiko/fruits/mania
+        test (bool, optional): Use data from tests/. Defaults to False.
+
+    Returns:
+        RawPlayerDataCollection: the index
+    """
+    seen = create_seen_players(country, mode)
+
+    for date in dates:
+        rankings = get_data_at_date(date=date, country=country, mode=mode, test=test)
+
+        if rankings is not None:
+            merge_rankings(seen, rankings, date)
+
+    return seen
+
+
+def get_seen_players(country: str, mode: str, test: bool = False) -> RawPlayerDataCollection | None:
+    return get_json(file_path=get_seen_players_path(country, mode), test=test)
+
+
+def write_seen_players(seen: RawPlayerDataCollection, test: bool = False) -> str:
+    return write_json(file_path=get_seen_players_path(seen['country'], seen['mode']), data=seen, test=test)
+
+
+def update_seen_players(date: datetime, country: str, mode: str, test: bool = False) -> str | None:
+    """Marks the players on the rankings of the date as seen, building the
+    index from every rankings if there is none yet.
+
+    Args:
+        date (datetime): The date of the rankings
+        country (str): 2 Letter country code
+        mode (str): osu/taiko/fruits/mania
+        test (bool, optional): Use data from tests/. Defaults to False.
+
+    Returns:
+        str | None: the output file, `None` if there was nothing to merge
+    """
+    date_string = date.strftime('%Y/%m/%d')
+    seen = get_seen_players(country, mode, test)
+
+    if seen is None:
+        logger.info('No seen players index yet, building it from every rankings')
+        dates = get_manifest(test).get(get_file_stem(country, mode), [])
+        return write_seen_players(build_seen_players(dates, country, mode, test), test)
+
+    # already merged, e.g. a rerun of the same day
+    if seen['dates'] and seen['dates'][-1] >= date_string:
+        logger.info('seen players index already has %s', date_string)
+        return None
+
+    rankings = get_data_at_date(date=date_string, country=country, mode=mode, test=test)
+
+    if rankings is None:
+        logger.warning('No rankings for %s to add to the seen players index', date_string)
+        return None
+
+    return write_seen_players(merge_rankings(seen, rankings, date_string), test)
+
+
+def classify_player(seen: RawPlayerDataCollection, uid: str) -> tuple[str, int | None]:
+    """Tells why a player on the latest rankings was not on the rankings
+    before it.
+
+    Args:
+        seen (RawPlayerDataCollection): The index, with the latest rankings merged
+        uid (str): The player's id
+
+    Returns:
+        tuple[0]: `new` if never seen before, `returning` if they were gone
+            for a while, `gap` if they might have been on a missing page or
+            day, `present` if they were on the rankings before after all
+        tuple[1]: for `returning`, the days since they were last seen
+    """
+    row = seen['data'].get(uid)
+
+    if row is None or row[_PREVIOUS_SEEN] is None:
+        return 'new', None
+
+    dates = seen['dates']
+    previous_seen = row[_PREVIOUS_SEEN]
+
+    # the rankings they were missing from
+    missed = dates[bisect.bisect_right(dates, previous_seen):bisect.bisect_left(dates, row[_LAST_SEEN])]
+
+    if len(missed) == 0:
+        return 'present', None
+
+    # missing only from incomplete rankings says nothing about them
+    if set(missed).issubset(seen['incomplete_dates']):
+        return 'gap', None
+
+    days = (datetime.strptime(row[_LAST_SEEN], '%Y/%m/%d') - datetime.strptime(previous_seen, '%Y/%m/%d')).days
+    return 'returning', days
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Builds the index of every player ever seen from every rankings.')
+
+    parser.add_argument('--mode', type=str, default='fruits',
+                        help='Define what mode, uses the parameters used on osu site.')
+    parser.add_argument('--country', type=str, default='PH',
+                        help='What country to build for. Uses 2 letter country codes.')
+    parser.add_argument('--test', action='store_true', help='Just do tests')
+
+    args = parser.parse_args()
+
+    if args.test:
+        setup_logging(level=logging.DEBUG)
+
+    ranking_dates = get_manifest(args.test).get(get_file_stem(args.country, args.mode), [])
+    output_file = write_seen_players(build_seen_players(ranking_dates, args.country, args.mode, args.test), args.test)
+    logger.info('Seen players index created at: %s', output_file)
@@ -0,0 +1,328 @@
+import html
+import os
+from typing import Iterator, NamedTuple
+
+from scripts.general_utils import format_duration, simplify_number, timestamp_utc_offset
+from scripts.html_utils import elem, load_template, table_row, table_rows
+from scripts.json_player_data import (
+    RawPlayerDataCollection,
+    get_file_stem,
+    get_project_path,
+    map_beatmap_data,
+    map_player_data,
+)
+from scripts.logging_config import logger
+
+PAGES_DIR = 'docs/pages'
+
+RANKING_TEMPLATE = 'docs/templates/main-page.template.html'
+ACTIVITY_TEMPLATE = 'docs/templates/activity-ranking.template.html'
+PP_RECORDS_TEMPLATE = 'docs/templates/pp-rankings.template.html'
+PLAYER_TEMPLATE = 'docs/templates/player.template.html'
+
+# template variable of each table on the activity page -> the diff stat
+ACTIVITY_TABLES = {
+    'pp_rows': 'pp',
+    'ph_rank_rows': 'country_rank',
+    'play_count_rows': 'play_count',
+    'ranked_score_rows': 'ranked_score',
+    'global_rank_rows': 'global_rank',
+    'acc_rows': 'acc',
+    'play_time_rows': 'play_time',
+    'total_hits_rows': 'total_hits',
+}
+
+# the times on the site are in PH time
+TIME_OFFSET = 8
+TIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+def get_page_path(date: str | None, country: str, mode: str, file_type: str = None) -> str:
+    """The page of a date, or the page of the latest date if it is `None`.
+
+    Returns:
+        str: project root relative path
+    """
+    file_name = f'{get_file_stem(country, mode, file_type)}.html'
+
+    if date is None:
+        return f'{PAGES_DIR}/{file_name}'
+
+    return f'{PAGES_DIR}/{date}/{file_name}'
+
+
+def get_player_page_path(uid: str, country: str, mode: str) -> str:
+    return f'{PAGES_DIR}/players/{get_file_stem(country, mode)}/{uid}.html'
+
+
+class PageLinks(NamedTuple):
+    """The pages a page links to, as project root relative paths.
+
+    rankings, activity, pp_records: the pages of the same day, or the latest
+        ones if that day does not have one
+    previous, next: `(date, page path)` of the days around it, `None` at the ends
+    latest: the page of the latest day
+    """
+    rankings: str
+    activity: str
+    pp_records: str
+    previous: tuple[str, str] | None = None
+    next: tuple[str, str] | None = None
+    latest: str | None = None
+
+
+def _root_of(page_path: str) -> str:
+    # relative path from the page back to docs/
+    return '../' * (page_path.count('/') - 1)
+
+
+def _href(page_path: str, target_path: str) -> str:
+    # relative link from one page to another
+    return _root_of(page_path) + target_path.removeprefix('docs/')
+
+
+def _link_variables(page_path: str, links: PageLinks) -> dict[str, str]:
+    day_links = []
+
+    if links.previous is not None:
+        day_links.append(f'<a href="{_href(page_path, links.previous[1])}">&lt; {links.previous[0]}</a>')
+    if links.latest is not None:
+        day_links.append(f'<a href="{_href(page_path, links.latest)}">Latest</a>')
+    if links.next is not None:
+        day_links.append(f'<a href="{_href(page_path, links.next[1])}">{links.next[0]} &gt;</a>')
+
+    return {
+        'rankings_page': _href(page_path, links.rankings),
+        'activity_page': _href(page_path, links.activity),
+        'pp_records_page': _href(page_path, links.pp_records),
+        'day_links': ' - '.join(day_links),
+    }
+
+
+def write_page(template_path: str, page_path: str, test: bool = False, **variables) -> str:
+    """Renders a template straight into the page file.
+
+    Returns:
+        str: the page path
+    """
+    template = load_template(template_path)
+
+    if template is None:
+        raise FileNotFoundError(f'template {template_path} does not exist')
+
+    full_path = get_project_path(page_path, test)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+
+    with open(full_path, 'w', encoding='utf-8') as file:
+        template.stream(file, root=_root_of(page_path), **variables)
+
+    logger.debug('Created html file at: %s', page_path)
+    return page_path
+
+
+def _number(value, decimals: bool = False) -> str:
+    if value is None:
+        return '???'
+
+    if decimals:
+        return f'{value:,.2f}'
+
+    # like toLocaleString(), at most 3 decimals and no trailing zeroes
+    if isinstance(value, float):
+        return f'{value:,.3f}'.rstrip('0').rstrip('.')
+
+    return f'{value:,}'
+
+
+def _player_cells(uid: str, ign: str, players_dir: str) -> list[str]:
+    return [
+        f'<a href="https://osu.ppy.sh/users/{uid}/fruits" target="_new"><img src="https://a.ppy.sh/{uid}" loading="lazy"></a>',
+        f'<a href="{players_dir}{uid}.html">{html.escape(ign)}</a>',
+    ]
+
+
+def _players_dir(page_path: str, country: str, mode: str) -> str:
+    # relative link to the folder of the player pages
+    return _href(page_path, get_player_page_path('', country, mode).removesuffix('.html'))
+
+
+def ranking_rows(
+        rankings: RawPlayerDataCollection,
+        diff: RawPlayerDataCollection | None,
+        players_dir: str = '',
+) -> Iterator[str]:
+    """The rows of the rankings page, the same as `main-ranking.js` makes them,
+    with the names linking to the player pages in `players_dir`."""
+    differences = map_player_data(diff) if diff is not None else {}
+
+    def stat_cell(value, difference, decimals: bool = False, symbol: str = '') -> str:
+        sup = ''
+
+        if difference and round(difference, 2 if decimals else 0):
+            sup = '<sup class="{}">{}{}</sup>'.format(
+                'increase' if difference > 0 else 'decrease',
+                '+' if difference > 0 else '',
+                _number(difference, decimals),
+            )
+
+        return f'{_number(value, decimals)}{symbol}{sup}'
+
+    players = sorted(map_player_data(rankings).items(), key=lambda item: item[1]['country_rank'])
+
+    for uid, player in players:
+        difference = differences.get(uid, {})
+
+        if difference.get('new_entry'):
+            row_class = 'new-entry'
+        elif difference.get('country_rank', 0) > 0:
+            row_class = 'rank-up'
+        elif difference.get('country_rank', 0) < 0:
+            row_class = 'rank-down'
+        else:
+            row_class = None
+
+        cells = [
+            stat_cell(player['country_rank'], difference.get('country_rank')),
+            *_player_cells(uid, player['ign'], players_dir),
+            stat_cell(player['pp'], difference.get('pp')),
+            stat_cell(player['acc'], difference.get('acc'), decimals=True, symbol='%'),
+            stat_cell(player['play_count'], difference.get('play_count')),
+            stat_cell(player['rank_x'], difference.get('rank_x')),
+            stat_cell(player['rank_s'], difference.get('rank_s')),
+            stat_cell(player['rank_a'], difference.get('rank_a')),
+        ]
+
+        yield table_row(*[elem('td', cell) for cell in cells], **{'class': row_class})
+
+
+def activity_rows(top: list[list], stat: str, players_dir: str = '') -> Iterator[str]:
+    """The rows of a table on the activity page, from a top list of the diff."""
+    if stat == 'play_time':
+        formatter = format_duration
+    elif stat in ('ranked_score', 'total_hits'):
+        formatter = simplify_number
+    else:
+        formatter = lambda value: _number(value, decimals=stat == 'acc')
+
+    return table_rows(
+        [
+            f'<abbr title="{gain}">{formatter(gain)}</abbr>',
+            *_player_cells(uid, ign, players_dir),
+            f'<abbr title="{old}">{formatter(old)}</abbr>',
+            '→',
+            f'<abbr title="{new}">{formatter(new)}</abbr>',
+        ]
+        for uid, ign, gain, old, new in top
+    )
+
+
+def pp_record_rows(records: RawPlayerDataCollection) -> Iterator[str]:
+    """The rows of the pp records page, highest pp first, like `pp-records.js` makes them."""
+    beatmaps = map_beatmap_data(records)
+    scores = sorted(map_player_data(records).items(), key=lambda item: item[1]['score_pp'] or 0, reverse=True)
+
+    def cells(score_id: str, score: dict) -> list[str]:
+        beatmap = beatmaps.get(str(score['beatmap_id']), {})
+        link = f'https://osu.ppy.sh/scores/{score_id}' if score['score_type'] == 'new' \
+            else f'https://osu.ppy.sh/scores/fruits/{score_id}'
+        accuracy = score['accuracy'] * 100 if score['accuracy'] is not None else None
+
+        return [
+            f'<a href="{link}" target="_new">{_number(score["score_pp"], decimals=True)}</a>',
+            f'<img src="https://a.ppy.sh/{score["user_id"]}" loading="lazy">',
+            html.escape(score['user_name'] or '???'),
+            score['score_grade'] or '???',
+            f'<img src="https://assets.ppy.sh/beatmaps/{beatmap.get("beatmapset_id")}/covers/list.jpg" loading="lazy">',
+            html.escape(beatmap.get('beatmapset_title') or '???'),
+            html.escape(beatmap.get('beatmap_version') or '???'),
+            _number(beatmap.get('beatmap_difficulty'), decimals=True),
+            _number(accuracy, decimals=True),
+            str(score['max_combo']) if score['max_combo'] is not None else '???',
+            str(score['count_miss']) if score['count_miss'] is not None else '???',
+            str(score['score_mods']),
+        ]
+
+    return table_rows(cells(score_id, score) for score_id, score in scores)
+
+
+def player_rows(history: dict) -> Iterator[str]:
+    """The rows of a player's page, newest first."""
+    return table_rows(
+        [date, _number(country_rank), _number(pp), _number(play_count)]
+        for date, country_rank, pp, play_count in reversed(history['data'])
+    )
+
+
+def _updated_at(data: dict) -> str:
+    return timestamp_utc_offset(data['update_date'], TIME_OFFSET, TIME_FORMAT) if data.get('update_date') else '???'
+
+
+def write_ranking_page(
+        page_path: str,
+        date: str,
+        rankings: RawPlayerDataCollection,
+        diff: RawPlayerDataCollection | None,
+        links: PageLinks,
+        test: bool = False,
+) -> str:
+    players_dir = _players_dir(page_path, rankings['country'], rankings['mode'])
+
+    return write_page(
+        RANKING_TEMPLATE,
+        page_path,
+        test,
+        date=date,
+        updated_at=_updated_at(rankings),
+        rows=ranking_rows(rankings, diff, players_dir),
+        **_link_variables(page_path, links),
+    )
+
+
+def write_activity_page(
+        page_path: str,
+        date: str,
+        diff: RawPlayerDataCollection,
+        links: PageLinks,
+        test: bool = False,
+) -> str:
+    players_dir = _players_dir(page_path, diff['country'], diff['mode'])
+
+    return write_page(
+        ACTIVITY_TEMPLATE,
+        page_path,
+        test,
+        date=date,
+        **{name: activity_rows(diff['top'].get(stat, []), stat, players_dir) for name, stat in ACTIVITY_TABLES.items()},
+        **_link_variables(page_path, links),
+    )
+
+
+def write_pp_records_page(
+        page_path: str,
+        date: str,
+        records: RawPlayerDataCollection,
+        links: PageLinks,
+        test: bool = False,
+) -> str:
+    return write_page(
+        PP_RECORDS_TEMPLATE,
+        page_path,
+        test,
+        date=date,
+        updated_at=_updated_at(records),
+        rows=pp_record_rows(records),
+        **_link_variables(page_path, links),
+    )
+
+
+def write_player_page(page_path: str, history: dict, links: PageLinks, test: bool = False) -> str:
+    return write_page(
+        PLAYER_TEMPLATE,
+        page_path,
+        test,
+        **_link_variables(page_path, links),
+        id=history['id'],
+        ign=html.escape(history['ign']),
+        updated_at=_updated_at(history),
+        rows=player_rows(history),
+    )
@@ -1,61 +1,97 @@
+from __future__ import annotations
+
 import argparse
+import json
 import logging
 import math
-import os
-import time
-from datetime import datetime, timedelta
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING
 
 from dotenv import load_dotenv
-from ossapi import GameMode, Ossapi, Score, User
-from ossapi.enums import Grade
 
 from scripts.discord_webhook import (
     Embed,
     EmbedField,
+    WebhookSender,
     embed_maker,
+    pack_messages,
     send_webhook,
 )
+from scripts.daily_diff import get_daily_diff
 from scripts.general_utils import simplify_number
 from scripts.json_player_data import (
-    MappedPlayerDataCollection,
+    MappedBeatmapData,
+    MappedScoreData,
     MappedScoreDataCollection,
-    get_comparison_and_mapped_data,
+    RawPlayerDataCollection,
     get_data_at_date,
-    get_sorted_dict_on_stat,
+    map_beatmap_data,
     map_player_data,
 )
 from scripts.logging_config import setup_logging, logger
+from scripts.rolling_window import get_window_leaders, get_window_type
+from scripts.seen_players import classify_player, get_seen_players
 
+if TYPE_CHECKING:
+    from ossapi import Ossapi
+    from ossapi.enums import Grade
 
-def get_recent_plays_of_user(api: Ossapi, user_id, score_type: str = 'best', limit=5) -> list[Score]:
-    logger.debug(f'recent plays: {user_id}, {score_type}, {limit}')
 
-    if limit > 100:
-        logger.warning(f'some plays might not be gathered for this player ({user_id})')
+def get_users_info(
+        user_ids: list[int],
+        latest_date: datetime,
+        mode: str,
+        country: str,
+        test: bool,
+        api: Ossapi = None,
+) -> dict[int, dict]:
+    """Gets the pp and country rank of the users from the latest rankings.
+    Users that are not on it are looked up in one batched api call.
 
-    retries = 3
-    while retries > 0:
-        try:
-            data = api.user_scores(
-                user_id,
-                score_type,
-                limit=limit,
-                mode=GameMode.CATCH,
-                include_fails=False
-            )
-            logger.debug(f'# of plays: {len(data)}')
-            return data
-        except:
-            logger.error(f'Error on getting data for {user_id}. Retrying in 3s. {retries} left')
-            retries -= 1
-            time.sleep(3)
+    Returns:
+        dict[int, dict]: user id to their `pp` and `country_rank`, `None` if unknown
+    """
+    rankings = get_data_at_date(date=latest_date.strftime('%Y/%m/%d'), country=country, mode=mode, test=test)
+    mapped_rankings = map_player_data(rankings) if rankings is not None else {}
+
+    users = {}
+    missing_ids = []
+
+    for user_id in user_ids:
+        player = mapped_rankings.get(str(user_id))
+
+        if player is None:
+            missing_ids.append(user_id)
+            continue
+
+        users[user_id] = {'pp': player['pp'], 'country_rank': player['country_rank']}
+
+    if missing_ids:
+        logger.debug('looking up %s, not on the rankings', missing_ids)
+
+        if api is None:
+            from scripts.api_cache import create_api
+
+            api = create_api()
+
+        for user in api.users(missing_ids):
+            statistics = getattr(user.statistics_rulesets, mode, None) if user.statistics_rulesets else None
 
-    logger.error(f'Cannot gather user scores for {user_id}. Returning nothing')
-    return []
+            users[user.id] = {
+                'pp': statistics.pp if statistics else None,
+                'country_rank': statistics.country_rank if statistics else None,
+            }
 
+    return users
 
-def get_user_info(api: Ossapi, user_id) -> User:
-    return api.user(user_id, mode=GameMode.CATCH)
+
+def get_beatmap_url(score: MappedScoreData | MappedBeatmapData) -> str:
+    return score.get('beatmap_url') or f'https://osu.ppy.sh/b/{score["beatmap_id"]}'
+
+
+def get_cover_url(score: MappedScoreData | MappedBeatmapData) -> str:
+    return score.get('beatmapset_cover') or f'https://assets.ppy.sh/beatmaps/{score["beatmapset_id"]}/covers/cover.jpg'
 
 
 def get_emote_for_score_grade(grade: Grade | str) -> str:
@@ -73,33 +109,35 @@ def get_emote_for_score_grade(grade: Grade | str) -> str:
     return ranks_dict.get(grade, '?')
 
 
-def create_embed_from_play(api: Ossapi, data: Score) -> Embed:
-    user = get_user_info(api, data.user_id)
+def create_embed_from_play(data: MappedScoreData | MappedBeatmapData, user: dict) -> Embed:
+    user_id = data['user_id']
+
+    osu_username = data['user_name']
+    osu_avatar = data.get('user_avatar') or f'https://a.ppy.sh/{user_id}'
+    osu_url = f'https://osu.ppy.sh/users/{user_id}'
+    user_pp = user.get('pp') or 0
+    ph_rank = user.get('country_rank') or '?'
 
-    osu_username = user.username
-    osu_avatar = user.avatar_url
-    osu_url = f'https://osu.ppy.sh/users/{user.id}'
-    user_pp = round(user.statistics.pp, 0)
-    ph_rank = user.statistics.country_rank
+    max_combo = data['max_combo']
+    rank = get_emote_for_score_grade(data['score_grade'])
+    mods = data['score_mods']
 
-    score = data.statistics
-    max_combo = data.max_combo
-    rank = get_emote_for_score_grade(data.rank)
-    mods = str(data.mods)
-    score_time = data.created_at.strftime('%Y-%m-%dT%H:%m:%S.%fZ')
+    score_time = None
+    if data.get('created_at') is not None:
+        score_time = datetime.fromtimestamp(data['created_at'], tz=timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
 
     embed_data = embed_maker(
-        title=data.beatmapset.title + f' [{data.beatmap.version}] [{data.beatmap.difficulty_rating:,.2f}★]',
-        description=f'**{rank}** • {miss_format(score.count_miss)} • {max_combo}x',
+        title=data['beatmapset_title'] + f' [{data["beatmap_version"]}] [{data["beatmap_difficulty"]:,.2f}★]',
+        description=f'**{rank}** • {miss_format(data["count_miss"])} • {max_combo}x',
         fields=[
             {
                 'name': 'PP',
-                'value': f'{data.pp:,.2f}pp',
+                'value': f'{data["score_pp"]:,.2f}pp',
                 'inline': True
             },
             {
                 'name': 'Accuracy',
-                'value': f'{data.accuracy * 100:,.2f}%',
+                'value': f'{data["accuracy"] * 100:,.2f}%',
                 'inline': True
             },
             {
@@ -108,9 +146,9 @@ def create_embed_from_play(api: Ossapi, data: Score) -> Embed:
                 'inline': True
             },
         ],
-        url=str(data.beatmap.url),
+        url=get_beatmap_url(data),
         image={
-            'url': data.beatmapset.covers.cover
+            'url': get_cover_url(data)
         },
         author={
             'name': f'{osu_username} • {user_pp:,.0f}pp • PH{ph_rank}',
@@ -124,93 +162,58 @@ def create_embed_from_play(api: Ossapi, data: Score) -> Embed:
     return embed_data
 
 
-# TODO: clean the parameters to avoid adding another one if more stats are shown
-def create_player_summary_fields(
-        pp_gainers,
-        rank_gainers,
-        active_players,
-        ranked_score_gainers,
-        latest_data,
-        comparison_data
-) -> list[EmbedField]:
-    def format_field(name, data, formatter, stat, limit=5) -> EmbedField:
+def create_player_summary_fields(top: dict[str, list[list]]) -> list[EmbedField]:
+    def format_field(name, stat, formatter, limit=5) -> EmbedField:
+        # top lists from the diff only have gains above 0, highest first
         return {
             'name': name,
             'value': '\n'.join(
-                formatter(item) for item in list(data.items())[:limit] if item[1][stat] > 0
+                formatter(*item) for item in top.get(stat, [])[:limit]
             )
         }
 
-    def _uid_link(item):
-        return item[0], f'https://osu.ppy.sh/users/{item[0]}/fruits'
-
-    def _get_stats(uid, stat):
-        nonlocal latest_data, comparison_data
-        old = comparison_data[uid][stat]
-        new = latest_data[uid][stat]
-        return old, new
+    def _uid_link(uid):
+        return f'https://osu.ppy.sh/users/{uid}/fruits'
 
     # TODO: maybe reduce code repetition here, on the formatters
-    def pp_formatter(item):
-        uid, link = _uid_link(item)
-        ign = item[1]['ign']
-        gained = item[1]['pp']
-        old, new = _get_stats(uid, 'pp')
-        return f'1. [**{ign}**]({link}) • {old:,}pp → **{new:,}**pp (+**{gained:,}**pp)'
-
-    def rank_formatter(item):
-        uid, link = _uid_link(item)
-        ign = item[1]['ign']
-        gained = item[1]['country_rank']
-        old, new = _get_stats(uid, 'country_rank')
-        return f'1. [**{ign}**]({link}) • PH{old:,} → PH**{new:,}** (+**{gained:,}** ranks)'
-
-    def pc_formatter(item):
-        uid, link = _uid_link(item)
-        ign = item[1]['ign']
-        gained = item[1]['play_count']
-        old, new = _get_stats(uid, 'play_count')
-        return f'1. [**{ign}**]({link}) • {old:,} → {new:,} (+**{gained:,}** plays)'
-
-    def rs_formatter(item):
-        uid, link = _uid_link(item)
-        ign = item[1]['ign']
-        gained = item[1]['ranked_score']
-        old, new = _get_stats(uid, 'ranked_score')
-        return f'1. [**{ign}**]({link}) • {simplify_number(old)} → {simplify_number(new)} (+**{simplify_number(gained)}**)'
+    def pp_formatter(uid, ign, gained, old, new):
+        return f'1. [**{ign}**]({_uid_link(uid)}) • {old:,}pp → **{new:,}**pp (+**{gained:,}**pp)'
+
+    def rank_formatter(uid, ign, gained, old, new):
+        return f'1. [**{ign}**]({_uid_link(uid)}) • PH{old:,} → PH**{new:,}** (+**{gained:,}** ranks)'
+
+    def pc_formatter(uid, ign, gained, old, new):
+        return f'1. [**{ign}**]({_uid_link(uid)}) • {old:,} → {new:,} (+**{gained:,}** plays)'
+
+    def rs_formatter(uid, ign, gained, old, new):
+        return f'1. [**{ign}**]({_uid_link(uid)}) • {simplify_number(old)} → {simplify_number(new)} (+**{simplify_number(gained)}**)'
 
     # this is getting ugly, man
-    pp_field = format_field('pp farmers', pp_gainers, pp_formatter, 'pp')
-    rank_field = format_field('PH rank climbers', rank_gainers, rank_formatter, 'country_rank')
-    pc_field = format_field('"play more" gamers', active_players, pc_formatter, 'play_count')
-    rs_field = format_field('ranked score farmers', ranked_score_gainers, rs_formatter, 'ranked_score')
+    pp_field = format_field('pp farmers', 'pp', pp_formatter)
+    rank_field = format_field('PH rank climbers', 'country_rank', rank_formatter)
+    pc_field = format_field('"play more" gamers', 'play_count', pc_formatter)
+    rs_field = format_field('ranked score farmers', 'ranked_score', rs_formatter)
 
     return [pp_field, rank_field, pc_field, rs_field]
 
 
-def description_maker(
-        active_players: dict,
-        pp_gainers: dict,
-        rank_gainers: dict,
-        ranked_score_gainers: dict,
-) -> str:
+def description_maker(aggregates: dict[str, dict[str, int]]) -> str:
     import re
 
-    def above_zero_count(data: dict, key: str) -> int:
-        return len([i for i in data.items() if i[1][key] > 0])
+    def above_zero_count(key: str) -> int:
+        return aggregates.get(key, {}).get('count', 0)
 
-    def total_stat(data, key) -> int:
-        return sum([data[i][key] for i in data if data[i][key] > 0])
+    def total_stat(key) -> int:
+        return aggregates.get(key, {}).get('total', 0)
 
-    # TODO: maybe clean this up too, but this is nothing major anyway
-    active_count = above_zero_count(active_players, 'play_count')
-    pp_gain_count = above_zero_count(pp_gainers, 'pp')
-    rank_gain_count = above_zero_count(rank_gainers, 'country_rank')
+    active_count = above_zero_count('play_count')
+    pp_gain_count = above_zero_count('pp')
+    rank_gain_count = above_zero_count('country_rank')
 
-    total_pc = total_stat(active_players, 'play_count')
-    total_pp = total_stat(pp_gainers, 'pp')
-    total_rank = total_stat(rank_gainers, 'country_rank')
-    total_ranked_score = simplify_number(total_stat(ranked_score_gainers, 'ranked_score'))
+    total_pc = total_stat('play_count')
+    total_pp = total_stat('pp')
+    total_rank = total_stat('country_rank')
+    total_ranked_score = simplify_number(total_stat('ranked_score'))
 
     # use !n for newlines
     description = """There are: **{:,}** players who played the game,
@@ -237,37 +240,26 @@ def description_maker(
     return description
 
 
-# noinspection PyTypedDict
-def get_new_entries(data: MappedPlayerDataCollection) -> MappedPlayerDataCollection:
-    return {
-        i: data[i]
-        for i in data
-        if data[i]['new_entry']
-    }
-
-
 def send_activity_ranking_webhook(
-        latest_mapped_data: dict,
-        comparison_mapped_data: dict,
-        data_difference: dict,
+        diff: RawPlayerDataCollection,
         latest_date: datetime = datetime.now(),
+        seen: RawPlayerDataCollection = None,
+        sender: WebhookSender = None,
 ) -> None:
-    # TODO: this is getting ridiculous, find a way to simplify this
-    active_players = get_sorted_dict_on_stat(data_difference, 'play_count', True)
-    pp_gainers = get_sorted_dict_on_stat(data_difference, 'pp', True)
-    rank_gainers = get_sorted_dict_on_stat(data_difference, 'country_rank', True)
-    ranked_score_gainers = get_sorted_dict_on_stat(data_difference, 'ranked_score', True)
-    new_entries = get_new_entries(data_difference)
-
-    # TODO: clean this up, please holy fuck
-    fields = create_player_summary_fields(
-        pp_gainers=pp_gainers,
-        rank_gainers=rank_gainers,
-        active_players=active_players,
-        ranked_score_gainers=ranked_score_gainers,
-        latest_data=latest_mapped_data,
-        comparison_data=comparison_mapped_data
-    )
+    fields = create_player_summary_fields(diff['top'])
+    new_entries = []
+    returning_entries = []
+
+    for user_id, ign, user_rank in diff['new_entries']:
+        # without the index, everyone missing yesterday counts as new
+        status, days = classify_player(seen, user_id) if seen is not None else ('new', None)
+
+        if status == 'new':
+            new_entries.append((user_id, ign, user_rank))
+        elif status == 'returning':
+            returning_entries.append((user_id, ign, user_rank, days))
+        else:
+            logger.debug('%s is not really new, %s', ign, status)
 
     footer = {
         'text': 'Updates delivered daily at around midnight. Inaccurate data? Blame Eoneru.',
@@ -282,12 +274,7 @@ def send_activity_ranking_webhook(
     main_embed = embed_maker(
         title='Top 5 activity rankings for {}'.format(latest_date.strftime('%B %d, %Y')),
         url=f'https://0x4kgi.github.io/ctbph-rank-daily/activity-ranking.html#start:{dy_frmt};end:{date}',
-        description=description_maker(
-            active_players,
-            pp_gainers,
-            rank_gainers,
-            ranked_score_gainers
-        ),
+        description=description_maker(diff['aggregates']),
         fields=fields,
         footer=footer,
         color=12517310
@@ -296,11 +283,9 @@ def send_activity_ranking_webhook(
 
     if len(new_entries) > 0:
         desc = []
-        for user_id in new_entries:
+        for user_id, ign, user_rank in new_entries:
             # /fruits should be temporary
-            user_info = latest_mapped_data[user_id]
-            user_rank = user_info['country_rank']
-            desc.append(f'- [**{new_entries[user_id]['ign']}**](https://osu.ppy.sh/users/{user_id}/fruits) (PH**{user_rank}**)')
+            desc.append(f'- [**{ign}**](https://osu.ppy.sh/users/{user_id}/fruits) (PH**{user_rank}**)')
 
         if len(new_entries) > 5:
             # limit new entries to just 5, to fit within webhook character limit
@@ -320,11 +305,100 @@ def send_activity_ranking_webhook(
             color=12517310,
         ))
 
+    if len(returning_entries) > 0:
+        desc = []
+        for user_id, ign, user_rank, days in returning_entries[:5]:
+            desc.append(f'- [**{ign}**](https://osu.ppy.sh/users/{user_id}/fruits) (PH**{user_rank}**) '
+                        f'after **{days}** days')
+
+        if len(returning_entries) > 5:
+            desc.append(f' - *and {len(returning_entries) - 5} more!*')
+
+        embeds.append(embed_maker(
+            title='Back in the top 1k',
+            description='Welcome back to **{}** peeps!\n\n{}'.format(len(returning_entries), '\n'.join(desc)),
+            color=12517310,
+        ))
+
     send_webhook(
         content='``` ```',
         embeds=embeds,
         username='Top 1k osu!catch PH tracker',
-        avatar_url='https://iili.io/JQmQKKl.png'
+        avatar_url='https://iili.io/JQmQKKl.png',
+        sender=sender,
+    )
+
+
+def create_window_summary_embed(window: RawPlayerDataCollection) -> Embed:
+    def format_field(name, stat, formatter) -> EmbedField:
+        leaders = get_window_leaders(window, stat)
+        return {
+            'name': name,
+            'value': '\n'.join(
+                formatter(uid, player['ign'], player[stat]) for uid, player in leaders.items()
+            )
+        }
+
+    def _uid_link(uid):
+        return f'https://osu.ppy.sh/users/{uid}/fruits'
+
+    def pc_formatter(uid, ign, gained):
+        return f'1. [**{ign}**]({_uid_link(uid)}) • +**{gained:,}** plays'
+
+    def pp_formatter(uid, ign, gained):
+        return f'1. [**{ign}**]({_uid_link(uid)}) • +**{gained:,}**pp'
+
+    def rank_formatter(uid, ign, gained):
+        return f'1. [**{ign}**]({_uid_link(uid)}) • +**{gained:,}** ranks'
+
+    days = window['days']
+    date = datetime.fromtimestamp(window['update_date'])
+    start_date = date - timedelta(days=days)
+
+    return embed_maker(
+        title='Top 5 activity rankings for the last {} days'.format(days),
+        url='https://0x4kgi.github.io/ctbph-rank-daily/activity-ranking.html#start:{};end:{}'.format(
+            start_date.strftime('%Y-%m-%d'),
+            date.strftime('%Y-%m-%d'),
+        ),
+        description='From {} to {}'.format(start_date.strftime('%B %d'), date.strftime('%B %d, %Y')),
+        fields=[
+            format_field('"play more" gamers', 'play_count', pc_formatter),
+            format_field('pp farmers', 'pp', pp_formatter),
+            format_field('PH rank climbers', 'country_rank', rank_formatter),
+        ],
+        footer={
+            'text': 'Updates delivered weekly.',
+        },
+        color=12517310,
+    )
+
+
+def send_window_ranking_webhook(
+        latest_date: datetime,
+        mode: str,
+        country: str,
+        test: bool,
+        days: int = 7,
+        sender: WebhookSender = None,
+) -> None:
+    window = get_data_at_date(
+        date=latest_date.strftime('%Y/%m/%d'),
+        country=country,
+        mode=mode,
+        file_type=get_window_type(days),
+        test=test,
+    )
+
+    if window is None:
+        logger.warning('Cannot get the %sd window at the moment.', days)
+        return
+
+    send_webhook(
+        embeds=[create_window_summary_embed(window)],
+        username='Top 1k osu!catch PH tracker',
+        avatar_url='https://iili.io/JQmQKKl.png',
+        sender=sender,
     )
 
 
@@ -335,31 +409,31 @@ def miss_format(miss) -> str:
         return '**FC 👍**'
 
 
-def create_pp_record_list_embed(scores: list[Score]) -> Embed:
-    def formatter(index: int, score: Score) -> str:
+def create_pp_record_list_embed(scores: list[MappedScoreData | MappedBeatmapData]) -> Embed:
+    def formatter(index: int, score: MappedScoreData | MappedBeatmapData) -> str:
 
         # 1. {pp}pp - Player
         player_info = '***{}.*** **{:,.2f}**pp • **{}**'.format(
             index + 1,
-            score.pp,
-            score._user.username,
+            score['score_pp'],
+            score['user_name'],
         )
 
         # map name and link also mod?
         map_info = '` ` [**{} [{}]** [{:,.2f}★]]({}) +{}'.format(
-            score.beatmapset.title,
-            score.beatmap.version,
-            score.beatmap.difficulty_rating,
-            score.beatmap.url,
-            score.mods,
+            score['beatmapset_title'],
+            score['beatmap_version'],
+            score['beatmap_difficulty'],
+            get_beatmap_url(score),
+            score['score_mods'],
         )
 
         # score statistics
         score_statistics = '` ` {} / {:,.2f}% / {} / {:,}x\n'.format(
-            get_emote_for_score_grade(score.rank),
-            score.accuracy * 100,
-            miss_format(score.statistics.count_miss),
-            score.max_combo,
+            get_emote_for_score_grade(score['score_grade']),
+            score['accuracy'] * 100,
+            miss_format(score['count_miss']),
+            score['max_combo'],
         )
 
         return '\n'.join([player_info, map_info, score_statistics])
@@ -383,14 +457,15 @@ def create_pp_record_list_embed(scores: list[Score]) -> Embed:
 
 
 def send_play_pp_ranking_webhook(
-        api: Ossapi,
         latest_timestamp: datetime,
         mode: str,
         country: str,
         test: bool,
-        top: int = 5
+        top: int = 5,
+        sender: WebhookSender = None,
+        api: Ossapi = None,
 ) -> None:
-    # Get the pp scores from file
+    # Get the pp scores from file, they have everything the embeds need
     raw_scores = get_data_at_date(
         date=latest_timestamp.strftime('%Y/%m/%d'),
         country=country,
@@ -403,87 +478,166 @@ def send_play_pp_ranking_webhook(
         logger.warning('Cannot get pp score list at the moment.')
         return
 
-    # Map the scores to a dict
+    # Map the scores to a dict, already sorted by pp
     mapped_scores: MappedScoreDataCollection = map_player_data(raw_scores)
+    beatmaps = map_beatmap_data(raw_scores)
 
-    # get the top 5 only and convert each to a Score object
-    # then append to a Score list
-    scores: list[Score] = []
-    for score_id, score_data in list(mapped_scores.items())[:top]:
-        # TODO: this could be wrapped in a function to have checking if the score
-        #       is correct
-        if score_data['score_type'] == 'old':
-            score = api.score_mode(mode, score_id)
-        else:
-            score = api.score(score_id)
-
-        scores.append(score)
+    # the embeds want the beatmap metadata with the score
+    scores: list[MappedScoreData | MappedBeatmapData] = [
+        {**score, **beatmaps.get(str(score['beatmap_id']), {})}
+        for score in list(mapped_scores.values())[:top]
+    ]
 
     # end early if no scores are to be found
     if len(scores) == 0:
         logger.warning('No scores to be listed. :(')
         return
 
-    # make the list of the top 10 as a separate webhook
     pp_list_embed = create_pp_record_list_embed(scores)
-    send_webhook(
-        username=f'top {top} pp records of the day',
-        embeds=[pp_list_embed],
-        avatar_url='https://iili.io/JmEwJhF.png',
-    )
 
-    # send the highest pp play
-    top_pp_embed = create_embed_from_play(api, scores[0])
+    # the highest pp play, in the same message as the list
+    users = get_users_info([scores[0]['user_id']], latest_timestamp, mode, country, test, api)
+    top_pp_embed = create_embed_from_play(scores[0], users.get(scores[0]['user_id'], {}))
+
     send_webhook(
-        username='pp record of the day',
-        embeds=[top_pp_embed],
+        username='pp records of the day',
+        embeds=[pp_list_embed, top_pp_embed],
         avatar_url='https://iili.io/JmEwJhF.png',
+        sender=sender,
     )
 
 
-def main(country: str = 'PH', mode: str = 'fruits', test: bool = False):
-    client_id = os.getenv('OSU_CLIENT_ID')
-    client_secret = os.getenv('OSU_CLIENT_SECRET')
-    # noinspection PyTypeChecker
-    api = Ossapi(client_id, client_secret)
-
-    latest_date = datetime.now()
-    processed_data = get_comparison_and_mapped_data(
-        base_date=latest_date,
-        compare_date_offset=1,
+def main(
+        country: str = 'PH',
+        mode: str = 'fruits',
+        test: bool = False,
+        weekly: bool = False,
+        api: Ossapi = None,
+        date: datetime = None,
+):
+    latest_date = date or datetime.now()
+    diff = get_daily_diff(
+        date=latest_date,
         country=country,
         mode=mode,
         test=test,
     )
-    latest_mapped_data = processed_data.latest_mapped_data
-    comparison_mapped_data = processed_data.comparison_mapped_data
-    data_difference = processed_data.data_difference
 
-    if latest_mapped_data is None:
-        logger.warning('Cannot get latest data as of now.')
+    if diff is None:
+        logger.warning('Cannot get latest or comparison data as of now.')
         return
 
-    if comparison_mapped_data is None:
-        logger.warning('Cannot get comparison data as of now.')
-        return
+    seen = get_seen_players(country, mode, test)
+
+    if seen is not None and seen['dates'][-1] != latest_date.strftime('%Y/%m/%d'):
+        logger.warning('The seen players index is not up to date, counting everyone missing yesterday as new')
+        seen = None
+
+    # everything is rendered first, then sent together to every webhook url
+    sender = WebhookSender()
 
     logger.info('Making the activity webhook')
     send_activity_ranking_webhook(
-        latest_mapped_data=latest_mapped_data,
-        comparison_mapped_data=comparison_mapped_data,
-        data_difference=data_difference,
+        diff=diff,
         latest_date=latest_date,
+        seen=seen,
+        sender=sender,
     )
 
     logger.info('Making the pp related webhook')
     send_play_pp_ranking_webhook(
-        api=api,
         latest_timestamp=latest_date,
         mode=mode,
         country=country,
         test=test,
+        sender=sender,
+        api=api,
     )
 
+    if weekly:
+        logger.info('Making the weekly activity webhook')
+        send_window_ranking_webhook(
+            latest_date=latest_date,
+            mode=mode,
+            country=country,
+            test=test,
+            sender=sender,
+        )
+
+    sender.flush()
+
+
+def check_webhook_sender() -> None:
+    """Sends messages to a stub Discord on localhost, checking the packing,
+    the 429 retry and that a bad request is not retried.
+    """
+    # only needed here, it is not worth importing on every run
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class StubWebhookHandler(BaseHTTPRequestHandler):
+        # what the stub answers, in order, then 204s. Every message it got is kept
+        statuses: list[int] = []
+        received: list[dict] = []
+
+        def do_POST(self):
+            message = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+            self.received.append(message)
+            status = self.statuses.pop(0) if self.statuses else 204
+
+            self.send_response(status)
+            self.send_header('X-RateLimit-Bucket', 'stub')
+            self.send_header('X-RateLimit-Remaining', '5')
+            self.send_header('X-RateLimit-Reset-After', '0.1')
+
+            if status == 429:
+                body = json.dumps({'retry_after': 0.05}).encode()
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            else:
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubWebhookHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_port}/webhook'
+
+    try:
+        sender = WebhookSender(urls=[url])
+
+        for i in range(12):
+            sender.queue(embeds=[embed_maker(title=str(i))], username='test')
+
+        sender.queue(content='hi', embeds=[embed_maker(title='12')], username='test')
+        sender.queue(embeds=[embed_maker(description='a' * 3500), embed_maker(description='b' * 3500)], username='test')
+
+        packed = pack_messages(sender.messages)
+        assert [len(message['embeds']) for message in packed] == [10, 2, 2, 1], packed
+        assert [message.get('content') for message in packed] == [None, None, 'hi', None], packed
+
+        # the first message is rate limited once, then sent again
+        StubWebhookHandler.statuses = [429]
+        StubWebhookHandler.received = []
+
+        assert sender.flush()
+        assert StubWebhookHandler.received == [packed[0], *packed], StubWebhookHandler.received
+
+        StubWebhookHandler.statuses = [400]
+        StubWebhookHandler.received = []
+
+        sender.queue(content='bad')
+        assert not sender.flush()
+        assert len(StubWebhookHandler.received) == 1, StubWebhookHandler.received
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    logger.info('The webhook sender works against the stub')
+
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser(
@@ -494,6 +648,7 @@ if __name__ == '__main__':
     parser.add_argument('--country', type=str, default='PH',
                         help='What country to make a webhook message from. Uses 2 letter country codes.')
     parser.add_argument('--test', action='store_true', help='Just do tests')
+    parser.add_argument('--weekly', action='store_true', help='Also send the last 7 days activity rankings.')
 
     args = parser.parse_args()
 
@@ -504,8 +659,12 @@ if __name__ == '__main__':
 
     load_dotenv()
 
+    if args.test:
+        check_webhook_sender()
+
     main(
         country=args.country,
         mode=args.mode,
         test=args.test,
+        weekly=args.weekly,
     )